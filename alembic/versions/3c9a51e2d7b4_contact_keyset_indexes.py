@@ -0,0 +1,29 @@
+"""contact keyset indexes
+
+Revision ID: 3c9a51e2d7b4
+Revises: 916b31ab274e
+Create Date: 2026-10-18 10:12:04.518227
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c9a51e2d7b4'
+down_revision: Union[str, None] = '916b31ab274e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_contacts_first_name_id', 'contacts', ['first_name', 'id'], unique=False)
+    op.create_index('ix_contacts_last_name_id', 'contacts', ['last_name', 'id'], unique=False)
+    op.create_index('ix_contacts_birth_date_id', 'contacts', ['birth_date', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_birth_date_id', table_name='contacts')
+    op.drop_index('ix_contacts_last_name_id', table_name='contacts')
+    op.drop_index('ix_contacts_first_name_id', table_name='contacts')
@@ -0,0 +1,33 @@
+"""contact search document
+
+Revision ID: 8f2d4b6a1c3e
+Revises: 3c9a51e2d7b4
+Create Date: 2026-10-18 11:03:47.206118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8f2d4b6a1c3e'
+down_revision: Union[str, None] = '3c9a51e2d7b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SEARCH_DOCUMENT = "lower(coalesce(first_name, '') || ' ' || coalesce(last_name, '') || ' ' || coalesce(email, ''))"
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.add_column('contacts', sa.Column('search_document', sa.String(),
+                                        sa.Computed(SEARCH_DOCUMENT, persisted=True), nullable=True))
+    op.create_index('ix_contacts_search_document_trgm', 'contacts', ['search_document'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'search_document': 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_search_document_trgm', table_name='contacts')
+    op.drop_column('contacts', 'search_document')
@@ -0,0 +1,85 @@
+"""optional hash partitioning of contacts by owner
+
+Revision ID: a6d0e4b8c159
+Revises: f3b9c6d2a871
+Create Date: 2026-10-18 16:31:12.640935
+
+Does nothing unless the number of partitions is given, for example::
+
+    alembic -x contact_partitions=16 upgrade head
+
+The table is then rebuilt as ``PARTITION BY HASH (user_id)`` (PostgreSQL only), so
+every per-owner query reads one partition. The primary key becomes ``(user_id, id)``,
+which requires every contact to have an owner: contacts without one can be assigned with
+``-x contact_owner=<user_id>`` in the same run.
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a6d0e4b8c159'
+down_revision: Union[str, None] = 'f3b9c6d2a871'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+COLUMNS = "id, user_id, first_name, last_name, email, phone_number, birth_date, extra_data, version"
+
+INDEXES = [
+    "CREATE UNIQUE INDEX ix_contacts_user_id_email ON contacts (user_id, email)",
+    "CREATE INDEX ix_contacts_user_id_id ON contacts (user_id, id)",
+    "CREATE INDEX ix_contacts_user_id_first_name_id ON contacts (user_id, first_name, id)",
+    "CREATE INDEX ix_contacts_user_id_last_name_id ON contacts (user_id, last_name, id)",
+    "CREATE INDEX ix_contacts_user_id_birth_date_id ON contacts (user_id, birth_date, id)",
+    "CREATE INDEX ix_contacts_user_id_birthday_id ON contacts (user_id, birthday, id)",
+    "CREATE INDEX ix_contacts_user_id_search_document_trgm ON contacts "
+    "USING gin (user_id, search_document gin_trgm_ops)",
+]
+
+
+def _partitioned() -> bool:
+    return bool(op.get_bind().exec_driver_sql(
+        "SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'contacts'::regclass"
+    ).scalar())
+
+
+def _rebuild(create_table: str, primary_key: str, partitions: int = 0) -> None:
+    op.execute("ALTER TABLE contacts RENAME TO contacts_old")
+    op.execute(create_table)
+    for remainder in range(partitions):
+        op.execute(f"CREATE TABLE contacts_p{remainder} PARTITION OF contacts "
+                   f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})")
+    op.execute(f"INSERT INTO contacts ({COLUMNS}) SELECT {COLUMNS} FROM contacts_old")
+    op.execute("ALTER SEQUENCE contacts_id_seq OWNED BY contacts.id")
+    op.execute("DROP TABLE contacts_old")
+    op.execute(f"ALTER TABLE contacts ADD CONSTRAINT contacts_pkey PRIMARY KEY ({primary_key})")
+    op.execute("ALTER TABLE contacts ADD CONSTRAINT contacts_user_id_fkey FOREIGN KEY (user_id) "
+               "REFERENCES users (id) ON DELETE CASCADE")
+    for statement in INDEXES:
+        op.execute(statement)
+
+
+def upgrade() -> None:
+    partitions = int(context.get_x_argument(as_dictionary=True).get('contact_partitions', 0))
+    if not partitions or op.get_bind().dialect.name != 'postgresql' or _partitioned():
+        return
+    owner = context.get_x_argument(as_dictionary=True).get('contact_owner')
+    if owner:
+        op.execute(sa.text("UPDATE contacts SET user_id = :owner WHERE user_id IS NULL")
+                   .bindparams(owner=int(owner)))
+    if op.get_bind().exec_driver_sql("SELECT 1 FROM contacts WHERE user_id IS NULL LIMIT 1").scalar():
+        raise RuntimeError("Assign an owner to every contact before partitioning the contacts table, "
+                           "for example with -x contact_owner=<user_id>")
+
+    _rebuild("CREATE TABLE contacts (LIKE contacts_old INCLUDING DEFAULTS INCLUDING GENERATED) "
+             "PARTITION BY HASH (user_id)", "user_id, id", partitions)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql' or not _partitioned():
+        return
+    _rebuild("CREATE TABLE contacts (LIKE contacts_old INCLUDING DEFAULTS INCLUDING GENERATED)", "id")
@@ -0,0 +1,31 @@
+"""contact birthday key
+
+Revision ID: b71e0c93f5a2
+Revises: 8f2d4b6a1c3e
+Create Date: 2026-10-18 11:48:22.930451
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b71e0c93f5a2'
+down_revision: Union[str, None] = '8f2d4b6a1c3e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BIRTHDAY_KEY = "CAST(EXTRACT(MONTH FROM birth_date) * 100 + EXTRACT(DAY FROM birth_date) AS SMALLINT)"
+
+
+def upgrade() -> None:
+    op.add_column('contacts', sa.Column('birthday', sa.SmallInteger(),
+                                        sa.Computed(BIRTHDAY_KEY, persisted=True), nullable=True))
+    op.create_index('ix_contacts_birthday_id', 'contacts', ['birthday', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_birthday_id', table_name='contacts')
+    op.drop_column('contacts', 'birthday')
@@ -0,0 +1,26 @@
+"""contact row version
+
+Revision ID: e5a7c2d94b18
+Revises: d4e8a1f06b37
+Create Date: 2026-10-18 14:22:09.581163
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a7c2d94b18'
+down_revision: Union[str, None] = 'd4e8a1f06b37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('contacts', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('contacts', 'version')
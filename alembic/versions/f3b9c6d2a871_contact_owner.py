@@ -0,0 +1,83 @@
+"""contact owner and owner-leading indexes
+
+Revision ID: f3b9c6d2a871
+Revises: e5a7c2d94b18
+Create Date: 2026-10-18 16:05:47.203518
+
+Contacts created before this revision have no owner and are not visible to anyone. Give
+them to a user while upgrading::
+
+    alembic -x contact_owner=<user_id> upgrade head
+
+or, on a database already past this revision::
+
+    UPDATE contacts SET user_id = <user_id> WHERE user_id IS NULL;
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3b9c6d2a871'
+down_revision: Union[str, None] = 'e5a7c2d94b18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def assign_owner() -> None:
+    owner = context.get_x_argument(as_dictionary=True).get('contact_owner')
+    if owner:
+        op.execute(sa.text("UPDATE contacts SET user_id = :owner WHERE user_id IS NULL")
+                   .bindparams(owner=int(owner)))
+
+
+def upgrade() -> None:
+    # Existing contacts keep a NULL owner unless ``-x contact_owner=<user_id>`` is given.
+    op.add_column('contacts', sa.Column('user_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('contacts_user_id_fkey', 'contacts', 'users', ['user_id'], ['id'], ondelete='CASCADE')
+    assign_owner()
+
+    op.drop_index('ix_contacts_email', table_name='contacts')
+    op.drop_index('ix_contacts_first_name', table_name='contacts')
+    op.drop_index('ix_contacts_last_name', table_name='contacts')
+    op.drop_index('ix_contacts_first_name_id', table_name='contacts')
+    op.drop_index('ix_contacts_last_name_id', table_name='contacts')
+    op.drop_index('ix_contacts_birth_date_id', table_name='contacts')
+    op.drop_index('ix_contacts_birthday_id', table_name='contacts')
+    op.drop_index('ix_contacts_search_document_trgm', table_name='contacts')
+
+    op.create_index('ix_contacts_user_id_email', 'contacts', ['user_id', 'email'], unique=True)
+    op.create_index('ix_contacts_user_id_id', 'contacts', ['user_id', 'id'], unique=False)
+    op.create_index('ix_contacts_user_id_first_name_id', 'contacts', ['user_id', 'first_name', 'id'], unique=False)
+    op.create_index('ix_contacts_user_id_last_name_id', 'contacts', ['user_id', 'last_name', 'id'], unique=False)
+    op.create_index('ix_contacts_user_id_birth_date_id', 'contacts', ['user_id', 'birth_date', 'id'], unique=False)
+    op.create_index('ix_contacts_user_id_birthday_id', 'contacts', ['user_id', 'birthday', 'id'], unique=False)
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gin")
+    op.create_index('ix_contacts_user_id_search_document_trgm', 'contacts', ['user_id', 'search_document'],
+                    unique=False, postgresql_using='gin', postgresql_ops={'search_document': 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_user_id_search_document_trgm', table_name='contacts')
+    op.drop_index('ix_contacts_user_id_birthday_id', table_name='contacts')
+    op.drop_index('ix_contacts_user_id_birth_date_id', table_name='contacts')
+    op.drop_index('ix_contacts_user_id_last_name_id', table_name='contacts')
+    op.drop_index('ix_contacts_user_id_first_name_id', table_name='contacts')
+    op.drop_index('ix_contacts_user_id_id', table_name='contacts')
+    op.drop_index('ix_contacts_user_id_email', table_name='contacts')
+
+    op.create_index('ix_contacts_search_document_trgm', 'contacts', ['search_document'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'search_document': 'gin_trgm_ops'})
+    op.create_index('ix_contacts_birthday_id', 'contacts', ['birthday', 'id'], unique=False)
+    op.create_index('ix_contacts_birth_date_id', 'contacts', ['birth_date', 'id'], unique=False)
+    op.create_index('ix_contacts_last_name_id', 'contacts', ['last_name', 'id'], unique=False)
+    op.create_index('ix_contacts_first_name_id', 'contacts', ['first_name', 'id'], unique=False)
+    op.create_index('ix_contacts_last_name', 'contacts', ['last_name'], unique=False)
+    op.create_index('ix_contacts_first_name', 'contacts', ['first_name'], unique=False)
+    op.create_index('ix_contacts_email', 'contacts', ['email'], unique=True)
+
+    op.drop_constraint('contacts_user_id_fkey', 'contacts', type_='foreignkey')
+    op.drop_column('contacts', 'user_id')
@@ -1,29 +1,33 @@
-from passlib.context import CryptContext
-
+from cache import LocalCacheBackend
 from config import settings
-from models import User
-from database import SessionLocal, Session
+from hashing import pwd_context, hashing_service
+from models import CurrentUser, User
+from database import SessionLocal, AsyncSession, get_db
 from datetime import datetime, timedelta
-from fastapi import Depends, HTTPException
-from passlib.context import CryptContext
+from fastapi import Depends, HTTPException, status
+from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import select
 import jwt
-from jose.exceptions import JWTError
-
+from jwt_keys import key_ring
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-SECRET_KEY = settings.secret_key
-ALGORITHM = settings.algorithm
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+
+user_cache = LocalCacheBackend()
+
 class HashPassword:
     def __init__(self, rounds: int = 10):
         """
                 Helper class for hashing and verifying passwords using bcrypt.
 
+                Runs synchronously on the shared context; request handlers should use
+                :data:`hashing.hashing_service` so bcrypt stays off the event loop.
+
                 :param rounds: The number of rounds for bcrypt.
                 """
-        self.pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+        self.pwd_context = pwd_context
         self.rounds = rounds
 
     def hash_password(self, password: str):
@@ -46,7 +50,7 @@ class HashPassword:
         return self.pwd_context.verify(plain_password, hashed_password)
 
 
-def create_user(username: str, email: str, password: str):
+async def create_user(username: str, email: str, password: str):
     """
         Create a new user.
 
@@ -55,16 +59,15 @@ def create_user(username: str, email: str, password: str):
         :param password: The password of the user.
         :return: The created user.
         """
-    hashed_password = pwd_context.hash(password)
+    hashed_password = await hashing_service.hash_password(password)
     user = User(username=username, email=email, hashed_password=hashed_password)
-    db = SessionLocal()
-    db.add(user)
-    db.commit()
-    db.refresh(user)
-    db.close()
+    async with SessionLocal() as db:
+        db.add(user)
+        await db.commit()
+        await db.refresh(user)
     return user
 
-def authenticate_user(email: str, password: str):
+async def authenticate_user(email: str, password: str):
     """
         Authenticate a user.
 
@@ -72,13 +75,12 @@ def authenticate_user(email: str, password: str):
         :param password: The password of the user.
         :return: The authenticated user.
         """
-    db = SessionLocal()
-    user = db.query(User).filter_by(email=email).first()
-    db.close()
-    if user and pwd_context.verify(password, user.hashed_password):
+    async with SessionLocal() as db:
+        user = await get_user_by_email(email, db)
+    if user and await hashing_service.verify_password(password, user.hashed_password):
         return user
 
-async def get_user_by_email(email: str, db: Session) -> User:
+async def get_user_by_email(email: str, db: AsyncSession) -> User:
     """
         Get a user by email.
 
@@ -86,8 +88,8 @@ async def get_user_by_email(email: str, db: Session) -> User:
         :param db: Database session.
         :return: The user with the specified email or None if not found.
         """
-    user = db.query(User).filter_by(email=email).first()
-    return user
+    result = await db.execute(select(User).filter_by(email=email))
+    return result.scalars().first()
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     """
@@ -102,11 +104,11 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    to_encode.update({"exp": expire, "type": "access"})
+    encoded_jwt = key_ring.encode(to_encode)
     return encoded_jwt
 
-async def confirmed_email(email: str, db: Session) -> None:
+async def confirmed_email(email: str, db: AsyncSession) -> None:
     """
         Confirm the user's email.
 
@@ -115,7 +117,8 @@ async def confirmed_email(email: str, db: Session) -> None:
         """
     user = await get_user_by_email(email, db)
     user.confirmed = True
-    db.commit()
+    await db.commit()
+    await invalidate_user(email)
 
 def create_email_token(data: dict):
     """
@@ -126,6 +129,50 @@ def create_email_token(data: dict):
         """
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(days=7)
-    to_encode.update({"iat": datetime.utcnow(), "exp": expire})
-    token = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return token.decode('utf-8')
+    to_encode.update({"iat": datetime.utcnow(), "exp": expire, "type": "email"})
+    token = key_ring.encode(to_encode)
+    return token
+
+async def invalidate_user(email: str) -> None:
+    """
+        Drop a user from the current-user cache after their record changes.
+
+        :param email: The email address of the user.
+        """
+    await user_cache.delete(email)
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> CurrentUser:
+    """
+        Resolve the authenticated user from a bearer access token.
+
+        Only tokens with ``"type": "access"`` are accepted, not refresh or email confirmation tokens.
+
+        The token is decoded once and the user is served from an in-process TTL/LRU cache
+        keyed by the token subject, so steady-state requests make no database round trip.
+
+        :param token: The bearer access token.
+        :param db: Database session, only used on a cache miss.
+        :return: The authenticated user.
+        :raises HTTPException: 401 if the token is invalid or the user does not exist.
+        """
+    credentials_error = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    try:
+        payload = key_ring.decode(token)
+    except jwt.PyJWTError:
+        raise credentials_error
+    email = payload.get("sub")
+    if email is None or payload.get("type") != "access":
+        raise credentials_error
+
+    current_user = await user_cache.get(email)
+    if current_user is None:
+        user = await get_user_by_email(email, db)
+        if user is None:
+            raise credentials_error
+        current_user = CurrentUser.model_validate(user)
+        await user_cache.set(email, current_user, settings.user_cache_ttl)
+    return current_user
@@ -0,0 +1,351 @@
+"""
+    Load and latency benchmark for the API's hot endpoints.
+
+    Boots the application in-process against a throwaway database (a fresh SQLite file by
+    default, or any PostgreSQL URL given with ``--database``; its tables are dropped and
+    recreated) and fakeredis, seeds the contacts table, then drives each scenario at a
+    fixed concurrency and reports p50/p95/p99 latency and throughput. Requests go through
+    the whole ASGI stack (routing, dependencies, authentication, rate limiting, caching and
+    serialization), but not through a network socket.
+
+    Scenarios:
+
+    - ``list``: ``GET /contacts/`` pages at varying offsets.
+    - ``get``: ``GET /contacts/{id}`` for varying contacts.
+    - ``search``: ``GET /contacts/search/`` by last name.
+    - ``birthdays``: ``GET /contacts/birthdays/``.
+    - ``token``: ``POST /token/`` with the benchmark user's password.
+    - ``register``: ``POST /register/`` with a new user each time.
+    - ``refresh``: ``POST /refresh-token/`` with a new refresh token each time.
+
+    The contacts are spread evenly over ``--owners`` users; every scenario acts as the first
+    one. Results are written as JSON to ``--output``. With ``--check`` they are compared
+    with the limits in ``--thresholds`` and the exit status is 1 if any scenario had
+    errors or exceeded a limit. The default thresholds are generous limits for the default
+    profile (10k rows on SQLite).
+
+    Run from the repository root::
+
+        python -m benchmarks.load --rows 10000 --check
+        python -m benchmarks.load --rows 1000000 --scenarios list get search birthdays
+    """
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import fakeredis.aioredis
+import httpx
+
+
+PASSWORD = "benchmark-password"
+
+LAST_NAMES = ["Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez",
+              "Martinez", "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson", "Thomas", "Taylor",
+              "Moore", "Jackson", "Martin", "Lee", "Perez", "Thompson", "White", "Harris", "Sanchez",
+              "Clark", "Ramirez", "Lewis", "Robinson", "Walker", "Young", "Allen", "King", "Wright",
+              "Scott", "Torres", "Nguyen", "Hill", "Flores", "Green", "Adams", "Nelson", "Baker", "Hall",
+              "Rivera", "Campbell", "Mitchell", "Carter", "Roberts", "Kovalenko", "Shevchenko"]
+
+FIRST_NAMES = ["James", "Mary", "Robert", "Patricia", "John", "Jennifer", "Michael", "Linda", "David",
+               "Elizabeth", "William", "Barbara", "Richard", "Susan", "Joseph", "Jessica", "Olena",
+               "Andriy", "Iryna", "Taras"]
+
+DEFAULT_THRESHOLDS = Path(__file__).with_name("thresholds.json")
+
+
+def boot(database_url: str):
+    """
+        Import the application configured for the benchmark.
+
+        The application reads its settings when first imported, so the environment is set
+        here, before the import. Variables already set in the environment are kept.
+
+        :param database_url: The database to run against.
+        :return: The application module.
+        """
+    os.environ["SQLALCHEMY_DATABASE_URL"] = database_url
+    for name, value in {
+        "MAIL_USERNAME": "benchmark", "MAIL_PASSWORD": "benchmark", "MAIL_FROM": "benchmark@example.com",
+        "MAIL_PORT": "25", "MAIL_SERVER": "localhost", "POSTGRES_DB": "benchmark",
+        "POSTGRES_USER": "benchmark", "POSTGRES_PASSWORD": "benchmark", "POSTGRES_PORT": "5432",
+        "SECRET_KEY": "benchmark", "ALGORITHM": "HS256", "REDIS_HOST": "localhost", "REDIS_PORT": "6379",
+    }.items():
+        os.environ.setdefault(name, value)
+    import main as api
+    return api
+
+
+async def setup(api, rows: int, owners: int, chunk_size: int = 5000) -> dict:
+    """
+        Create the schema, point the Redis-backed services at fakeredis and seed the data.
+
+        :param api: The application module.
+        :param rows: The number of contacts to create.
+        :param owners: The number of users the contacts are spread over.
+        :param chunk_size: The number of rows per INSERT statement.
+        :return: The benchmark user's email, its contact IDs and the seeding time.
+        """
+    from sqlalchemy import insert, select
+
+    from cache import RedisCacheBackend, RedisStoreBackend, contact_cache
+    from database import Base, SessionLocal, engine
+    from hashing import hashing_service
+    from models import Contact, User
+    from rate_limit import rate_limits
+    from refresh_tokens import refresh_tokens
+
+    redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    rate_limits.client = redis
+    refresh_tokens.backend = RedisStoreBackend(redis)
+    if api.settings.cache_backend == "redis":
+        contact_cache.backend = RedisCacheBackend(redis)
+
+    started = time.perf_counter()
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    hashed_password = await hashing_service.hash_password(PASSWORD)
+    async with engine.begin() as conn:
+        user_ids = (await conn.scalars(insert(User).returning(User.id), [
+            {"username": f"owner{i}", "email": f"owner{i}@example.com", "hashed_password": hashed_password,
+             "confirmed": True}
+            for i in range(owners)
+        ])).all()
+        for start in range(0, rows, chunk_size):
+            await conn.execute(insert(Contact), [
+                {
+                    "user_id": user_ids[i % owners],
+                    "first_name": FIRST_NAMES[i % len(FIRST_NAMES)],
+                    "last_name": LAST_NAMES[i * 7 % len(LAST_NAMES)],
+                    "email": f"contact{i}@example.com",
+                    "phone_number": f"+38050{i:07d}",
+                    "birth_date": date(1960 + i % 45, 1, 1) + timedelta(days=i * 37 % 365),
+                }
+                for i in range(start, min(start + chunk_size, rows))
+            ])
+    async with SessionLocal() as db:
+        contact_ids = (await db.scalars(select(Contact.id).where(Contact.user_id == user_ids[0]))).all()
+    return {"email": "owner0@example.com", "contact_ids": contact_ids,
+            "seed_seconds": time.perf_counter() - started}
+
+
+def make_scenarios(state: dict, api) -> dict:
+    """
+        Build the request functions of every scenario.
+
+        :param state: The result of :func:`setup`.
+        :param api: The application module.
+        :return: A mapping of scenario name to ``(request, expected_status, hashes_password)``,
+            where ``request(client, i)`` sends the ``i``-th request.
+        """
+    headers = {"Authorization": f"Bearer {api.create_access_token({'sub': state['email']})}"}
+    contact_ids = state["contact_ids"]
+    page_count = max(1, len(contact_ids) // 20)
+    registrations = itertools.count()
+
+    async def list_contacts(client, i):
+        return await client.get("/contacts/", params={"skip": i * 7 % page_count * 20, "limit": 20},
+                                headers=headers)
+
+    async def get_contact(client, i):
+        return await client.get(f"/contacts/{contact_ids[i * 7919 % len(contact_ids)]}", headers=headers)
+
+    async def search_contacts(client, i):
+        return await client.get("/contacts/search/", params={"query": LAST_NAMES[i % len(LAST_NAMES)]},
+                                headers=headers)
+
+    async def upcoming_birthdays(client, i):
+        return await client.get("/contacts/birthdays/", params={"days": 7 + i % 24}, headers=headers)
+
+    async def token(client, i):
+        return await client.post("/token/", data={"username": state["email"], "password": PASSWORD})
+
+    async def register(client, i):
+        n = next(registrations)
+        return await client.post("/register/", json={"username": f"bench{n}", "email": f"bench{n}@example.com",
+                                                     "password": PASSWORD})
+
+    async def refresh(client, i):
+        return await client.post("/refresh-token/", params={"refresh_token": state["refresh_tokens"].pop()})
+
+    return {
+        "list": (list_contacts, 200, False),
+        "get": (get_contact, 200, False),
+        "search": (search_contacts, 200, False),
+        "birthdays": (upcoming_birthdays, 200, False),
+        "token": (token, 200, True),
+        "register": (register, 201, True),
+        "refresh": (refresh, 200, False),
+    }
+
+
+def percentile(sorted_values, fraction: float) -> float:
+    """
+        Get a percentile by linear interpolation between the closest ranks.
+
+        :param sorted_values: The samples, sorted.
+        :param fraction: The percentile as a fraction, for example 0.95.
+        :return: The percentile.
+        """
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+async def run_scenario(client: httpx.AsyncClient, request, expected_status: int, requests: int,
+                       concurrency: int, warmup: int) -> dict:
+    """
+        Send ``requests`` requests from ``concurrency`` concurrent clients.
+
+        :param client: The HTTP client.
+        :param request: The scenario's request function.
+        :param expected_status: Any other status counts as an error.
+        :param requests: The number of measured requests.
+        :param concurrency: The number of requests in flight at once.
+        :param warmup: The number of requests sent first and not measured.
+        :return: The latency percentiles in milliseconds, throughput and error count.
+        """
+    for i in range(warmup):
+        await request(client, requests + i)
+
+    latencies = []
+    errors = 0
+    counter = itertools.count()
+
+    async def worker():
+        nonlocal errors
+        for i in iter(counter.__next__, None):
+            if i >= requests:
+                return
+            started = time.perf_counter()
+            response = await request(client, i)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != expected_status:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": round(requests / elapsed, 2),
+        "mean_ms": round(statistics.fmean(latencies) * 1e3, 3),
+        "p50_ms": round(percentile(latencies, 0.50) * 1e3, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1e3, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1e3, 3),
+        "max_ms": round(latencies[-1] * 1e3, 3),
+    }
+
+
+def check_thresholds(results: dict, thresholds: dict) -> list:
+    """
+        Compare benchmark results with regression thresholds.
+
+        ``thresholds`` maps scenario names to any of ``max_p50_ms``, ``max_p95_ms``,
+        ``max_p99_ms`` and ``min_throughput_rps``. Scenarios that were not run are skipped.
+
+        :param results: The ``scenarios`` section of the results.
+        :param thresholds: The limits per scenario.
+        :return: A description of every failed check; empty if all passed.
+        """
+    failures = []
+    for name, result in results.items():
+        if result["errors"]:
+            failures.append(f"{name}: {result['errors']} of {result['requests']} requests failed")
+        for limit, value in thresholds.get(name, {}).items():
+            bound, _, metric = limit.partition("_")
+            if bound == "max" and result[metric] > value:
+                failures.append(f"{name}: {metric} {result[metric]} > {value}")
+            elif bound == "min" and result[metric] < value:
+                failures.append(f"{name}: {metric} {result[metric]} < {value}")
+    return failures
+
+
+async def run(args) -> dict:
+    api = boot(args.database)
+    from database import engine
+    from refresh_tokens import refresh_tokens
+
+    state = await setup(api, args.rows, args.owners)
+    print(f"seeded {args.rows} contacts over {args.owners} users in {state['seed_seconds']:.1f} s", file=sys.stderr)
+    scenarios = make_scenarios(state, api)
+    results = {}
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        for name in args.scenarios:
+            if name == "refresh":
+                state["refresh_tokens"] = [await refresh_tokens.issue(state["email"])
+                                           for _ in range(args.requests + args.warmup)]
+            request, expected_status, hashes_password = scenarios[name]
+            requests = args.hash_requests if hashes_password else args.requests
+            results[name] = await run_scenario(client, request, expected_status, requests,
+                                               args.concurrency, min(args.warmup, requests))
+            result = results[name]
+            print(f"{name:<10} {result['throughput_rps']:9.1f} req/s  p50 {result['p50_ms']:8.2f} ms  "
+                  f"p95 {result['p95_ms']:8.2f} ms  p99 {result['p99_ms']:8.2f} ms  errors {result['errors']}",
+                  file=sys.stderr)
+    await engine.dispose()
+    api.hashing_service.shutdown()
+    return {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "database": engine.dialect.name,
+            "rows": args.rows,
+            "owners": args.owners,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "hash_requests": args.hash_requests,
+            "warmup": args.warmup,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "scenarios": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--database", help="database URL, wiped before the run (default: a new SQLite file)")
+    parser.add_argument("--rows", type=int, default=10000, help="contacts to seed")
+    parser.add_argument("--owners", type=int, default=10, help="users the contacts are spread over")
+    parser.add_argument("--requests", type=int, default=500, help="measured requests per scenario")
+    parser.add_argument("--hash-requests", type=int, default=50,
+                        help="measured requests for the scenarios that run bcrypt (token, register)")
+    parser.add_argument("--concurrency", type=int, default=16, help="requests in flight at once")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests per scenario")
+    parser.add_argument("--scenarios", nargs="+", default=["list", "get", "search", "birthdays", "token",
+                                                           "register", "refresh"])
+    parser.add_argument("--output", default="benchmark-results.json", help="where to write the JSON results")
+    parser.add_argument("--thresholds", default=str(DEFAULT_THRESHOLDS), help="JSON file of limits per scenario")
+    parser.add_argument("--check", action="store_true", help="exit with status 1 if a threshold is exceeded")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        args.database = args.database or f"sqlite:///{tmp}/benchmark.db"
+        report = asyncio.run(run(args))
+
+    Path(args.output).write_text(json.dumps(report, indent=2) + "\n")
+    print(f"results written to {args.output}", file=sys.stderr)
+    if args.check:
+        failures = check_thresholds(report["scenarios"], json.loads(Path(args.thresholds).read_text()))
+        for failure in failures:
+            print(f"FAIL {failure}", file=sys.stderr)
+        if failures:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+    Benchmark for contact list serialization.
+
+    Serves the same page of ``models.Contact`` rows through two endpoints: the previous path
+    (``response_model`` validation and serialization, then the stdlib ``json`` encoder) and
+    the orjson serializers, and reports the CPU time per request. The rows are built in
+    memory, so the numbers cover only the framework and serialization work. The same two
+    paths are also timed without the HTTP round trip.
+
+    Run from the repository root with the application settings in the environment::
+
+        python -m benchmarks.serialization --contacts 100 --requests 500
+    """
+import argparse
+import json
+import time
+from datetime import date
+from typing import List
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+import schemas
+from models import Contact
+from serializers import dump_contacts, json_response
+
+
+def make_contacts(count: int):
+    return [
+        Contact(id=i, first_name=f"First{i}", last_name=f"Last{i}", email=f"contact{i}@example.com",
+                phone_number="+380501234567", birth_date=date(1980 + i % 30, i % 12 + 1, i % 28 + 1),
+                extra_data=None if i % 2 else "notes")
+        for i in range(count)
+    ]
+
+
+def make_app(contacts) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/before", response_model=List[schemas.Contact], response_class=JSONResponse)
+    async def before():
+        return contacts
+
+    @app.get("/after", response_model=List[schemas.Contact])
+    async def after():
+        return json_response(dump_contacts(contacts))
+
+    return app
+
+
+def measure(client: TestClient, path: str, requests: int) -> float:
+    client.get(path)
+    start = time.process_time()
+    for _ in range(requests):
+        client.get(path)
+    return (time.process_time() - start) / requests
+
+
+def serialize_before(contacts) -> bytes:
+    content = schemas.ContactList.dump_python(schemas.ContactList.validate_python(contacts), mode="json")
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def measure_serialization(func, contacts, requests: int) -> float:
+    start = time.process_time()
+    for _ in range(requests):
+        func(contacts)
+    return (time.process_time() - start) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--contacts", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    contacts = make_contacts(args.contacts)
+    client = TestClient(make_app(contacts))
+    assert client.get("/before").json() == client.get("/after").json()
+
+    results = {path: measure(client, path, args.requests) for path in ("/before", "/after")}
+    for path, seconds in results.items():
+        print(f"{path:<8} {seconds * 1e3:8.3f} ms CPU/request")
+    print(f"speedup  {results['/before'] / results['/after']:8.2f}x")
+
+    before = measure_serialization(serialize_before, contacts, args.requests)
+    after = measure_serialization(dump_contacts, contacts, args.requests)
+    print(f"serialization only: before {before * 1e3:.3f} ms, after {after * 1e3:.3f} ms, "
+          f"speedup {before / after:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
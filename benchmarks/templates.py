@@ -0,0 +1,66 @@
+"""
+    Microbenchmark for confirmation email rendering.
+
+    Compares building a Jinja environment per message, which is what sending through a new
+    ``FastMail(conf)`` for every email did, with rendering from the precompiled
+    :class:`mail_templates.TemplateRenderer` cache.
+
+    Run from the repository root::
+
+        python -m benchmarks.templates --messages 5000
+    """
+import argparse
+import time
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+from mail_templates import TEMPLATE_FOLDER, TemplateRenderer
+
+TEMPLATE_NAME = "email_template.html"
+
+
+def context(i: int) -> dict:
+    return {"host": "http://127.0.0.1:8000/", "username": f"user{i}", "token": f"token-{i}"}
+
+
+def render_per_message(messages: int):
+    for i in range(messages):
+        environment = Environment(loader=FileSystemLoader(TEMPLATE_FOLDER), autoescape=select_autoescape(["html"]))
+        environment.get_template(TEMPLATE_NAME).render(context(i))
+
+
+def render_shared_environment(messages: int):
+    environment = Environment(loader=FileSystemLoader(TEMPLATE_FOLDER), autoescape=select_autoescape(["html"]))
+    for i in range(messages):
+        environment.get_template(TEMPLATE_NAME).render(context(i))
+
+
+def render_precompiled(messages: int):
+    renderer = TemplateRenderer()
+    renderer.precompile()
+    for i in range(messages):
+        renderer.render(TEMPLATE_NAME, context(i))
+
+
+def measure(func, messages: int) -> float:
+    start = time.perf_counter()
+    func(messages)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=5000)
+    args = parser.parse_args()
+
+    for name, func in [
+        ("environment per message", render_per_message),
+        ("shared environment", render_shared_environment),
+        ("precompiled renderer", render_precompiled),
+    ]:
+        elapsed = measure(func, args.messages)
+        print(f"{name:<26} {elapsed:8.3f} s  {elapsed / args.messages * 1e6:9.1f} us/message")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,295 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from redis.exceptions import RedisError
+
+
+logger = logging.getLogger(__name__)
+
+
+class LocalCacheBackend:
+    def __init__(self, max_entries: int = 10000):
+        """
+                In-process cache backend used when Redis is not configured.
+
+                Entries expire after their TTL and the least recently used entry is evicted
+                once ``max_entries`` is reached.
+
+                :param max_entries: The maximum number of entries to keep.
+                """
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+
+    def _live(self, key: str):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def _store(self, key: str, value: str, ttl: float = None):
+        self._data[key] = (time.monotonic() + ttl if ttl else None, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    async def get(self, key: str):
+        return self._live(key)
+
+    async def set(self, key: str, value: str, ttl: float = None):
+        self._store(key, value, ttl)
+
+    async def add(self, key: str, value: str, ttl: float = None) -> bool:
+        if self._live(key) is not None:
+            return False
+        self._store(key, value, ttl)
+        return True
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self._data.pop(key, None)
+
+    async def incr(self, key: str) -> int:
+        value = int(self._live(key) or 0) + 1
+        self._store(key, str(value))
+        return value
+
+
+class RedisStoreBackend:
+    def __init__(self, client):
+        """
+                Backend storing entries in Redis that raises on Redis errors.
+
+                Use it for state that must not be lost silently, such as refresh token revocation.
+
+                :param client: A ``redis.asyncio.Redis`` client with ``decode_responses=True``.
+                """
+        self.client = client
+
+    async def get(self, key: str):
+        return await self.client.get(key)
+
+    async def set(self, key: str, value: str, ttl: float = None):
+        await self.client.set(key, value, px=int(ttl * 1000) if ttl else None)
+
+    async def add(self, key: str, value: str, ttl: float = None) -> bool:
+        return bool(await self.client.set(key, value, px=int(ttl * 1000) if ttl else None, nx=True))
+
+    async def delete(self, *keys: str):
+        await self.client.delete(*keys)
+
+    async def incr(self, key: str) -> int:
+        return await self.client.incr(key)
+
+
+class RedisCacheBackend(RedisStoreBackend):
+    def __init__(self, client):
+        """
+                Cache backend storing entries in Redis.
+
+                Redis errors are logged and treated as cache misses so a Redis outage
+                degrades to reading from the database.
+
+                :param client: A ``redis.asyncio.Redis`` client with ``decode_responses=True``.
+                """
+        super().__init__(client)
+
+    async def get(self, key: str):
+        try:
+            return await super().get(key)
+        except RedisError as err:
+            logger.warning("Cache get failed: %s", err)
+            return None
+
+    async def set(self, key: str, value: str, ttl: float = None):
+        try:
+            await super().set(key, value, ttl)
+        except RedisError as err:
+            logger.warning("Cache set failed: %s", err)
+
+    async def add(self, key: str, value: str, ttl: float = None) -> bool:
+        try:
+            return await super().add(key, value, ttl)
+        except RedisError as err:
+            logger.warning("Cache add failed: %s", err)
+            return True
+
+    async def delete(self, *keys: str):
+        try:
+            await super().delete(*keys)
+        except RedisError as err:
+            logger.warning("Cache delete failed: %s", err)
+
+    async def incr(self, key: str) -> int:
+        try:
+            return await super().incr(key)
+        except RedisError as err:
+            logger.warning("Cache incr failed: %s", err)
+            return 0
+
+
+class ContactCache:
+    def __init__(self, backend=None, ttl: float = 60, lock_timeout: float = 5.0):
+        """
+                Read-through cache for serialized contact payloads.
+
+                Entries are kept per owner, under keys that include the owner's generation
+                counter: ``contact:<user_id>:<generation>:<id>`` for single contacts and
+                ``contacts:<user_id>:<generation>:<params>`` for list pages. A write invalidates
+                every cached entry of that owner with one ``INCR``. Concurrent misses for the same key are coalesced: within a
+                worker they share one load, and across workers a short lock in the backend lets
+                one worker load while the others wait for its result.
+
+                :param backend: The cache backend, defaults to :class:`LocalCacheBackend`.
+                :param ttl: Seconds to keep an entry.
+                :param lock_timeout: Seconds to wait for another worker's load before loading anyway.
+                """
+        self.backend = backend or LocalCacheBackend()
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._flights = {}
+
+    async def get_or_load(self, key: str, loader, ttl: float = None):
+        """
+                Get a cached payload, loading and caching it on a miss.
+
+                :param key: The cache key.
+                :param loader: Coroutine function returning the payload string, or None to skip caching.
+                :param ttl: Seconds to keep a loaded payload, defaults to the cache's TTL.
+                :return: The payload, or None if the loader found nothing.
+                """
+        value = await self.backend.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+
+        flight = self._flights.get(key)
+        if flight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(flight)
+
+        flight = asyncio.get_running_loop().create_future()
+        self._flights[key] = flight
+        try:
+            value = await self._load(key, loader, ttl)
+        except asyncio.CancelledError:
+            flight.cancel()
+            raise
+        except Exception as err:
+            flight.set_exception(err)
+            flight.exception()
+            raise
+        else:
+            flight.set_result(value)
+            return value
+        finally:
+            del self._flights[key]
+
+    async def _load(self, key: str, loader, ttl: float = None):
+        lock_key = f"lock:{key}"
+        locked = await self.backend.add(lock_key, "1", self.lock_timeout)
+        deadline = time.monotonic() + self.lock_timeout
+        while not locked and time.monotonic() < deadline:
+            await asyncio.sleep(0.02)
+            value = await self.backend.get(key)
+            if value is not None:
+                return value
+            locked = await self.backend.add(lock_key, "1", self.lock_timeout)
+        try:
+            value = await loader()
+            if value is not None:
+                await self.backend.set(key, value, ttl or self.ttl)
+            return value
+        finally:
+            if locked:
+                await self.backend.delete(lock_key)
+
+    async def _generation(self, user_id: int) -> str:
+        return await self.backend.get(f"contacts:{user_id}:generation") or "0"
+
+    async def get_contact(self, user_id: int, contact_id: int, loader):
+        """
+                Get a serialized contact through the cache.
+
+                :param user_id: The ID of the owner.
+                :param contact_id: The ID of the contact.
+                :param loader: Coroutine function returning the serialized contact or None.
+                :return: The serialized contact, or None if it does not exist.
+                """
+        generation = await self._generation(user_id)
+        return await self.get_or_load(f"contact:{user_id}:{generation}:{contact_id}", loader)
+
+    async def get_contacts(self, user_id: int, params: str, loader, ttl: float = None):
+        """
+                Get a serialized page of contacts through the cache.
+
+                :param user_id: The ID of the owner.
+                :param params: A string identifying the page (sort, offset, limit and cursor).
+                :param loader: Coroutine function returning the serialized page.
+                :param ttl: Seconds to keep the page, defaults to the cache's TTL.
+                :return: The serialized page.
+                """
+        generation = await self._generation(user_id)
+        return await self.get_or_load(f"contacts:{user_id}:{generation}:{params}", loader, ttl)
+
+    async def invalidate(self, user_id: int):
+        """
+                Invalidate every cached contact and list page of an owner.
+
+                Superseded entries are left to expire. A reader that loaded a row before the
+                write stores it under the old generation, where no later reader looks.
+
+                :param user_id: The ID of the owner.
+                """
+        await self.backend.incr(f"contacts:{user_id}:generation")
+
+    def stats(self) -> dict:
+        """
+                Get hit and miss counters.
+
+                :return: A dictionary of cache metrics.
+                """
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def pack_page(body: str, next_cursor: str = None, etag: str = None) -> str:
+    """
+        Pack a serialized response and its headers into one cache value.
+
+        :param body: The serialized contact or list of contacts.
+        :param next_cursor: The cursor of the next page, if any.
+        :param etag: The ETag of the response, if any.
+        :return: The cache value.
+        """
+    return f"{next_cursor or ''}\n{etag or ''}\n{body}"
+
+
+def unpack_page(value: str):
+    """
+        Split a cache value produced by :func:`pack_page`.
+
+        :param value: The cache value.
+        :return: A ``(body, next_cursor, etag)`` tuple.
+        """
+    next_cursor, etag, body = value.split("\n", 2)
+    return body, next_cursor or None, etag or None
+
+
+contact_cache = ContactCache()
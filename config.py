@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic_settings import BaseSettings
 
 
@@ -10,6 +12,17 @@ class Settings(BaseSettings):
         - `mail_from`: The sender email address.
         - `mail_port`: The port number for the email server.
         - `mail_server`: The address of the email server.
+        - `mail_from_name`: The sender display name.
+        - `mail_ssl_tls`: Whether to connect to the email server with implicit TLS.
+        - `mail_starttls`: Whether to upgrade a plain connection with STARTTLS.
+        - `mail_validate_certs`: Whether to verify the email server certificate.
+        - `mail_pool_size`: The number of SMTP connections (and parallel sends) per mail worker.
+        - `mail_batch_size`: The number of queued emails a mail worker claims at once.
+        - `mail_max_attempts`: The number of delivery attempts before an email is marked failed.
+        - `mail_retry_base`: Seconds before the first retry, doubled on each attempt.
+        - `mail_retry_max`: The maximum seconds between retries.
+        - `mail_lease_seconds`: Seconds a claimed email is reserved before another worker may retry it.
+        - `mail_poll_interval`: Seconds a mail worker sleeps when the outbox is empty.
 
         - `postgres_db`: The name of the PostgreSQL database.
         - `postgres_user`: The username for the PostgreSQL database.
@@ -17,13 +30,58 @@ class Settings(BaseSettings):
         - `postgres_port`: The port number for the PostgreSQL database.
 
         - `sqlalchemy_database_url`: The URL for connecting to the PostgreSQL database.
+        - `db_pool_size`: The number of connections kept open per process; ``serve.py`` caps it at each worker's share of `db_max_connections`.
+        - `db_max_overflow`: The number of extra connections allowed above `db_pool_size`.
+        - `db_pool_timeout`: Seconds to wait for a free connection before failing.
+        - `db_pool_pre_ping`: Whether to test connections for liveness on checkout.
+        - `db_pool_recycle`: Seconds after which a connection is replaced.
+        - `db_max_connections`: The connections shared by all web worker processes (see ``serve.py``); 0 means `db_pool_size` + `db_max_overflow`.
+        - `slow_query_ms`: Queries slower than this many milliseconds are logged; 0 disables the log.
+        - `slow_query_explain_rate`: The fraction of slow SELECT queries logged with their ``EXPLAIN`` plan.
+        - `repeated_query_threshold`: Requests that run one statement more times than this are logged as N+1 suspects; 0 disables.
+        - `query_profiling_header`: Whether an ``X-Profile-Queries: 1`` request header profiles that request's queries.
+        - `stats_endpoints`: Whether ``/metrics`` and the pool, cache and rate limit stats endpoints are served; off, they answer 404.
 
         - `secret_key`: The secret key for hashing and encoding.
         - `algorithm`: The algorithm to use for hashing and encoding.
+        - `jwt_keys_dir`: Directory of ``<kid>.pem`` keys for RS256/ES256 token signing; empty to sign with `secret_key`.
+        - `jwt_active_kid`: The key ID that signs new tokens, defaults to the last private key in `jwt_keys_dir`.
+        - `jwt_accept_legacy`: Whether tokens without a key ID are still verified with `secret_key`.
+        - `jwks_max_age`: Seconds clients may cache the JWKS document.
+        - `refresh_token_expire_minutes`: The lifetime of a refresh token.
 
         - `redis_host`: The address of the Redis server.
         - `redis_port`: The port number for the Redis server.
 
+        - `rate_limit_sync_interval`: Seconds between rate limit syncs with Redis; 0 syncs on every request.
+        - `rate_limit_max_keys`: The maximum number of rate limit buckets kept per limit and worker.
+        - `rate_limit_trusted_proxies`: Comma-separated addresses or networks of the reverse proxies whose ``X-Forwarded-For`` is trusted; empty to rate limit by peer address.
+
+        - `cache_backend`: Where to cache contact reads, ``redis`` or ``memory``.
+        - `contact_cache_ttl`: Seconds to keep a cached contact or contact list page.
+
+        - `hashing_workers`: The number of bcrypt worker processes (0 means one per core).
+        - `hashing_max_queue`: The maximum number of hashing jobs pending or running at once.
+        - `hashing_queue_timeout`: Seconds to wait for a free hashing slot before rejecting.
+
+        - `import_batch_size`: The number of rows written per INSERT by the bulk import.
+        - `import_max_errors`: The maximum number of row errors listed in an import report.
+        - `import_max_line_length`: The longest line, in characters, accepted by the bulk import.
+        - `export_batch_size`: The number of rows fetched per round trip by the export.
+
+        - `user_cache_size`: The maximum number of authenticated users cached per worker.
+        - `user_cache_ttl`: Seconds to keep an authenticated user cached.
+
+        - `birthday_window_days`: The default number of days ahead to look for birthdays.
+        - `birthday_cache_ttl`: Seconds to keep an upcoming-birthday result cached.
+
+        - `server_bind`: The address the production server (``serve.py``) listens on.
+        - `server_workers`: The number of web worker processes (0 means one per core).
+        - `server_max_concurrency`: The number of connections a worker serves at once; further requests get 503.
+        - `server_max_requests`: The number of requests after which a worker is replaced; 0 disables.
+        - `server_max_requests_jitter`: The maximum random number of requests added to `server_max_requests` per worker.
+        - `server_graceful_timeout`: Seconds a stopping worker may spend finishing requests and closing connections.
+
         - `env_file`: The path to the environment file.
         - `env_file_encoding`: The encoding of the environment file.
         """
@@ -32,6 +90,17 @@ class Settings(BaseSettings):
     mail_from: str
     mail_port: int
     mail_server: str
+    mail_from_name: str = "Desired Name"
+    mail_ssl_tls: bool = True
+    mail_starttls: bool = False
+    mail_validate_certs: bool = True
+    mail_pool_size: int = 4
+    mail_batch_size: int = 50
+    mail_max_attempts: int = 8
+    mail_retry_base: float = 30.0
+    mail_retry_max: float = 3600.0
+    mail_lease_seconds: float = 300.0
+    mail_poll_interval: float = 2.0
 
     postgres_db: str
     postgres_user: str
@@ -39,16 +108,96 @@ class Settings(BaseSettings):
     postgres_port: int
 
     sqlalchemy_database_url: str
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30.0
+    db_pool_pre_ping: bool = True
+    db_pool_recycle: int = 1800
+    db_max_connections: int = 0
+    slow_query_ms: float = 200.0
+    slow_query_explain_rate: float = 0.1
+    repeated_query_threshold: int = 10
+    query_profiling_header: bool = False
+    stats_endpoints: bool = False
 
     secret_key: str
     algorithm: str
+    jwt_keys_dir: str = ""
+    jwt_active_kid: Optional[str] = None
+    jwt_accept_legacy: bool = True
+    jwks_max_age: int = 3600
+    refresh_token_expire_minutes: int = 1440
 
     redis_host: str
     redis_port: int
 
+    rate_limit_sync_interval: float = 1.0
+    rate_limit_max_keys: int = 100000
+    rate_limit_trusted_proxies: str = ""
+
+    cache_backend: str = "redis"
+    contact_cache_ttl: int = 60
+
+    hashing_workers: int = 0
+    hashing_max_queue: int = 256
+    hashing_queue_timeout: float = 5.0
+
+    import_batch_size: int = 1000
+    import_max_errors: int = 1000
+    import_max_line_length: int = 1048576
+    export_batch_size: int = 1000
+
+    user_cache_size: int = 10000
+    user_cache_ttl: int = 60
+
+    birthday_window_days: int = 7
+    birthday_cache_ttl: int = 300
+
+    server_bind: str = "0.0.0.0:8000"
+    server_workers: int = 0
+    server_max_concurrency: int = 256
+    server_max_requests: int = 10000
+    server_max_requests_jitter: int = 1000
+    server_graceful_timeout: int = 30
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
 
 
-settings = Settings()
+_settings = None
+
+
+def get_settings() -> Settings:
+    """
+        Get the application settings, reading the environment on first use.
+
+        :return: The settings.
+        """
+    global _settings
+    if _settings is None:
+        _settings = Settings()
+    return _settings
+
+
+def use_settings(config: Settings):
+    """
+        Replace the application settings, for example with the ones passed to ``main.create_app``.
+
+        :param config: The settings to use.
+        """
+    global _settings
+    _settings = config
+
+
+class LazySettings:
+    """
+        Stands in for :class:`Settings` until a value is read, so importing a module does not
+        require a complete environment.
+        """
+
+    def __getattr__(self, name):
+        return getattr(get_settings(), name)
+
+
+settings = LazySettings()
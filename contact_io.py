@@ -0,0 +1,261 @@
+import codecs
+import csv
+import io
+import json
+from datetime import date
+
+from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import crud
+from config import settings
+from database import SessionLocal
+from models import Contact
+from schemas import ContactCreate, ImportReport, ImportRowError
+
+
+MAX_RECORD_LINES = 100
+
+EXPORT_COLUMNS = ("id", "first_name", "last_name", "email", "phone_number", "birth_date", "extra_data")
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+
+class LineTooLongError(ValueError):
+    """
+        Raised when an upload has a line longer than the maximum line length.
+        """
+
+
+class UploadEncodingError(ValueError):
+    """
+        Raised when an upload is not valid UTF-8.
+        """
+
+
+async def iter_lines(chunks, max_line_length: int = None):
+    """
+        Decode a stream of byte chunks into text lines.
+
+        Only the current partial line is buffered, and a line longer than
+        ``max_line_length`` characters aborts the upload, so memory does not depend on the
+        size of the upload. Each chunk is split once, so the work is linear in its size.
+        A UTF-8 byte order mark is skipped.
+
+        :param chunks: Async iterator of ``bytes`` chunks.
+        :param max_line_length: The longest line allowed, defaults to ``settings.import_max_line_length``.
+        :return: Async iterator of lines without their line endings.
+        :raises LineTooLongError: If a line is longer than ``max_line_length``.
+        :raises UploadEncodingError: If the upload is not valid UTF-8.
+        """
+    max_line_length = max_line_length or settings.import_max_line_length
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = []
+    pending_length = 0
+
+    def finish(tail: str) -> str:
+        line = "".join(pending) + tail
+        if len(line) > max_line_length:
+            raise LineTooLongError(f"Line longer than {max_line_length} characters")
+        pending.clear()
+        return line.rstrip("\r")
+
+    def decode(chunk: bytes, final: bool = False) -> str:
+        try:
+            return decoder.decode(chunk, final)
+        except UnicodeDecodeError as err:
+            raise UploadEncodingError(f"Upload is not valid UTF-8: {err.reason}")
+
+    async for chunk in chunks:
+        *lines, tail = decode(chunk).split("\n")
+        if lines:
+            yield finish(lines[0])
+            pending_length = 0
+            for line in lines[1:]:
+                yield finish(line)
+        if tail:
+            pending.append(tail)
+            pending_length += len(tail)
+            if pending_length > max_line_length:
+                raise LineTooLongError(f"Line longer than {max_line_length} characters")
+    tail = decode(b"", final=True)
+    if pending or tail:
+        yield finish(tail)
+
+
+async def iter_ndjson_rows(lines):
+    """
+        Parse NDJSON lines into row dictionaries.
+
+        :param lines: Async iterator of text lines.
+        :return: Async iterator of ``(row_number, row_or_error)`` tuples, where a string
+            is the parse error for that row.
+        """
+    row_number = 0
+    async for line in lines:
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            row = json.loads(line)
+        except ValueError as err:
+            yield row_number, f"Invalid JSON: {err}"
+            continue
+        yield row_number, row if isinstance(row, dict) else "Row must be a JSON object"
+
+
+async def iter_csv_rows(lines):
+    """
+        Parse CSV lines with a header row into row dictionaries.
+
+        Quoted fields may contain newlines; lines are joined until the quotes balance, up to
+        ``MAX_RECORD_LINES`` lines per record. Empty cells become None.
+
+        :param lines: Async iterator of text lines.
+        :return: Async iterator of ``(row_number, row_or_error)`` tuples, where a string
+            is the parse error for that row.
+        """
+    header = None
+    record = []
+    row_number = 0
+    async for line in lines:
+        record.append(line)
+        text = "\n".join(record)
+        if text.count('"') % 2:
+            if len(record) < MAX_RECORD_LINES:
+                continue
+            record = []
+            row_number += 1
+            yield row_number, "Unterminated quoted field"
+            continue
+        record = []
+        if not text.strip():
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        row_number += 1
+        if len(values) != len(header):
+            yield row_number, f"Expected {len(header)} columns, got {len(values)}"
+            continue
+        yield row_number, {name: value or None for name, value in zip(header, values)}
+    if record:
+        yield row_number + 1, "Unterminated quoted field"
+
+
+def _describe(err: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in err.errors())
+
+
+async def import_contacts(db: AsyncSession, user_id: int, chunks, fmt: str, batch_size: int = None,
+                          max_errors: int = None) -> ImportReport:
+    """
+        Validate and insert contacts streamed from an upload.
+
+        Rows are validated against :class:`schemas.ContactCreate` and written in batches with
+        one multi-row ``INSERT ... ON CONFLICT DO NOTHING`` each, committed per batch. Rows
+        whose email the owner already has are skipped and reported.
+
+        :param db: The database session.
+        :param user_id: The ID of the owner of the imported contacts.
+        :param chunks: Async iterator of ``bytes`` chunks of the upload.
+        :param fmt: The upload format, ``csv`` or ``ndjson``.
+        :param batch_size: Rows per INSERT, defaults to ``settings.import_batch_size``.
+        :param max_errors: Maximum number of row errors to report, defaults to ``settings.import_max_errors``.
+        :return: The import report.
+        :raises LineTooLongError: If a line exceeds ``settings.import_max_line_length``; batches
+            already written stay committed.
+        :raises UploadEncodingError: If the upload is not valid UTF-8; batches already written
+            stay committed.
+        """
+    batch_size = batch_size or settings.import_batch_size
+    max_errors = settings.import_max_errors if max_errors is None else max_errors
+    report = ImportReport()
+
+    def note(row_number: int, error: str):
+        if len(report.errors) < max_errors:
+            report.errors.append(ImportRowError(row=row_number, error=error))
+        else:
+            report.errors_truncated = True
+
+    async def flush(batch):
+        inserted = await crud.bulk_insert_contacts(db, user_id, [contact for _, contact in batch])
+        await db.commit()
+        for row_number, contact in batch:
+            if contact.email in inserted:
+                inserted.discard(contact.email)
+                report.inserted += 1
+            else:
+                report.skipped += 1
+                note(row_number, f"Contact with email {contact.email} already exists")
+
+    parser = iter_csv_rows if fmt == "csv" else iter_ndjson_rows
+    batch = []
+    async for row_number, row in parser(iter_lines(chunks)):
+        if isinstance(row, str):
+            report.failed += 1
+            note(row_number, row)
+            continue
+        try:
+            batch.append((row_number, ContactCreate(**row)))
+        except ValidationError as err:
+            report.failed += 1
+            note(row_number, _describe(err))
+            continue
+        if len(batch) >= batch_size:
+            await flush(batch)
+            batch = []
+    if batch:
+        await flush(batch)
+    return report
+
+
+def _csv_lines(rows) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(rows)
+    return buffer.getvalue()
+
+
+def _ndjson_lines(rows) -> str:
+    return "".join(
+        json.dumps({
+            name: value.isoformat() if isinstance(value, date) else value
+            for name, value in zip(EXPORT_COLUMNS, row)
+        }) + "\n"
+        for row in rows
+    )
+
+
+async def export_contacts(user_id: int, fmt: str, batch_size: int = None):
+    """
+        Stream every contact of an owner as CSV or NDJSON.
+
+        Rows come from a server-side cursor as plain column tuples, so no ORM objects or
+        Pydantic models are built. Each batch of ``batch_size`` rows becomes one chunk of
+        output. Memory stays constant and the first bytes go out after the first batch.
+        The generator opens its own session, so it can outlive the request's dependencies.
+
+        :param user_id: The ID of the owner.
+        :param fmt: The output format, ``csv`` or ``ndjson``.
+        :param batch_size: Rows fetched per round trip, defaults to ``settings.export_batch_size``.
+        :return: Async iterator of text chunks.
+        """
+    batch_size = batch_size or settings.export_batch_size
+    render = _csv_lines if fmt == "csv" else _ndjson_lines
+    if fmt == "csv":
+        yield _csv_lines([EXPORT_COLUMNS])
+
+    columns = [Contact.__table__.c[name] for name in EXPORT_COLUMNS]
+    stmt = (
+        select(*columns).where(Contact.user_id == user_id).order_by(Contact.id)
+        .execution_options(yield_per=batch_size)
+    )
+    async with SessionLocal() as db:
+        result = await db.stream(stmt)
+        async for rows in result.partitions():
+            yield render(rows)
@@ -1,107 +1,410 @@
-from sqlalchemy.orm import Session
+import base64
+import calendar
+import json
+
+from sqlalchemy import case, delete, or_, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
 import models
+import search
+from config import settings
 from models import Contact
-from schemas import ContactCreate, ContactUpdate
+from schemas import ContactCreate, ContactFilter, ContactUpdate
 from datetime import date, timedelta, datetime
 
 
-def create_contact(db: Session, contact: ContactCreate):
+INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+BULK_CHUNK_SIZE = 1000
+
+SORT_COLUMNS = {
+    "id": Contact.id,
+    "first_name": Contact.first_name,
+    "last_name": Contact.last_name,
+    "email": Contact.email,
+    "birth_date": Contact.birth_date,
+}
+
+
+def encode_cursor(sort: str, contact: Contact) -> str:
+    """
+        Build an opaque pagination cursor pointing just after the given contact.
+
+        :param sort: The sort key the page was ordered by.
+        :param contact: The last contact of the page.
+        :return: The encoded cursor.
+        """
+    value = getattr(contact, sort)
+    if isinstance(value, date):
+        value = value.isoformat()
+    raw = json.dumps([sort, value, contact.id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """
+        Decode a cursor produced by :func:`encode_cursor`.
+
+        :param cursor: The encoded cursor.
+        :return: A ``(sort, value, contact_id)`` tuple.
+        :raises ValueError: If the cursor is malformed or its value does not fit the sort column.
+        """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort, value, contact_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if sort not in SORT_COLUMNS or type(contact_id) is not int:
+            raise ValueError
+        if sort == "id":
+            if type(value) is not int:
+                raise ValueError
+        elif value is not None:
+            if not isinstance(value, str):
+                raise ValueError
+            if sort == "birth_date":
+                value = date.fromisoformat(value)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    return sort, value, contact_id
+
+
+async def create_contact(db: AsyncSession, user_id: int, contact: ContactCreate):
     """
         Create a new contact.
 
         :param db: The database session.
+        :param user_id: The ID of the owner.
         :param contact: The contact details.
         :return: The created contact.
         """
-    db_contact = Contact(**contact.dict())
+    db_contact = Contact(**contact.model_dump(), user_id=user_id)
     db.add(db_contact)
-    db.commit()
-    db.refresh(db_contact)
+    await db.commit()
+    await db.refresh(db_contact)
     return db_contact
 
-def get_contacts(db: Session, skip: int = 0, limit: int = 10):
+async def bulk_insert_contacts(db: AsyncSession, user_id: int, contacts):
     """
-        Get a list of contacts.
+        Insert many contacts with one multi-row INSERT, skipping emails the owner already has.
+
+        The caller commits.
 
         :param db: The database session.
+        :param user_id: The ID of the owner.
+        :param contacts: A list of :class:`schemas.ContactCreate`.
+        :return: The set of emails that were inserted.
+        """
+    if not contacts:
+        return set()
+    insert = INSERTS.get(db.get_bind().dialect.name, postgresql.insert)
+    stmt = (
+        insert(Contact)
+        .values([{**contact.model_dump(), "user_id": user_id} for contact in contacts])
+        .on_conflict_do_nothing(index_elements=[Contact.user_id, Contact.email])
+        .returning(Contact.email)
+    )
+    result = await db.execute(stmt)
+    return set(result.scalars().all())
+
+async def get_contacts(db: AsyncSession, user_id: int, skip: int = 0, limit: int = 10, sort: str = "id"):
+    """
+        Get a list of the owner's contacts using offset pagination.
+
+        :param db: The database session.
+        :param user_id: The ID of the owner.
         :param skip: The number of contacts to skip.
         :param limit: The maximum number of contacts to return.
+        :param sort: The column to order by; ties are broken by ID.
         :return: A list of contacts.
         """
-    return db.query(Contact).offset(skip).limit(limit).all()
+    column = SORT_COLUMNS[sort]
+    result = await db.execute(
+        select(Contact).where(Contact.user_id == user_id)
+        .order_by(column.asc().nulls_last(), Contact.id).offset(skip).limit(limit)
+    )
+    return result.scalars().all()
 
-def get_contact(db: Session, contact_id: int):
+async def get_contacts_after(db: AsyncSession, user_id: int, cursor: str, limit: int = 10):
+    """
+        Get the page of the owner's contacts that follows a cursor (keyset pagination).
+
+        Rows are ordered by ``(sort_key, id)`` with NULL sort keys last, and each page is
+        a range scan of a ``(user_id, sort_key, id)`` index starting at the cursor, so every
+        page costs the same.
+
+        :param db: The database session.
+        :param user_id: The ID of the owner.
+        :param cursor: A cursor from :func:`encode_cursor`.
+        :param limit: The maximum number of contacts to return.
+        :return: A list of contacts.
+        :raises ValueError: If the cursor is malformed.
+        """
+    sort, value, last_id = decode_cursor(cursor)
+    column = SORT_COLUMNS[sort]
+    contacts = []
+
+    owned = select(Contact).where(Contact.user_id == user_id)
+
+    if sort == "id":
+        result = await db.execute(owned.where(Contact.id > last_id).order_by(Contact.id).limit(limit))
+        return result.scalars().all()
+
+    if value is not None:
+        result = await db.execute(
+            owned
+            .where(tuple_(column, Contact.id) > tuple_(value, last_id))
+            .order_by(column, Contact.id)
+            .limit(limit)
+        )
+        contacts = list(result.scalars().all())
+
+    if len(contacts) < limit:
+        tail = owned.where(column.is_(None))
+        if value is None:
+            tail = tail.where(Contact.id > last_id)
+        result = await db.execute(tail.order_by(Contact.id).limit(limit - len(contacts)))
+        contacts.extend(result.scalars().all())
+    return contacts
+
+async def get_contact(db: AsyncSession, user_id: int, contact_id: int):
     """
         Get a specific contact by ID.
 
         :param db: The database session.
+        :param user_id: The ID of the owner.
         :param contact_id: The ID of the contact.
-        :return: The contact with the specified ID.
+        :return: The contact with the specified ID, or None if the owner has no such contact.
         """
-    return db.query(Contact).filter(Contact.id == contact_id).first()
+    result = await db.execute(select(Contact).where(Contact.id == contact_id, Contact.user_id == user_id))
+    return result.scalars().first()
 
-def update_contact(db: Session, contact_id: int, contact: ContactUpdate):
+class VersionMismatch(Exception):
     """
-        Update the details of a contact.
+        Raised when a conditional write finds the contact at a different version.
+        """
+
+
+def _version_clauses(user_id: int, contact_id: int, versions):
+    clauses = [Contact.id == contact_id, Contact.user_id == user_id]
+    if versions is not None:
+        clauses.append(Contact.version.in_(sorted(versions)))
+    return clauses
+
+async def _check_missing(db: AsyncSession, user_id: int, contact_id: int, versions):
+    if versions is None:
+        return
+    exists = await db.scalar(select(Contact.id).where(Contact.id == contact_id, Contact.user_id == user_id))
+    if exists is not None:
+        raise VersionMismatch(f"Contact {contact_id} has been modified")
+
+async def update_contact(db: AsyncSession, user_id: int, contact_id: int, contact: ContactUpdate, versions=None):
+    """
+        Replace the details of a contact with one ``UPDATE ... RETURNING`` statement.
+
+        The row version is incremented.
 
         :param db: The database session.
+        :param user_id: The ID of the owner.
         :param contact_id: The ID of the contact to update.
         :param contact: The updated contact details.
-        :return: The updated contact.
+        :param versions: If given, only update when the current version is one of these.
+        :return: The updated contact, or None if it does not exist.
+        :raises VersionMismatch: If the contact exists at another version.
+        """
+    return await patch_contact(db, user_id, contact_id, contact.model_dump(), versions=versions)
+
+async def patch_contact(db: AsyncSession, user_id: int, contact_id: int, values: dict, versions=None):
+    """
+        Change some columns of a contact with one ``UPDATE ... RETURNING`` statement.
+
+        Only the columns in ``values`` are written and the row version is incremented. With
+        no values nothing is written and the contact is returned as it is.
+
+        :param db: The database session.
+        :param user_id: The ID of the owner.
+        :param contact_id: The ID of the contact to update.
+        :param values: The column values to set.
+        :param versions: If given, only update when the current version is one of these.
+        :return: The updated contact, or None if it does not exist.
+        :raises VersionMismatch: If the contact exists at another version.
         """
-    db_contact = db.query(Contact).filter(Contact.id == contact_id).first()
-    if db_contact:
-        for key, value in contact.dict().items():
-            setattr(db_contact, key, value)
-        db.commit()
-        db.refresh(db_contact)
-        return db_contact
-    return None
+    if not values:
+        stmt = select(Contact).where(*_version_clauses(user_id, contact_id, versions))
+    else:
+        stmt = (
+            update(Contact).where(*_version_clauses(user_id, contact_id, versions))
+            .values(**values, version=Contact.version + 1).returning(Contact)
+        )
+    result = await db.execute(stmt)
+    db_contact = result.scalars().first()
+    if db_contact is None:
+        await _check_missing(db, user_id, contact_id, versions)
+    await db.commit()
+    return db_contact
 
-def delete_contact(db: Session, contact_id: int):
+async def delete_contact(db: AsyncSession, user_id: int, contact_id: int, versions=None):
     """
-        Delete a contact by ID.
+        Delete a contact by ID with one ``DELETE ... RETURNING`` statement.
 
         :param db: The database session.
+        :param user_id: The ID of the owner.
         :param contact_id: The ID of the contact to delete.
-        :return: The deleted contact.
+        :param versions: If given, only delete when the current version is one of these.
+        :return: The deleted contact, or None if it does not exist.
+        :raises VersionMismatch: If the contact exists at another version.
         """
-    db_contact = db.query(Contact).filter(Contact.id == contact_id).first()
-    if db_contact:
-        db.delete(db_contact)
-        db.commit()
-        return db_contact
-    return None
+    result = await db.execute(
+        delete(Contact).where(*_version_clauses(user_id, contact_id, versions)).returning(Contact)
+    )
+    db_contact = result.scalars().first()
+    if db_contact is None:
+        await _check_missing(db, user_id, contact_id, versions)
+    await db.commit()
+    return db_contact
 
-def search_contacts(db: Session, query: str):
+def filter_clauses(contact_filter: ContactFilter):
     """
-        Search for contacts by a query string.
+        Build WHERE clauses from a bulk operation filter.
+
+        :param contact_filter: The filter criteria.
+        :return: A list of SQL expressions to AND together.
+        """
+    clauses = []
+    for name in ("first_name", "last_name", "email"):
+        value = getattr(contact_filter, name)
+        if value is not None:
+            clauses.append(SORT_COLUMNS[name] == value)
+    if contact_filter.birth_date_from is not None:
+        clauses.append(Contact.birth_date >= contact_filter.birth_date_from)
+    if contact_filter.birth_date_to is not None:
+        clauses.append(Contact.birth_date <= contact_filter.birth_date_to)
+    return clauses
+
+async def _bulk_execute(db: AsyncSession, user_id: int, build, ids=None, contact_filter: ContactFilter = None,
+                        chunk_size: int = BULK_CHUNK_SIZE):
+    affected = []
+    owned = Contact.user_id == user_id
+    if ids is not None:
+        unique_ids = sorted(set(ids))
+        for start in range(0, len(unique_ids), chunk_size):
+            result = await db.execute(build(owned, Contact.id.in_(unique_ids[start:start + chunk_size])))
+            affected.extend(result.scalars().all())
+    else:
+        clauses = [owned, *filter_clauses(contact_filter)]
+        last_id = 0
+        while True:
+            chunk = (
+                select(Contact.id).where(*clauses, Contact.id > last_id).order_by(Contact.id).limit(chunk_size)
+            )
+            result = await db.execute(build(owned, Contact.id.in_(chunk.scalar_subquery())))
+            chunk_ids = result.scalars().all()
+            if not chunk_ids:
+                break
+            affected.extend(chunk_ids)
+            last_id = max(chunk_ids)
+    await db.commit()
+    return sorted(affected)
+
+async def bulk_update_contacts(db: AsyncSession, user_id: int, values: dict, ids=None,
+                               contact_filter: ContactFilter = None):
+    """
+        Update many contacts with set-based ``UPDATE ... RETURNING`` statements.
+
+        The row version of every updated contact is incremented.
+
+        Contacts are selected by ``ids`` or by ``contact_filter`` and processed in chunks of
+        ``BULK_CHUNK_SIZE`` rows, one statement per chunk, in a single transaction.
 
         :param db: The database session.
-        :param query: The search query.
-        :return: A list of contacts matching the search query.
+        :param user_id: The ID of the owner; other users' contacts are never changed.
+        :param values: The column values to set.
+        :param ids: The IDs of the contacts to update.
+        :param contact_filter: Criteria selecting the contacts to update, used when ``ids`` is None.
+        :return: The sorted IDs of the updated contacts.
         """
-    return db.query(Contact).filter(
-        (Contact.first_name.ilike(f"%{query}%")) |
-        (Contact.last_name.ilike(f"%{query}%")) |
-        (Contact.email.ilike(f"%{query}%"))
-    ).all()
+    def build(*where):
+        return (
+            update(Contact).where(*where).values(**values, version=Contact.version + 1).returning(Contact.id)
+            .execution_options(synchronize_session=False)
+        )
+    return await _bulk_execute(db, user_id, build, ids=ids, contact_filter=contact_filter)
 
+async def bulk_delete_contacts(db: AsyncSession, user_id: int, ids=None, contact_filter: ContactFilter = None):
+    """
+        Delete many contacts with set-based ``DELETE ... RETURNING`` statements.
+
+        Contacts are selected by ``ids`` or by ``contact_filter`` and processed in chunks of
+        ``BULK_CHUNK_SIZE`` rows, one statement per chunk, in a single transaction.
+
+        :param db: The database session.
+        :param user_id: The ID of the owner; other users' contacts are never deleted.
+        :param ids: The IDs of the contacts to delete.
+        :param contact_filter: Criteria selecting the contacts to delete, used when ``ids`` is None.
+        :return: The sorted IDs of the deleted contacts.
+        """
+    def build(*where):
+        return delete(Contact).where(*where).returning(Contact.id).execution_options(synchronize_session=False)
+    return await _bulk_execute(db, user_id, build, ids=ids, contact_filter=contact_filter)
 
-def get_upcoming_birthdays(db: Session):
+async def search_contacts(db: AsyncSession, user_id: int, query: str, skip: int = 0, limit: int = 20):
     """
-        Get contacts with upcoming birthdays within the next 7 days.
+        Search the owner's contacts by a query string.
 
         :param db: The database session.
-        :return: A list of contacts with upcoming birthdays.
+        :param user_id: The ID of the owner.
+        :param query: The search query.
+        :param skip: The number of results to skip.
+        :param limit: The maximum number of results to return.
+        :return: A list of contacts matching the search query, best matches first.
         """
-    today = datetime.now().date()
-    seven_days_later = today + timedelta(days=7)
+    return await search.search_contacts(db, user_id, query, skip=skip, limit=limit)
 
-    contacts = db.query(models.Contact).filter(
-        models.Contact.birth_date >= today,
-        models.Contact.birth_date <= seven_days_later
-    ).all()
 
-    return contacts
+def birthday_ranges(today: date, days: int):
+    """
+        Get the ``month * 100 + day`` ranges covered by a birthday window.
+
+        The window runs from ``today`` to ``today + days`` inclusive and is split in two
+        when it wraps past 31 December. In non-leap years 29 February birthdays are
+        celebrated on 28 February, so a window ending on 28 February also covers 229.
 
+        :param today: The first day of the window.
+        :param days: The number of days after ``today`` to include.
+        :return: A list of inclusive ``(start, end)`` key ranges.
+        """
+    if days >= 365:
+        return [(101, 1231)]
+    end = today + timedelta(days=days)
+    start_key = today.month * 100 + today.day
+    end_key = end.month * 100 + end.day
+    if end_key == 228 and not calendar.isleap(end.year):
+        end_key = 229
+    if start_key <= end_key:
+        return [(start_key, end_key)]
+    return [(start_key, 1231), (101, end_key)]
+
+
+async def get_upcoming_birthdays(db: AsyncSession, user_id: int, days: int = None, today: date = None):
+    """
+        Get the owner's contacts with upcoming birthdays, soonest first.
+
+        The lookup is a range scan on the ``(user_id, birthday)`` index.
+
+        :param db: The database session.
+        :param user_id: The ID of the owner.
+        :param days: The size of the window in days, defaults to ``settings.birthday_window_days``.
+        :param today: The first day of the window, defaults to the current date.
+        :return: A list of contacts with upcoming birthdays.
+        """
+    days = settings.birthday_window_days if days is None else days
+    today = today or datetime.now().date()
+    ranges = birthday_ranges(today, days)
+    start_key = ranges[0][0]
+    result = await db.execute(
+        select(Contact)
+        .where(Contact.user_id == user_id, or_(*(Contact.birthday.between(start, end) for start, end in ranges)))
+        .order_by(case((Contact.birthday >= start_key, 0), else_=1), Contact.birthday, Contact.id)
+    )
+    return result.scalars().all()
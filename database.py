@@ -1,19 +1,158 @@
-from sqlalchemy import create_engine
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import Session, sessionmaker
-from datetime import datetime, timedelta
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from config import Settings, settings
+from metrics import DB_POOL_CHECKOUT_WAIT, instrument_engine
+from profiling import query_profiler
+
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def async_database_url(url: str) -> str:
+    """
+        Convert a database URL to its asyncio driver equivalent.
+
+        ``postgresql://`` becomes ``postgresql+asyncpg://`` and ``sqlite://`` becomes
+        ``sqlite+aiosqlite://``. URLs that already name a driver are returned unchanged.
+
+        :param url: The configured database URL.
+        :return: The URL to pass to the async engine.
+        """
+    parsed = make_url(url)
+    if parsed.drivername in ASYNC_DRIVERS:
+        parsed = parsed.set(drivername=ASYNC_DRIVERS[parsed.drivername])
+    return parsed.render_as_string(hide_password=False)
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """
+        Connection pool that records how long checkouts wait for a connection.
+        """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.checkouts += 1
+            self.wait_seconds += elapsed
+            self.max_wait_seconds = max(self.max_wait_seconds, elapsed)
+            DB_POOL_CHECKOUT_WAIT.observe(elapsed)
+
+
+def create_engine_from_settings(config: Settings) -> AsyncEngine:
+    """
+        Create the application's async engine from settings.
+
+        PostgreSQL engines use :class:`InstrumentedQueuePool` sized by ``db_pool_size`` and
+        ``db_max_overflow``; SQLite keeps SQLAlchemy's default pool.
 
-from config import settings
+        :param config: The application settings.
+        :return: The async engine.
+        """
+    url = async_database_url(config.sqlalchemy_database_url)
+    if make_url(url).get_backend_name() == "sqlite":
+        return create_async_engine(url)
+    return create_async_engine(
+        url,
+        poolclass=InstrumentedQueuePool,
+        pool_size=config.db_pool_size,
+        max_overflow=config.db_max_overflow,
+        pool_timeout=config.db_pool_timeout,
+        pool_pre_ping=config.db_pool_pre_ping,
+        pool_recycle=config.db_pool_recycle,
+    )
 
-DATABASE_URL = settings.sqlalchemy_database_url
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def pool_stats() -> dict:
+    """
+        Get connection pool statistics for the application engine.
+
+        :return: A dictionary with the pool size, checked-out and overflow connections,
+            and checkout wait times.
+        """
+    pool = get_engine().pool
+    stats = {"pool_class": type(pool).__name__}
+    if isinstance(pool, AsyncAdaptedQueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+        )
+    if isinstance(pool, InstrumentedQueuePool):
+        stats.update(
+            checkouts=pool.checkouts,
+            timeouts=pool.timeouts,
+            avg_wait_ms=(pool.wait_seconds / pool.checkouts * 1000) if pool.checkouts else 0.0,
+            max_wait_ms=pool.max_wait_seconds * 1000,
+        )
+    return stats
+
+
+class LazySessionmaker(async_sessionmaker):
+    """
+        Session factory that creates the application engine on the first session.
+        """
+
+    def __call__(self, **local_kw) -> AsyncSession:
+        get_engine()
+        return super().__call__(**local_kw)
+
+
+_engine = None
+SessionLocal = LazySessionmaker(class_=AsyncSession, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
-def get_db() -> Session:
-    db = SessionLocal()
-    try:
+
+def get_engine() -> AsyncEngine:
+    """
+        Get the application engine, creating it from settings on first use.
+
+        :return: The async engine.
+        """
+    global _engine
+    if _engine is None:
+        _engine = create_engine_from_settings(settings)
+        instrument_engine(_engine)
+        query_profiler.attach(_engine)
+        SessionLocal.configure(bind=_engine)
+    return _engine
+
+
+async def dispose_engine():
+    """
+        Close every pooled connection of the application engine, if it was created.
+        """
+    if _engine is not None:
+        await _engine.dispose()
+
+
+def __getattr__(name):
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+async def get_db() -> AsyncSession:
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
@@ -0,0 +1,61 @@
+import hashlib
+
+
+def contact_etag(contact) -> str:
+    """
+        Get the strong ETag of a contact from its ID and row version.
+
+        :param contact: A ``models.Contact`` row.
+        :return: The quoted ETag, for example ``"12-3"``.
+        """
+    return f'"{contact.id}-{contact.version}"'
+
+
+def payload_etag(body) -> str:
+    """
+        Get a strong ETag for a serialized response from a hash of its content.
+
+        :param body: The serialized response, as ``str`` or ``bytes``.
+        :return: The quoted ETag.
+        """
+    if isinstance(body, str):
+        body = body.encode()
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def _tags(header: str):
+    return [tag.strip() for tag in header.split(",") if tag.strip()]
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """
+        Check an ``If-None-Match`` header against an ETag, with weak comparison.
+
+        :param header: The header value, a list of ETags or ``*``.
+        :param etag: The current ETag.
+        :return: True if the client's copy is current.
+        """
+    tags = [tag.removeprefix("W/") for tag in _tags(header)]
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+
+def if_match_versions(header: str, contact_id: int):
+    """
+        Get the row version required by an ``If-Match`` header, with strong comparison.
+
+        :param header: The header value, a list of ETags or ``*``.
+        :param contact_id: The ID of the contact being changed.
+        :return: None for ``*``, otherwise the set of acceptable versions (empty if no
+            strong ETag refers to this contact).
+        """
+    tags = _tags(header)
+    if "*" in tags:
+        return None
+    versions = set()
+    for tag in tags:
+        if tag.startswith("W/"):
+            continue
+        tag_id, _, version = tag.strip('"').partition("-")
+        if tag_id == str(contact_id) and version.isdigit():
+            versions.add(int(version))
+    return versions
@@ -0,0 +1,138 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from passlib.context import CryptContext
+
+from metrics import PASSWORD_HASH_DURATION
+
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+class HashingBusyError(Exception):
+    """
+        Raised when the hashing queue stays full for longer than the queue timeout.
+        """
+
+
+class HashingService:
+    def __init__(self, workers: int = None, max_queue: int = 256, queue_timeout: float = 5.0):
+        """
+                Shared bcrypt hashing service backed by a process pool.
+
+                Hashes are computed in worker processes so bcrypt never runs on the event loop.
+                At most ``max_queue`` jobs may be pending or running at once; further callers wait
+                for a free slot and get :class:`HashingBusyError` after ``queue_timeout`` seconds.
+
+                :param workers: Number of worker processes, defaults to the number of cores.
+                :param max_queue: Maximum number of jobs pending or running at once.
+                :param queue_timeout: Seconds to wait for a free slot before giving up.
+                """
+        self._executor = None
+        self.configure(workers, max_queue, queue_timeout)
+        self.waiting = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def configure(self, workers: int = None, max_queue: int = 256, queue_timeout: float = 5.0):
+        """
+                Change the pool size and queue limits. Call before the first job.
+
+                :param workers: Number of worker processes, defaults to the number of cores.
+                :param max_queue: Maximum number of jobs pending or running at once.
+                :param queue_timeout: Seconds to wait for a free slot before giving up.
+                """
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._slots = asyncio.Semaphore(max_queue)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    async def _submit(self, operation: str, fn, *args):
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise HashingBusyError("Password hashing queue is full")
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.in_flight -= 1
+            self.completed += 1
+            self.total_seconds += elapsed
+            self.max_seconds = max(self.max_seconds, elapsed)
+            PASSWORD_HASH_DURATION.labels(operation).observe(elapsed)
+            self._slots.release()
+
+    async def hash_password(self, password: str) -> str:
+        """
+                Hash the given password in the process pool.
+
+                :param password: The password to be hashed.
+                :return: The hashed password.
+                """
+        return await self._submit("hash", _hash, password)
+
+    async def verify_password(self, plain_password: str, hashed_password: str) -> bool:
+        """
+                Verify the given plain password against the hashed password in the process pool.
+
+                :param plain_password: The plain password to be verified.
+                :param hashed_password: The hashed password.
+                :return: True if the passwords match, False otherwise.
+                """
+        return await self._submit("verify", _verify, plain_password, hashed_password)
+
+    def stats(self) -> dict:
+        """
+                Get queue depth and latency metrics.
+
+                :return: A dictionary of hashing service metrics.
+                """
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "queue_depth": self.waiting + self.in_flight,
+            "waiting": self.waiting,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_latency_ms": (self.total_seconds / self.completed * 1000) if self.completed else 0.0,
+            "max_latency_ms": self.max_seconds * 1000,
+        }
+
+    def shutdown(self):
+        """
+                Stop the worker processes.
+                """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+hashing_service = HashingService()
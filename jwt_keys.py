@@ -0,0 +1,221 @@
+import argparse
+import json
+from pathlib import Path
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from jwt.algorithms import RSAAlgorithm
+from jwt.utils import base64url_encode
+
+from config import Settings, settings
+
+
+class SigningKey:
+    def __init__(self, kid: str, public_key, private_key=None):
+        """
+                One asymmetric JWT key.
+
+                RSA keys sign with RS256 and P-256 EC keys with ES256. Keys without a private part
+                only verify tokens, which is how retired keys are kept during rotation.
+
+                :param kid: The key ID written to the token header.
+                :param public_key: The public key object.
+                :param private_key: The private key object, or None for a verify-only key.
+                """
+        self.kid = kid
+        self.public_key = public_key
+        self.private_key = private_key
+        self.algorithm = "RS256" if isinstance(public_key, rsa.RSAPublicKey) else "ES256"
+
+    @classmethod
+    def from_pem(cls, kid: str, data: bytes) -> "SigningKey":
+        """
+                Load a key from a PEM private key or public key.
+
+                :param kid: The key ID.
+                :param data: The PEM-encoded key.
+                :return: The loaded key.
+                """
+        if b"PRIVATE KEY" in data:
+            private_key = serialization.load_pem_private_key(data, password=None)
+            return cls(kid, private_key.public_key(), private_key)
+        return cls(kid, serialization.load_pem_public_key(data))
+
+    def jwk(self) -> dict:
+        """
+                Get the public JSON Web Key for this key.
+
+                :return: The JWK dictionary.
+                """
+        if self.algorithm == "RS256":
+            jwk = json.loads(RSAAlgorithm.to_jwk(self.public_key))
+        else:
+            numbers = self.public_key.public_numbers()
+            jwk = {
+                "kty": "EC",
+                "crv": "P-256",
+                "x": base64url_encode(numbers.x.to_bytes(32, "big")).decode("ascii"),
+                "y": base64url_encode(numbers.y.to_bytes(32, "big")).decode("ascii"),
+            }
+        return {**jwk, "kid": self.kid, "alg": self.algorithm, "use": "sig"}
+
+
+class KeyRing:
+    def __init__(self, keys=(), active_kid: str = None, legacy_secret: str = None, legacy_algorithm: str = None):
+        """
+                The set of keys used to sign and verify JWTs.
+
+                Tokens are signed with the active key and carry its ``kid`` header; any key in the
+                ring verifies tokens with a matching ``kid``. Tokens without a ``kid`` are checked
+                against the legacy HMAC secret, which also signs tokens when the ring has no
+                private keys.
+
+                :param keys: The :class:`SigningKey` objects.
+                :param active_kid: The ID of the signing key, defaults to the last key with a private part.
+                :param legacy_secret: The shared HMAC secret, or None to reject tokens without ``kid``.
+                :param legacy_algorithm: The HMAC algorithm for the legacy secret.
+                """
+        self.keys = {key.kid: key for key in keys}
+        signing = [key for key in keys if key.private_key is not None]
+        if active_kid is not None:
+            if active_kid not in self.keys or self.keys[active_kid].private_key is None:
+                raise ValueError(f"No private key with kid {active_kid!r}")
+            self.active = self.keys[active_kid]
+        else:
+            self.active = signing[-1] if signing else None
+        if self.active is None and legacy_secret is None:
+            raise ValueError("Key ring has no signing key")
+        self.legacy_secret = legacy_secret
+        self.legacy_algorithm = legacy_algorithm
+
+    @classmethod
+    def from_directory(cls, path, active_kid: str = None, **kwargs) -> "KeyRing":
+        """
+                Load every ``<kid>.pem`` key in a directory, in ``kid`` order.
+
+                :param path: The directory holding the PEM files.
+                :param active_kid: The ID of the signing key, defaults to the last private key.
+                :return: The key ring.
+                """
+        keys = [SigningKey.from_pem(file.stem, file.read_bytes()) for file in sorted(Path(path).glob("*.pem"))]
+        return cls(keys, active_kid=active_kid, **kwargs)
+
+    def encode(self, payload: dict) -> str:
+        """
+                Sign a JWT with the active key.
+
+                :param payload: The claims.
+                :return: The encoded token.
+                """
+        if self.active is None:
+            token = jwt.encode(payload, self.legacy_secret, algorithm=self.legacy_algorithm)
+        else:
+            token = jwt.encode(payload, self.active.private_key, algorithm=self.active.algorithm,
+                               headers={"kid": self.active.kid})
+        return token.decode("utf-8") if isinstance(token, bytes) else token
+
+    def decode(self, token: str) -> dict:
+        """
+                Verify a JWT and return its claims.
+
+                :param token: The encoded token.
+                :return: The claims.
+                :raises jwt.PyJWTError: If the token is invalid, expired or signed by an unknown key.
+                """
+        kid = jwt.get_unverified_header(token).get("kid")
+        if kid is None:
+            if self.legacy_secret is None:
+                raise jwt.InvalidTokenError("Token has no key ID")
+            return jwt.decode(token, self.legacy_secret, algorithms=[self.legacy_algorithm])
+        key = self.keys.get(kid)
+        if key is None:
+            raise jwt.InvalidTokenError(f"Unknown key ID {kid!r}")
+        return jwt.decode(token, key.public_key, algorithms=[key.algorithm])
+
+    def jwks(self) -> dict:
+        """
+                Get the JSON Web Key Set with the public part of every key.
+
+                :return: The JWKS document.
+                """
+        return {"keys": [key.jwk() for key in self.keys.values()]}
+
+
+def generate_key(path, kid: str, algorithm: str = "RS256") -> Path:
+    """
+        Generate a new private key file for rotation.
+
+        :param path: The key directory.
+        :param kid: The key ID, used as the file name.
+        :param algorithm: ``RS256`` or ``ES256``.
+        :return: The path of the written PEM file.
+        """
+    if algorithm == "RS256":
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    else:
+        private_key = ec.generate_private_key(ec.SECP256R1())
+    file = Path(path) / f"{kid}.pem"
+    file.parent.mkdir(parents=True, exist_ok=True)
+    file.write_bytes(private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ))
+    file.chmod(0o600)
+    return file
+
+
+def load_key_ring(config: Settings = None) -> KeyRing:
+    """
+        Build the application key ring from settings.
+
+        :param config: The settings, defaults to the application settings.
+        :return: The key ring.
+        """
+    config = config or settings
+    legacy = {"legacy_secret": config.secret_key, "legacy_algorithm": config.algorithm}
+    if config.jwt_keys_dir and not config.jwt_accept_legacy:
+        legacy = {}
+    if not config.jwt_keys_dir:
+        return KeyRing(**legacy)
+    return KeyRing.from_directory(config.jwt_keys_dir, active_kid=config.jwt_active_kid, **legacy)
+
+
+class LazyKeyRing:
+    def __init__(self):
+        """
+                Stands in for the application :class:`KeyRing`, loading it from settings on first use.
+                """
+        self._ring = None
+
+    def load(self, config: Settings = None):
+        """
+                Load (or reload) the key ring.
+
+                :param config: The settings, defaults to the application settings.
+                """
+        self._ring = load_key_ring(config)
+
+    def reset(self):
+        """
+                Drop the loaded key ring, so the next use loads it from the current settings.
+                """
+        self._ring = None
+
+    def __getattr__(self, name):
+        if self._ring is None:
+            self.load()
+        return getattr(self._ring, name)
+
+
+key_ring = LazyKeyRing()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a JWT signing key.")
+    parser.add_argument("kid", help="Key ID, for example the date of the rotation")
+    parser.add_argument("--dir", default=settings.jwt_keys_dir or "keys", help="Key directory")
+    parser.add_argument("--algorithm", choices=["RS256", "ES256"], default="RS256")
+    args = parser.parse_args()
+    print(generate_key(args.dir, args.kid, args.algorithm))
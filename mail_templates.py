@@ -0,0 +1,99 @@
+from pathlib import Path
+
+from jinja2 import BaseLoader, Environment, FileSystemLoader, TemplateNotFound, select_autoescape
+
+
+TEMPLATE_FOLDER = Path(__file__).parent / "templates"
+
+
+def _compile(environment: Environment, source: str, name: str, filename: str):
+    code = environment.compile(source, name, filename)
+    return environment.template_class.from_code(environment, code, environment.globals)
+
+
+class TemplateRenderer:
+    def __init__(self, loader: BaseLoader = None, default_locale: str = "en", static: dict = None):
+        """
+                Renders email templates from a cache of compiled templates.
+
+                A template is looked up as ``<locale>/<name>`` first and ``<name>`` second, compiled
+                once and cached per ``(locale, name)``; later renders skip the loader, the file
+                system and the Jinja compiler entirely. :meth:`precompile` fills the cache at
+                startup.
+
+                ``static`` holds values that are the same for every message, per locale (the key
+                None applies to all locales). They fill ``[[ name ]]`` placeholders once, before
+                the template is compiled, so that part of the output is already rendered text
+                when messages are sent. ``{{ name }}`` placeholders are rendered per message as
+                usual.
+
+                :param loader: The Jinja loader, defaults to the ``templates/`` folder.
+                :param default_locale: The locale used when a render does not name one.
+                :param static: Static values by locale, for example ``{None: {"team": "Support"}}``.
+                """
+        self.environment = Environment(loader=loader or FileSystemLoader(TEMPLATE_FOLDER),
+                                       autoescape=select_autoescape(["html"]), auto_reload=False)
+        self.static_environment = Environment(variable_start_string="[[", variable_end_string="]]",
+                                              block_start_string="[%", block_end_string="%]",
+                                              autoescape=select_autoescape(["html"]), keep_trailing_newline=True)
+        self.default_locale = default_locale
+        self.static = static or {}
+        self._templates = {}
+
+    def _load(self, name: str, locale: str):
+        for candidate in (f"{locale}/{name}", name):
+            try:
+                source, filename, _ = self.environment.loader.get_source(self.environment, candidate)
+            except TemplateNotFound:
+                continue
+            if "[[" in source or "[%" in source:
+                static = {**self.static.get(None, {}), **self.static.get(locale, {})}
+                source = _compile(self.static_environment, source, candidate, filename).render(static)
+            return _compile(self.environment, source, candidate, filename)
+        raise TemplateNotFound(name)
+
+    def get_template(self, name: str, locale: str = None):
+        """
+                Get a compiled template from the cache, compiling it on first use.
+
+                :param name: The template file name.
+                :param locale: The locale, defaults to ``default_locale``.
+                :return: The compiled Jinja template.
+                :raises jinja2.TemplateNotFound: If neither the localized nor the default template exists.
+                """
+        key = (locale or self.default_locale, name)
+        template = self._templates.get(key)
+        if template is None:
+            template = self._templates[key] = self._load(name, key[0])
+        return template
+
+    def render(self, name: str, context: dict, locale: str = None) -> str:
+        """
+                Render a template.
+
+                :param name: The template file name.
+                :param context: The per-message template variables.
+                :param locale: The locale, defaults to ``default_locale``.
+                :return: The rendered text.
+                """
+        return self.get_template(name, locale).render(context)
+
+    def precompile(self, locales=()):
+        """
+                Compile every template for the default locale and the given locales.
+
+                :param locales: Extra locales to compile.
+                """
+        names = {name.split("/", 1)[-1] for name in self.environment.list_templates()}
+        for locale in {self.default_locale, *locales}:
+            for name in names:
+                self.get_template(name, locale)
+
+    def clear(self):
+        """
+                Drop every compiled template, so changed files are picked up on next use.
+                """
+        self._templates.clear()
+
+
+renderer = TemplateRenderer()
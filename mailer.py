@@ -0,0 +1,371 @@
+import asyncio
+import json
+import logging
+import random
+import signal
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from email.utils import formataddr
+
+import aiosmtplib
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import Settings, settings
+from database import SessionLocal
+from mail_templates import renderer
+from models import OutgoingEmail
+
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_email(db: AsyncSession, recipient: str, subject: str, template_name: str,
+                  template_body: dict) -> OutgoingEmail:
+    """
+        Add an email to the outbox.
+
+        The caller commits the session, so the email is stored in the same transaction as
+        the change that triggered it and is sent by :class:`MailWorker` once committed.
+
+        :param db: The database session.
+        :param recipient: The recipient's email address.
+        :param subject: The subject line.
+        :param template_name: The template file in ``templates/``.
+        :param template_body: The template variables; values that are not JSON types are stored as strings.
+        :return: The queued email.
+        """
+    email = OutgoingEmail(recipient=recipient, subject=subject, template_name=template_name,
+                          template_body=json.dumps(template_body, default=str))
+    db.add(email)
+    return email
+
+
+async def outbox_depth(db: AsyncSession) -> dict:
+    """
+        Count the emails that are not sent yet.
+
+        :param db: The database session.
+        :return: The number of ``pending`` and ``failed`` emails.
+        """
+    depth = {"pending": 0, "failed": 0}
+    result = await db.execute(
+        select(OutgoingEmail.status, func.count())
+        .where(OutgoingEmail.status.in_(tuple(depth)))
+        .group_by(OutgoingEmail.status)
+    )
+    depth.update(result.tuples().all())
+    return depth
+
+
+def render_message(email: OutgoingEmail, sender: str, sender_name: str = None) -> EmailMessage:
+    """
+        Render a queued email into a MIME message.
+
+        :param email: The queued email.
+        :param sender: The sender's email address.
+        :param sender_name: The sender's display name.
+        :return: The message, ready to send.
+        """
+    html = renderer.render(email.template_name, json.loads(email.template_body))
+    message = EmailMessage()
+    message["From"] = formataddr((sender_name, sender)) if sender_name else sender
+    message["To"] = email.recipient
+    message["Subject"] = email.subject
+    message.set_content(html, subtype="html")
+    return message
+
+
+class SMTPPool:
+    def __init__(self, hostname: str, port: int, username: str = None, password: str = None,
+                 use_tls: bool = False, start_tls: bool = False, validate_certs: bool = True,
+                 size: int = 4, timeout: float = 30):
+        """
+                A bounded pool of persistent SMTP connections.
+
+                At most ``size`` messages are sent at once, each over its own connection.
+                Connections are kept open between messages, so the TLS handshake and login
+                happen once per connection rather than once per email. A connection that
+                fails is closed and replaced on the next send.
+
+                :param hostname: The SMTP server.
+                :param port: The SMTP port.
+                :param username: The login, or None to send without authentication.
+                :param password: The password.
+                :param use_tls: Whether to connect with implicit TLS.
+                :param start_tls: Whether to upgrade a plain connection with STARTTLS.
+                :param validate_certs: Whether to verify the server certificate.
+                :param size: The maximum number of open connections.
+                :param timeout: Seconds before a network operation fails.
+                """
+        self.options = {
+            "hostname": hostname,
+            "port": port,
+            "username": username,
+            "password": password,
+            "use_tls": use_tls,
+            "start_tls": start_tls,
+            "validate_certs": validate_certs,
+            "timeout": timeout,
+        }
+        self.size = size
+        self.connects = 0
+        self._idle = []
+        self._slots = asyncio.Semaphore(size)
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        client = aiosmtplib.SMTP(**self.options)
+        await client.connect()
+        self.connects += 1
+        return client
+
+    async def send(self, message: EmailMessage):
+        """
+                Send a message over a pooled connection.
+
+                A reused connection that the server has dropped is replaced once before the
+                error is raised.
+
+                :param message: The message to send.
+                :raises aiosmtplib.SMTPException: If the server rejects the message.
+                :raises OSError: If the server cannot be reached.
+                """
+        async with self._slots:
+            client = self._idle.pop() if self._idle else None
+            try:
+                if client is not None and client.is_connected:
+                    try:
+                        await client.send_message(message)
+                    except aiosmtplib.SMTPServerDisconnected:
+                        client.close()
+                        client = None
+                    else:
+                        self._idle.append(client)
+                        return
+                client = await self._connect()
+                await client.send_message(message)
+            except (aiosmtplib.SMTPException, OSError):
+                if client is not None:
+                    client.close()
+                raise
+            self._idle.append(client)
+
+    async def close(self):
+        """
+                Close every idle connection.
+                """
+        idle, self._idle = self._idle, []
+        for client in idle:
+            try:
+                await client.quit()
+            except (aiosmtplib.SMTPException, OSError):
+                client.close()
+
+
+def create_smtp_pool(config: Settings) -> SMTPPool:
+    """
+        Create the SMTP connection pool from settings.
+
+        :param config: The application settings.
+        :return: The SMTP pool.
+        """
+    return SMTPPool(
+        hostname=config.mail_server,
+        port=config.mail_port,
+        username=config.mail_username or None,
+        password=config.mail_password or None,
+        use_tls=config.mail_ssl_tls,
+        start_tls=config.mail_starttls and not config.mail_ssl_tls,
+        validate_certs=config.mail_validate_certs,
+        size=config.mail_pool_size,
+    )
+
+
+class MailWorker:
+    def __init__(self, pool: SMTPPool, session_factory=SessionLocal, batch_size: int = 50,
+                 max_attempts: int = 8, retry_base: float = 30.0, retry_max: float = 3600.0,
+                 lease_seconds: float = 300.0, poll_interval: float = 2.0,
+                 sender: str = None, sender_name: str = None):
+        """
+                Drains the email outbox.
+
+                Each batch is claimed by pushing ``next_attempt_at`` forward by ``lease_seconds``,
+                with ``FOR UPDATE SKIP LOCKED`` on PostgreSQL so several workers never claim the
+                same email. If a worker dies mid-batch its emails become due again when the lease
+                expires, and are marked failed instead of claimed once they have used up
+                ``max_attempts``. Messages are sent through ``pool``, which limits concurrency.
+                Failed emails are retried with exponential backoff and jitter until
+                ``max_attempts``; a permanent (5xx) rejection or an email that cannot be rendered
+                fails at once.
+
+                :param pool: The SMTP connection pool.
+                :param session_factory: Creates database sessions.
+                :param batch_size: The maximum number of emails claimed at once.
+                :param max_attempts: The number of attempts before an email is marked failed.
+                :param retry_base: Seconds before the first retry; doubled on each attempt.
+                :param retry_max: The maximum seconds between retries.
+                :param lease_seconds: Seconds a claimed email stays reserved for this worker.
+                :param poll_interval: Seconds to sleep when the outbox is empty.
+                :param sender: The sender's email address, defaults to ``settings.mail_from``.
+                :param sender_name: The sender's display name, defaults to ``settings.mail_from_name``.
+                """
+        self.pool = pool
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.sender = sender or settings.mail_from
+        self.sender_name = settings.mail_from_name if sender_name is None else sender_name
+
+    def retry_delay(self, attempts: int) -> float:
+        """
+                Get the delay before the next attempt.
+
+                :param attempts: The number of attempts made so far.
+                :return: Seconds to wait, between half and all of the capped exponential delay.
+                """
+        delay = min(self.retry_max, self.retry_base * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    async def claim_batch(self):
+        """
+                Reserve a batch of due emails for this worker.
+
+                Due emails that have used up ``max_attempts`` (left behind by a worker that died
+                mid-batch) are marked failed first.
+
+                :return: The claimed emails, with ``attempts`` already incremented.
+                """
+        now = datetime.utcnow()
+        exhausted = (
+            update(OutgoingEmail)
+            .where(OutgoingEmail.status == "pending", OutgoingEmail.next_attempt_at <= now,
+                   OutgoingEmail.attempts >= self.max_attempts)
+            .values(status="failed")
+            .execution_options(synchronize_session=False)
+        )
+        due = (
+            select(OutgoingEmail.id)
+            .where(OutgoingEmail.status == "pending", OutgoingEmail.next_attempt_at <= now)
+            .order_by(OutgoingEmail.next_attempt_at, OutgoingEmail.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        stmt = (
+            update(OutgoingEmail)
+            .where(OutgoingEmail.id.in_(due.scalar_subquery()))
+            .values(attempts=OutgoingEmail.attempts + 1,
+                    next_attempt_at=now + timedelta(seconds=self.lease_seconds))
+            .returning(OutgoingEmail)
+            .execution_options(synchronize_session=False)
+        )
+        async with self.session_factory() as db:
+            await db.execute(exhausted)
+            emails = (await db.scalars(stmt)).all()
+            await db.commit()
+        return emails
+
+    async def _deliver(self, email: OutgoingEmail):
+        try:
+            message = render_message(email, self.sender, self.sender_name)
+        except Exception as err:
+            # A bad template or payload fails the same way on every attempt.
+            logger.exception("Email %s cannot be rendered", email.id)
+            return f"{type(err).__name__}: {err}", True
+        try:
+            await self.pool.send(message)
+        except aiosmtplib.SMTPResponseException as err:
+            return f"{err.code} {err.message}", err.code >= 500
+        except (aiosmtplib.SMTPException, OSError) as err:
+            return str(err) or type(err).__name__, False
+        except Exception as err:
+            logger.exception("Sending email %s failed", email.id)
+            return f"{type(err).__name__}: {err}", True
+        return None, False
+
+    async def run_once(self) -> int:
+        """
+                Claim one batch, send it and record the results.
+
+                :return: The number of emails claimed.
+                """
+        emails = await self.claim_batch()
+        if not emails:
+            return 0
+        results = await asyncio.gather(*(self._deliver(email) for email in emails))
+
+        now = datetime.utcnow()
+        async with self.session_factory() as db:
+            sent = [email.id for email, (error, _) in zip(emails, results) if error is None]
+            if sent:
+                await db.execute(
+                    update(OutgoingEmail).where(OutgoingEmail.id.in_(sent))
+                    .values(status="sent", sent_at=now, last_error=None)
+                    .execution_options(synchronize_session=False)
+                )
+            for email, (error, permanent) in zip(emails, results):
+                if error is None:
+                    continue
+                logger.warning("Sending email %s to %s failed (attempt %s): %s",
+                               email.id, email.recipient, email.attempts, error)
+                if permanent or email.attempts >= self.max_attempts:
+                    values = {"status": "failed"}
+                else:
+                    values = {"next_attempt_at": now + timedelta(seconds=self.retry_delay(email.attempts))}
+                await db.execute(
+                    update(OutgoingEmail).where(OutgoingEmail.id == email.id)
+                    .values(last_error=error[:500], **values)
+                    .execution_options(synchronize_session=False)
+                )
+            await db.commit()
+        return len(emails)
+
+    async def run(self, stop: asyncio.Event):
+        """
+                Drain the outbox until ``stop`` is set, then close the SMTP connections.
+
+                A batch that fails, for example because the database is unreachable, is logged
+                and retried after ``poll_interval``.
+
+                :param stop: Set to finish the current batch and exit.
+                """
+        try:
+            while not stop.is_set():
+                try:
+                    claimed = await self.run_once()
+                except Exception:
+                    logger.exception("Mail batch failed, retrying in %s s", self.poll_interval)
+                    claimed = 0
+                if claimed < self.batch_size:
+                    try:
+                        await asyncio.wait_for(stop.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            await self.pool.close()
+
+
+async def main():
+    renderer.precompile()
+    worker = MailWorker(
+        create_smtp_pool(settings),
+        batch_size=settings.mail_batch_size,
+        max_attempts=settings.mail_max_attempts,
+        retry_base=settings.mail_retry_base,
+        retry_max=settings.mail_retry_max,
+        lease_seconds=settings.mail_lease_seconds,
+        poll_interval=settings.mail_poll_interval,
+    )
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await worker.run(stop)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,198 @@
+import time
+from contextvars import ContextVar
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, REGISTRY, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from sqlalchemy import event
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0)
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route.",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_PROGRESS = Gauge("http_requests_in_progress", "HTTP requests being handled.")
+REQUEST_DB_QUERIES = Histogram(
+    "http_request_db_queries", "Database queries run while handling one HTTP request.",
+    ["route"], buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100),
+)
+REQUEST_DB_SECONDS = Histogram(
+    "http_request_db_seconds", "Time spent in database queries while handling one HTTP request.",
+    ["route"], buckets=LATENCY_BUCKETS,
+)
+DB_QUERY_DURATION = Histogram("db_query_duration_seconds", "Database query latency.", buckets=LATENCY_BUCKETS)
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled database connection.",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0),
+)
+PASSWORD_HASH_DURATION = Histogram(
+    "password_hash_duration_seconds", "bcrypt hashing and verification time, including the process pool hop.",
+    ["operation"], buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 2.5, 5.0),
+)
+SLOW_QUERIES = Counter("db_slow_queries", "Database queries slower than the slow query threshold.")
+REPEATED_QUERY_REQUESTS = Counter(
+    "http_requests_repeated_queries", "HTTP requests that ran one statement more times than the repeated-query threshold.",
+    ["route"],
+)
+EMAIL_OUTBOX = Gauge("email_outbox_emails", "Emails in the outbox that are not sent yet.", ["status"])
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+_request_stats: ContextVar = ContextVar("request_stats", default=None)
+
+
+def current_request_stats():
+    """
+        Get the database accounting of the HTTP request being handled.
+
+        :return: The :class:`RequestStats` of the current request, or None outside a request.
+        """
+    return _request_stats.get()
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        """
+                ASGI middleware that records the latency and database use of every HTTP request.
+
+                Requests are labelled with the route template (``/contacts/{contact_id}``), not the
+                raw path, so the number of series stays bounded. Unmatched paths share the
+                ``unmatched`` label.
+
+                :param app: The ASGI application to wrap.
+                """
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        REQUESTS_IN_PROGRESS.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            REQUESTS_IN_PROGRESS.dec()
+            _request_stats.reset(token)
+            route = scope.get("route")
+            route = getattr(route, "path", "unmatched")
+            REQUEST_DURATION.labels(scope["method"], route, status_code).observe(elapsed)
+            REQUEST_DB_QUERIES.labels(route).observe(stats.queries)
+            REQUEST_DB_SECONDS.labels(route).observe(stats.db_seconds)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    DB_QUERY_DURATION.observe(elapsed)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+
+
+def instrument_engine(engine):
+    """
+        Time every query run by an engine and charge it to the current HTTP request.
+
+        :param engine: An ``AsyncEngine`` or ``Engine``.
+        """
+    sync_engine = getattr(engine, "sync_engine", engine)
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class StatsCollector:
+    def __init__(self, pool_stats, hashing, rate_limits, cache):
+        """
+                Exposes the counters the application already keeps as Prometheus metrics.
+
+                The values are read when ``/metrics`` is scraped, so nothing is added to the
+                request path.
+
+                :param pool_stats: Returns the database pool statistics, see :func:`database.pool_stats`.
+                :param hashing: The :class:`hashing.HashingService`.
+                :param rate_limits: The :class:`rate_limit.RateLimitRegistry`.
+                :param cache: The :class:`cache.ContactCache`.
+                """
+        self.pool_stats = pool_stats
+        self.hashing = hashing
+        self.rate_limits = rate_limits
+        self.cache = cache
+
+    def describe(self):
+        # Without this the registry calls collect() on registration, which would create the engine.
+        return []
+
+    def collect(self):
+        pool = self.pool_stats()
+        if "size" in pool:
+            connections = GaugeMetricFamily("db_pool_connections", "Database pool connections by state.",
+                                            labels=["state"])
+            for state in ("checked_in", "checked_out", "overflow"):
+                connections.add_metric([state], pool[state])
+            yield connections
+            yield GaugeMetricFamily("db_pool_size", "Configured database pool size.", value=pool["size"])
+        if "timeouts" in pool:
+            yield CounterMetricFamily("db_pool_timeouts", "Database pool checkouts that timed out.",
+                                      value=pool["timeouts"])
+
+        hashing = self.hashing.stats()
+        yield GaugeMetricFamily("password_hash_queue_depth", "Password hashing jobs waiting or running.",
+                                value=hashing["queue_depth"])
+        yield CounterMetricFamily("password_hash_rejected", "Password hashing jobs rejected by a full queue.",
+                                  value=hashing["rejected"])
+
+        requests = CounterMetricFamily("rate_limit_requests", "Requests checked by each rate limit.",
+                                       labels=["limit", "result"])
+        keys = GaugeMetricFamily("rate_limit_keys", "Rate limit buckets held by this worker.", labels=["limit"])
+        rate_limits = self.rate_limits.stats()
+        for name, limit in rate_limits["limits"].items():
+            requests.add_metric([name, "allowed"], limit["allowed"])
+            requests.add_metric([name, "rejected"], limit["rejected"])
+            keys.add_metric([name], limit["keys"])
+        yield requests
+        yield keys
+        yield GaugeMetricFamily("rate_limit_redis_available", "Whether the last rate limit sync with Redis succeeded.",
+                                value=int(rate_limits["redis_available"]))
+        yield CounterMetricFamily("rate_limit_sync_errors", "Failed rate limit syncs with Redis.",
+                                  value=rate_limits["sync_errors"])
+
+        cache = self.cache.stats()
+        lookups = CounterMetricFamily("contact_cache_lookups", "Contact cache lookups by result.", labels=["result"])
+        for result in ("hits", "misses", "coalesced"):
+            lookups.add_metric([result], cache[result])
+        yield lookups
+
+
+def render(registry=REGISTRY):
+    """
+        Render every metric in the Prometheus text format.
+
+        :param registry: The Prometheus registry.
+        :return: The response body and its content type.
+        """
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -1,25 +1,76 @@
-from sqlalchemy import Column, Integer, String, Date, DateTime, Boolean, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Computed, DDL, Integer, SmallInteger, String, Text, Date, DateTime, Boolean, \
+    ForeignKey, Index, event
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.sql import func
+from sqlalchemy.sql.expression import FunctionElement
 from database import Base
 from pydantic import BaseModel, EmailStr
-from datetime import timedelta
+from datetime import datetime, timedelta
+from typing import Optional
 
 
+SEARCH_DOCUMENT = "lower(coalesce(first_name, '') || ' ' || coalesce(last_name, '') || ' ' || coalesce(email, ''))"
+
+
+class birthday_key(FunctionElement):
+    """
+        SQL expression for ``month * 100 + day`` of ``birth_date`` (e.g. 1231 for 31 December).
+        """
+    type = SmallInteger()
+    inherit_cache = True
+
+
+@compiles(birthday_key)
+def _birthday_key_default(element, compiler, **kw):
+    return "CAST(EXTRACT(MONTH FROM birth_date) * 100 + EXTRACT(DAY FROM birth_date) AS SMALLINT)"
+
+
+@compiles(birthday_key, "sqlite")
+def _birthday_key_sqlite(element, compiler, **kw):
+    return "CAST(strftime('%m%d', birth_date) AS INTEGER)"
+
 
 class Contact(Base):
     """
-        Database model for contacts.
+        Database model for contacts, each owned by a user.
         """
     __tablename__ = "contacts"
 
     id = Column(Integer, primary_key=True, index=True)
-    first_name = Column(String, index=True)
-    last_name = Column(String, index=True)
-    email = Column(String, unique=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
+    first_name = Column(String)
+    last_name = Column(String)
+    email = Column(String)
     phone_number = Column(String)
     birth_date = Column(Date)
+    birthday = deferred(Column(SmallInteger, Computed(birthday_key(), persisted=True)))
     extra_data = Column(String, nullable=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    search_document = deferred(Column(String, Computed(SEARCH_DOCUMENT, persisted=True)))
+
+    __table_args__ = (
+        Index("ix_contacts_user_id_email", "user_id", "email", unique=True),
+        Index("ix_contacts_user_id_id", "user_id", "id"),
+        Index("ix_contacts_user_id_first_name_id", "user_id", "first_name", "id"),
+        Index("ix_contacts_user_id_last_name_id", "user_id", "last_name", "id"),
+        Index("ix_contacts_user_id_birth_date_id", "user_id", "birth_date", "id"),
+        Index("ix_contacts_user_id_birthday_id", "user_id", "birthday", "id"),
+        Index("ix_contacts_user_id_search_document_trgm", "user_id", "search_document", postgresql_using="gin",
+              postgresql_ops={"search_document": "gin_trgm_ops"}).ddl_if(dialect="postgresql"),
+    )
+
+
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS btree_gin").execute_if(dialect="postgresql"),
+)
 
 class User(Base):
     """
@@ -32,7 +83,7 @@ class User(Base):
     email = Column(String, unique=True, index=True)
     hashed_password = Column(String)
     confirmed = Column(Boolean, default=False)
-    verification_tokens = relationship("VerificationToken", back_populates="user")
+    verification_tokens = relationship("VerificationToken", back_populates="user", lazy="raise_on_sql")
     avatar_url = Column(String)
 
 class UserCreate(BaseModel):
@@ -51,12 +102,26 @@ class UserResponse(BaseModel):
     username: str
     email: str
 
+class CurrentUser(BaseModel):
+    """
+        Pydantic model for the authenticated user resolved from an access token.
+        """
+    id: int
+    username: str
+    email: str
+    confirmed: Optional[bool] = None
+    avatar_url: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
 class TokenResponse(BaseModel):
     """
         Pydantic model for token response.
         """
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
 
 class VerificationToken(Base):
     """
@@ -71,6 +136,28 @@ class VerificationToken(Base):
 
     user = relationship("User", back_populates="verification_tokens")
 
+class OutgoingEmail(Base):
+    """
+        Database model for queued outbound emails.
+        """
+    __tablename__ = "email_outbox"
+
+    id = Column(Integer, primary_key=True)
+    recipient = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    template_name = Column(String, nullable=False)
+    template_body = Column(Text, nullable=False)
+    status = Column(String, nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_error = Column(String)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_email_outbox_status_next_attempt_at", "status", "next_attempt_at"),
+    )
+
 class RequestEmail(BaseModel):
     """
         Pydantic model for email requests.
@@ -0,0 +1,214 @@
+import logging
+import random
+import re
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+from metrics import REPEATED_QUERY_REQUESTS, SLOW_QUERIES
+
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile-queries"
+
+_PLACEHOLDERS = re.compile(r"(?:\$\d+|\?|%s|%\(\w+\)s)(?:\s*,\s*(?:\$\d+|\?|%s|%\(\w+\)s))*")
+
+
+def statement_shape(statement: str) -> str:
+    """
+        Normalize a statement so that executions differing only in parameters compare equal.
+
+        Whitespace is collapsed and every list of bind placeholders becomes a single ``?``,
+        so ``IN`` lists of different lengths have the same shape.
+
+        :param statement: The SQL sent to the database.
+        :return: The statement shape.
+        """
+    return _PLACEHOLDERS.sub("?", " ".join(statement.split()))
+
+
+class QueryProfile:
+    __slots__ = ("debug", "queries", "seconds", "shapes")
+
+    def __init__(self, debug: bool = False):
+        self.debug = debug
+        self.queries = 0
+        self.seconds = 0.0
+        self.shapes = {}
+
+
+_profile: ContextVar = ContextVar("query_profile", default=None)
+
+
+class QueryProfiler:
+    def __init__(self, slow_query_ms: float = 200.0, explain_rate: float = 0.1, repeat_threshold: int = 10,
+                 header_enabled: bool = False):
+        """
+                Logs slow queries with their plans and flags requests that repeat a statement.
+
+                A query slower than ``slow_query_ms`` is logged as a warning. For a sample of slow
+                SELECTs (``explain_rate``) the plan is captured too, by running the statement again
+                under ``EXPLAIN (ANALYZE, BUFFERS)`` on PostgreSQL or ``EXPLAIN QUERY PLAN`` on
+                SQLite. On PostgreSQL this happens inside a savepoint, so a failed ``EXPLAIN``
+                leaves the transaction usable.
+
+                Within a request, statements are counted by :func:`statement_shape`; a shape run
+                more than ``repeat_threshold`` times is logged once at the end of the request as
+                a likely N+1 query.
+
+                With ``header_enabled``, a request sent with ``X-Profile-Queries: 1`` logs every
+                query with its plan and gets ``X-DB-Queries`` and ``X-DB-Time-Ms`` response headers.
+                This runs every SELECT twice, so enable it only where that is acceptable.
+
+                :param slow_query_ms: The slow query threshold in milliseconds; 0 disables the log.
+                :param explain_rate: The fraction of slow SELECTs logged with their plan.
+                :param repeat_threshold: The number of runs of one statement allowed per request; 0 disables.
+                :param header_enabled: Whether the profiling request header is honoured.
+                """
+        self.slow_seconds = slow_query_ms / 1000
+        self.explain_rate = explain_rate
+        self.repeat_threshold = repeat_threshold
+        self.header_enabled = header_enabled
+
+    def attach(self, engine):
+        """
+                Profile every query run by an engine.
+
+                :param engine: An ``AsyncEngine`` or ``Engine``.
+                """
+        sync_engine = getattr(engine, "sync_engine", engine)
+        event.listen(sync_engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def begin(self, debug: bool = False):
+        """
+                Start profiling the queries of the current request.
+
+                :param debug: Whether to log every query of the request with its plan.
+                :return: The new :class:`QueryProfile` and the token to pass to :meth:`end`.
+                """
+        profile = QueryProfile(debug)
+        return profile, _profile.set(profile)
+
+    def end(self, token, method: str, route: str) -> QueryProfile:
+        """
+                Stop profiling the current request and report repeated statements.
+
+                :param token: The token returned by :meth:`begin`.
+                :param method: The HTTP method, for the log.
+                :param route: The route template, for the log and metrics.
+                :return: The finished profile.
+                """
+        profile = _profile.get()
+        _profile.reset(token)
+        if self.repeat_threshold:
+            repeated = {shape: count for shape, count in profile.shapes.items() if count > self.repeat_threshold}
+            if repeated:
+                REPEATED_QUERY_REQUESTS.labels(route).inc()
+            for shape, count in repeated.items():
+                logger.warning("%s %s ran the same statement %d times (possible N+1 query): %s",
+                               method, route, count, shape)
+        return profile
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("profile_start", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["profile_start"].pop()
+        profile = _profile.get()
+        debug = False
+        if profile is not None:
+            debug = profile.debug
+            profile.queries += 1
+            profile.seconds += elapsed
+            if self.repeat_threshold:
+                shape = statement_shape(statement)
+                profile.shapes[shape] = profile.shapes.get(shape, 0) + 1
+
+        slow = self.slow_seconds and elapsed >= self.slow_seconds
+        if not slow and not debug:
+            return
+        if slow:
+            SLOW_QUERIES.inc()
+        plan = None
+        if not executemany and statement.lstrip()[:6].upper() == "SELECT" and (
+                debug or random.random() < self.explain_rate):
+            plan = self.explain(conn, statement, parameters)
+        logger.log(logging.WARNING if slow else logging.INFO, "%s query took %.1f ms: %s%s",
+                   "Slow" if slow else "Profiled", elapsed * 1000, statement, f"\n{plan}" if plan else "")
+
+    def explain(self, conn, statement: str, parameters):
+        """
+                Get the plan of a statement on the same connection and transaction.
+
+                :param conn: The SQLAlchemy connection that ran the statement.
+                :param statement: The SQL that was run.
+                :param parameters: Its bind parameters.
+                :return: The plan as text, or None if the dialect is not supported or ``EXPLAIN`` failed.
+                """
+        dialect = conn.dialect.name
+        if dialect == "postgresql":
+            prefix = "EXPLAIN (ANALYZE, BUFFERS) "
+        elif dialect == "sqlite":
+            prefix = "EXPLAIN QUERY PLAN "
+        else:
+            return None
+        savepoint = dialect == "postgresql"
+        cursor = conn.connection.cursor()
+        try:
+            if savepoint:
+                cursor.execute("SAVEPOINT query_profiler")
+            cursor.execute(prefix + statement, parameters)
+            rows = cursor.fetchall()
+            if savepoint:
+                cursor.execute("RELEASE SAVEPOINT query_profiler")
+        except conn.dialect.dbapi.Error as err:
+            if savepoint:
+                cursor.execute("ROLLBACK TO SAVEPOINT query_profiler")
+            logger.warning("Could not capture the query plan: %s", err)
+            return None
+        finally:
+            cursor.close()
+        return "\n".join(str(row[-1]) for row in rows)
+
+
+class QueryProfilingMiddleware:
+    def __init__(self, app, profiler: QueryProfiler = None):
+        """
+                ASGI middleware that profiles the queries of each HTTP request.
+
+                :param app: The ASGI application to wrap.
+                :param profiler: The profiler, defaults to :data:`query_profiler`.
+                """
+        self.app = app
+        self.profiler = profiler or query_profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        debug = self.profiler.header_enabled and dict(scope["headers"]).get(PROFILE_HEADER) in (b"1", b"true")
+        if not debug and not self.profiler.repeat_threshold:
+            await self.app(scope, receive, send)
+            return
+
+        profile, token = self.profiler.begin(debug)
+
+        async def send_with_summary(message):
+            if debug and message["type"] == "http.response.start":
+                message = {**message, "headers": [
+                    *message.get("headers", []),
+                    (b"x-db-queries", str(profile.queries).encode()),
+                    (b"x-db-time-ms", f"{profile.seconds * 1000:.1f}".encode()),
+                ]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_summary)
+        finally:
+            self.profiler.end(token, scope["method"], getattr(scope.get("route"), "path", "unmatched"))
+
+
+query_profiler = QueryProfiler()
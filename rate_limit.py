@@ -0,0 +1,281 @@
+import asyncio
+import ipaddress
+import logging
+import math
+import time
+from collections import OrderedDict
+
+import jwt
+from fastapi import HTTPException, Request, status
+from redis.exceptions import RedisError
+
+from jwt_keys import key_ring
+
+
+logger = logging.getLogger(__name__)
+
+
+def trusted_networks(value: str) -> tuple:
+    """
+        Parse a comma-separated list of proxy addresses and networks.
+
+        :param value: For example ``"127.0.0.1, 10.0.0.0/8"``.
+        :return: The networks, as ``ipaddress`` network objects.
+        """
+    return tuple(ipaddress.ip_network(item.strip(), strict=False) for item in value.split(",") if item.strip())
+
+
+def _is_trusted(address: str, trusted_proxies) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in trusted_proxies)
+
+
+def client_ip(request: Request, trusted_proxies=()) -> str:
+    """
+        Get the rate limit key for the client's IP address.
+
+        ``X-Forwarded-For`` is only read when the peer is a trusted proxy, and then from the
+        right: the client is the right-most address not added by a trusted proxy. Anything to
+        its left was sent by the client and could be forged.
+
+        :param request: The HTTP request.
+        :param trusted_proxies: The networks of the reverse proxies in front of the app.
+        :return: The client address.
+        """
+    address = request.client.host if request.client else "unknown"
+    if not _is_trusted(address, trusted_proxies):
+        return address
+    forwarded = [hop.strip() for header in request.headers.getlist("X-Forwarded-For")
+                 for hop in header.split(",") if hop.strip()]
+    for hop in reversed(forwarded):
+        address = hop
+        if not _is_trusted(hop, trusted_proxies):
+            break
+    return address
+
+
+def user_or_ip(request: Request, trusted_proxies=()) -> str:
+    """
+        Get the rate limit key for the authenticated user, falling back to the client's IP.
+
+        :param request: The HTTP request.
+        :param trusted_proxies: The networks of the reverse proxies in front of the app.
+        :return: ``user:<email>`` for a valid bearer token, otherwise ``ip:<address>``.
+        """
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        try:
+            subject = key_ring.decode(token).get("sub")
+        except jwt.PyJWTError:
+            subject = None
+        if subject:
+            return f"user:{subject}"
+    return f"ip:{client_ip(request, trusted_proxies)}"
+
+
+KEY_FUNCS = {
+    "ip": client_ip,
+    "user": user_or_ip,
+}
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated", "pending")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+        self.pending = 0
+
+
+class RateLimiter:
+    def __init__(self, registry: "RateLimitRegistry", name: str, times: int, seconds: int, key: str = "ip"):
+        """
+                A token bucket rate limit usable as a FastAPI dependency.
+
+                Each worker keeps one bucket per key holding up to ``times`` tokens, refilled at
+                ``times / seconds`` tokens per second, and answers from it without a network
+                call. Consumed tokens are counted and pushed to Redis in batches by the
+                registry; the global count for the current window then caps the local bucket,
+                so a client cannot get ``times`` requests from every worker. A worker learns
+                about other workers' use of a key when it next syncs a request for that key.
+
+                :param registry: The registry that owns the Redis connection.
+                :param name: The name of the limit, used in Redis keys and metrics.
+                :param times: The number of requests allowed per period.
+                :param seconds: The period in seconds.
+                :param key: ``ip`` to limit per client address, ``user`` to limit per authenticated user.
+                """
+        self.registry = registry
+        self.name = name
+        self.times = times
+        self.seconds = seconds
+        self.rate = times / seconds
+        self.key_func = KEY_FUNCS[key]
+        self.allowed = 0
+        self.rejected = 0
+        self._buckets = OrderedDict()
+
+    def hit(self, key: str, now: float = None) -> float:
+        """
+                Take one token from the bucket of ``key``.
+
+                :param key: The rate limit key.
+                :param now: The current monotonic time, for tests.
+                :return: 0 if the request is allowed, otherwise seconds until a token is available.
+                """
+        now = time.monotonic() if now is None else now
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.times, now)
+            while len(self._buckets) > self.registry.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            bucket.tokens = min(self.times, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+            self._buckets.move_to_end(key)
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            bucket.pending += 1
+            self.allowed += 1
+            return 0.0
+        self.rejected += 1
+        return (1 - bucket.tokens) / self.rate
+
+    async def __call__(self, request: Request):
+        retry_after = self.hit(self.key_func(request, self.registry.trusted_proxies))
+        await self.registry.reconcile()
+        if retry_after:
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too Many Requests",
+                                headers={"Retry-After": str(math.ceil(retry_after))})
+
+    async def sync(self, client):
+        """
+                Push locally consumed tokens to Redis and cap local buckets by the global count.
+
+                :param client: A ``redis.asyncio.Redis`` client.
+                """
+        flushed = [(key, bucket, bucket.pending) for key, bucket in self._buckets.items() if bucket.pending]
+        if not flushed:
+            return
+        window = int(time.time() // self.seconds)
+        async with client.pipeline(transaction=False) as pipe:
+            for key, _, pending in flushed:
+                redis_key = f"ratelimit:{self.name}:{key}:{window}"
+                pipe.incrby(redis_key, pending)
+                pipe.expire(redis_key, self.seconds * 2)
+            results = await pipe.execute()
+        for (_, bucket, pending), total in zip(flushed, results[::2]):
+            bucket.pending -= pending
+            bucket.tokens = min(bucket.tokens, max(0, self.times - int(total)))
+
+    def stats(self) -> dict:
+        """
+                Get allowed and rejected request counters.
+
+                :return: A dictionary of rate limit metrics.
+                """
+        return {"allowed": self.allowed, "rejected": self.rejected, "keys": len(self._buckets)}
+
+
+class RateLimitRegistry:
+    def __init__(self, sync_interval: float = 1.0, max_keys: int = 100000, trusted_proxies=()):
+        """
+                Creates rate limiters and reconciles them with Redis.
+
+                ``sync_interval`` trades accuracy for latency: with 0 every request waits for one
+                Redis round trip, otherwise requests never wait and counts are pushed in the
+                background at most once per interval, so a client may exceed a limit by what it
+                sends to each worker within one interval. Without a Redis client, or while Redis
+                is unreachable, limits are enforced per worker only.
+
+                :param sync_interval: Seconds between background syncs with Redis.
+                :param max_keys: The maximum number of buckets kept per limiter.
+                :param trusted_proxies: The proxy networks whose ``X-Forwarded-For`` is believed, see :func:`client_ip`.
+                """
+        self.sync_interval = sync_interval
+        self.max_keys = max_keys
+        self.trusted_proxies = trusted_proxies
+        self.client = None
+        self.limiters = []
+        self.syncs = 0
+        self.sync_errors = 0
+        self.redis_available = False
+        self._last_sync = 0.0
+        self._task = None
+
+    def limiter(self, times: int, seconds: int, key: str = "ip", name: str = None) -> RateLimiter:
+        """
+                Create a rate limiter.
+
+                :param times: The number of requests allowed per period.
+                :param seconds: The period in seconds.
+                :param key: ``ip`` or ``user``.
+                :param name: The name of the limit, defaults to its position in the registry.
+                :return: The rate limiter, to use as ``Depends(limiter)``.
+                """
+        limiter = RateLimiter(self, name or f"limit{len(self.limiters)}", times, seconds, key)
+        self.limiters.append(limiter)
+        return limiter
+
+    async def reconcile(self):
+        """
+                Sync with Redis if the interval has passed, in the background unless the interval is 0.
+                """
+        if self.client is None:
+            return
+        if self.sync_interval <= 0:
+            await self.sync()
+            return
+        now = time.monotonic()
+        if now - self._last_sync < self.sync_interval or (self._task is not None and not self._task.done()):
+            return
+        self._last_sync = now
+        self._task = asyncio.create_task(self.sync())
+
+    async def sync(self):
+        """
+                Push every limiter's pending counts to Redis.
+                """
+        try:
+            for limiter in self.limiters:
+                await limiter.sync(self.client)
+        except (RedisError, OSError) as err:
+            if self.redis_available or not self.sync_errors:
+                logger.warning("Rate limit sync failed, enforcing local limits only: %s", err)
+            self.sync_errors += 1
+            self.redis_available = False
+        else:
+            self.syncs += 1
+            self.redis_available = True
+
+    async def flush(self):
+        """
+                Wait for a background sync in progress, then push the remaining counts to Redis.
+
+                Called on shutdown so the requests a worker admitted last still count for the others.
+                """
+        if self._task is not None:
+            await self._task
+            self._task = None
+        if self.client is not None:
+            await self.sync()
+
+    def stats(self) -> dict:
+        """
+                Get per-limiter counters and the state of the Redis sync.
+
+                :return: A dictionary of rate limit metrics.
+                """
+        return {
+            "redis_available": self.redis_available,
+            "syncs": self.syncs,
+            "sync_errors": self.sync_errors,
+            "limits": {limiter.name: limiter.stats() for limiter in self.limiters},
+        }
+
+
+rate_limits = RateLimitRegistry()
@@ -0,0 +1,124 @@
+import uuid
+from datetime import datetime, timedelta
+
+import jwt
+
+from cache import LocalCacheBackend
+from jwt_keys import key_ring
+
+
+class RefreshTokenError(Exception):
+    """
+        Raised when a refresh token is invalid, expired or revoked.
+        """
+
+
+class RefreshTokenReused(RefreshTokenError):
+    """
+        Raised when a refresh token that was already rotated is presented again.
+        """
+
+
+class RefreshTokenStore:
+    def __init__(self, backend=None, ttl_minutes: int = 1440):
+        """
+                Issues, rotates and revokes refresh tokens.
+
+                Every refresh token carries a ``jti`` and the user's generation at issue time.
+                The store keeps ``refresh:<jti>`` for each live token with the token's lifetime
+                as TTL, so checking for revocation is one key lookup and revoking a token is one
+                delete. Bumping the per-user ``refresh:generation:<sub>`` counter revokes every
+                token of that user at once.
+
+                Tokens are single-use: :meth:`rotate` marks the token used and issues a new one.
+                Presenting a used token again means it was copied, so every token of that user
+                is revoked.
+
+                Validation only reads the backend, never the database. The backend must raise on
+                errors (:class:`cache.RedisStoreBackend`, not the fail-open
+                :class:`cache.RedisCacheBackend`), so that an outage rejects refreshes and
+                logouts instead of accepting reused or revoked tokens.
+
+                :param backend: The cache backend holding token state, defaults to :class:`cache.LocalCacheBackend`.
+                :param ttl_minutes: The lifetime of a refresh token in minutes.
+                """
+        self.backend = backend or LocalCacheBackend()
+        self.ttl = ttl_minutes * 60
+
+    async def generation(self, subject: str) -> int:
+        """
+                Get the current token generation of a user.
+
+                :param subject: The token subject (the user's email).
+                :return: The generation number.
+                """
+        return int(await self.backend.get(f"refresh:generation:{subject}") or 0)
+
+    async def issue(self, subject: str) -> str:
+        """
+                Issue a new refresh token.
+
+                :param subject: The token subject (the user's email).
+                :return: The encoded refresh token.
+                """
+        jti = uuid.uuid4().hex
+        payload = {
+            "sub": subject,
+            "jti": jti,
+            "gen": await self.generation(subject),
+            "type": "refresh",
+            "exp": datetime.utcnow() + timedelta(seconds=self.ttl),
+        }
+        await self.backend.set(f"refresh:{jti}", subject, self.ttl)
+        return key_ring.encode(payload)
+
+    def _claims(self, token: str) -> dict:
+        try:
+            claims = key_ring.decode(token)
+        except jwt.ExpiredSignatureError:
+            raise RefreshTokenError("Refresh token has expired")
+        except jwt.PyJWTError:
+            raise RefreshTokenError("Invalid refresh token")
+        if claims.get("type") != "refresh" or not claims.get("jti") or not claims.get("sub"):
+            raise RefreshTokenError("Invalid refresh token")
+        return claims
+
+    async def rotate(self, token: str):
+        """
+                Use a refresh token: verify it, mark it used and issue its replacement.
+
+                :param token: The encoded refresh token.
+                :return: A ``(subject, new_refresh_token)`` tuple.
+                :raises RefreshTokenReused: If the token was already used; all tokens of the user are revoked.
+                :raises RefreshTokenError: If the token is invalid, expired or revoked.
+                """
+        claims = self._claims(token)
+        subject, jti = claims["sub"], claims["jti"]
+        if await self.backend.get(f"refresh:{jti}") != subject:
+            raise RefreshTokenError("Refresh token has been revoked")
+        if claims.get("gen") != await self.generation(subject):
+            raise RefreshTokenError("Refresh token has been revoked")
+        if not await self.backend.add(f"refresh:used:{jti}", "1", self.ttl):
+            await self.revoke_all(subject)
+            raise RefreshTokenReused("Refresh token has already been used")
+        return subject, await self.issue(subject)
+
+    async def revoke(self, token: str):
+        """
+                Revoke one refresh token.
+
+                :param token: The encoded refresh token.
+                :raises RefreshTokenError: If the token is invalid or expired.
+                """
+        await self.backend.delete(f"refresh:{self._claims(token)['jti']}")
+
+    async def revoke_all(self, subject: str):
+        """
+                Revoke every refresh token of a user ("log out everywhere").
+
+                :param subject: The token subject (the user's email).
+                """
+        await self.backend.incr(f"refresh:generation:{subject}")
+
+
+refresh_tokens = RefreshTokenStore()
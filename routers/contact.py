@@ -1,118 +1,326 @@
-from fastapi import APIRouter, HTTPException, Depends, status, Security, BackgroundTasks, Request
-from fastapi_limiter.depends import RateLimiter
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, HTTPException, Depends, status, Security, BackgroundTasks, Query, Request, Response, \
+    Header
+from fastapi.responses import StreamingResponse
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+import contact_io
 import crud
 import models
+from models import CurrentUser
 import schemas
-from database import get_db, SessionLocal
+from auth import get_current_user
+from cache import contact_cache, pack_page, unpack_page
+from config import settings
+from database import get_db
+from etags import contact_etag, etag_matches, if_match_versions, payload_etag
+from rate_limit import rate_limits
+from serializers import dump_contact, dump_contacts, json_response
 from datetime import datetime, timedelta
-from typing import List
-from fastapi_limiter import FastAPILimiter
+from typing import List, Literal, Optional
 
 
 
 router = APIRouter()
 
+create_contact_limit = rate_limits.limiter(times=10, seconds=60, key="user", name="create_contact")
+
+
+def _versions(if_match: Optional[str], contact_id: int):
+    return None if if_match is None else if_match_versions(if_match, contact_id)
+
+
 @router.post("/contacts/", response_model=schemas.Contact, description='No more than 10 requests per minute',
-             dependencies=[Depends(RateLimiter(times=10, seconds=60))])
-def create_contact(contact: dict, limit: int = 100, db: Session = Depends(get_db)):
+             dependencies=[Depends(create_contact_limit)])
+async def create_contact(contact: schemas.ContactCreate, db: AsyncSession = Depends(get_db),
+                         current_user: CurrentUser = Depends(get_current_user)):
     """
         Create a new contact.
 
         :param contact: Contact details.
-        :param limit: Rate limit for creating contacts.
         :param db: Database session.
+        :param current_user: The authenticated user, owner of the contacts.
         :return: Created contact.
         """
-    return crud.create_contact(db, contact, limit)
+    db_contact = await crud.create_contact(db, current_user.id, contact)
+    await contact_cache.invalidate(current_user.id)
+    return json_response(dump_contact(db_contact), headers={"ETag": contact_etag(db_contact)})
+
+@router.post("/contacts/import", response_model=schemas.ImportReport)
+async def import_contacts(request: Request, format: Optional[Literal["csv", "ndjson"]] = None,
+                          db: AsyncSession = Depends(get_db),
+                          current_user: CurrentUser = Depends(get_current_user)):
+    """
+        Import contacts from a CSV or NDJSON request body.
+
+        The body is streamed and written in batches, so uploads of any size use bounded
+        memory. CSV uploads need a header row naming the contact fields. Rows that fail
+        validation or whose email already exists are listed in the report. A line longer
+        than ``settings.import_max_line_length`` stops the import with 413, and an upload
+        that is not UTF-8 with 400.
+
+        :param request: The HTTP request carrying the upload.
+        :param format: ``csv`` or ``ndjson``; detected from the Content-Type when omitted.
+        :param db: Database session.
+        :param current_user: The authenticated user, owner of the contacts.
+        :return: Counts of inserted, skipped and failed rows with per-row errors.
+        """
+    if format is None:
+        content_type = request.headers.get("content-type", "")
+        format = "csv" if "csv" in content_type else "ndjson"
+    report = None
+    try:
+        report = await contact_io.import_contacts(db, current_user.id, request.stream(), format)
+    except contact_io.LineTooLongError as err:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(err))
+    except contact_io.UploadEncodingError as err:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(err))
+    finally:
+        # A failed import may have committed batches before it stopped.
+        if report is None or report.inserted:
+            await contact_cache.invalidate(current_user.id)
+    return report
 
 @router.get("/contacts/", response_model=List[schemas.Contact])
-def read_contacts(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
+async def read_contacts(skip: int = 0, limit: int = 10, cursor: Optional[str] = None,
+                        sort: schemas.ContactSortKey = "id", if_none_match: Optional[str] = Header(None),
+                        db: AsyncSession = Depends(get_db),
+                        current_user: CurrentUser = Depends(get_current_user)):
     """
         Get a list of contacts.
 
+        Pass the ``X-Next-Cursor`` header of a page back as ``cursor`` to fetch the next page
+        with keyset pagination; ``skip`` and ``sort`` are ignored when a cursor is given.
+        The header is omitted on the last page. Pages are served from the contact cache
+        with a strong ``ETag``; a matching ``If-None-Match`` gets 304 Not Modified.
+
         :param skip: Number of contacts to skip.
         :param limit: Number of contacts to retrieve.
+        :param cursor: Opaque cursor returned by the previous page.
+        :param sort: Column to order by; ties are broken by ID.
+        :param if_none_match: ETags of the client's cached copy.
         :param db: Database session.
+        :param current_user: The authenticated user, owner of the contacts.
         :return: List of contacts.
         """
-    contacts = crud.get_contacts(db, skip=skip, limit=limit)
-    return contacts
+    async def load():
+        nonlocal sort
+        if cursor:
+            try:
+                sort = crud.decode_cursor(cursor)[0]
+                contacts = await crud.get_contacts_after(db, current_user.id, cursor, limit=limit)
+            except ValueError as err:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(err))
+        else:
+            contacts = await crud.get_contacts(db, current_user.id, skip=skip, limit=limit, sort=sort)
+        next_cursor = crud.encode_cursor(sort, contacts[-1]) if contacts and len(contacts) == limit else None
+        body = dump_contacts(contacts).decode()
+        return pack_page(body, next_cursor, payload_etag(body))
+
+    params = f"{cursor}:{limit}" if cursor else f"{sort}:{skip}:{limit}"
+    body, next_cursor, etag = unpack_page(await contact_cache.get_contacts(current_user.id, params, load))
+    headers = {"ETag": etag}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return json_response(body, headers=headers)
+
+@router.get("/contacts/export")
+async def export_contacts(format: Literal["csv", "ndjson"] = "csv",
+                          current_user: CurrentUser = Depends(get_current_user)):
+    """
+        Export all contacts of the current user as a streamed CSV or NDJSON download.
+
+        :param format: ``csv`` or ``ndjson``.
+        :param current_user: The authenticated user, owner of the contacts.
+        :return: A streaming response with one row per contact.
+        """
+    return StreamingResponse(
+        contact_io.export_contacts(current_user.id, format),
+        media_type=contact_io.EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="contacts.{format}"'},
+    )
+
+@router.patch("/contacts/bulk", response_model=schemas.BulkResult)
+async def bulk_update_contacts(body: schemas.ContactBulkUpdate, db: AsyncSession = Depends(get_db),
+                               current_user: CurrentUser = Depends(get_current_user)):
+    """
+        Update many contacts at once.
+
+        Contacts are selected by ``ids`` or by ``filter``; only the fields present in
+        ``values`` are changed. The update is all or nothing: setting an ``email`` that
+        would be shared by two of the owner's contacts changes nothing and answers 409.
+
+        :param body: The selection and the values to set.
+        :param db: Database session.
+        :param current_user: The authenticated user, owner of the contacts.
+        :return: The number and IDs of the updated contacts.
+        """
+    try:
+        ids = await crud.bulk_update_contacts(db, current_user.id, body.values.model_dump(exclude_unset=True),
+                                              ids=body.ids, contact_filter=body.filter)
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Contact with this email already exists")
+    await contact_cache.invalidate(current_user.id)
+    return schemas.BulkResult(count=len(ids), ids=ids)
+
+@router.delete("/contacts/bulk", response_model=schemas.BulkResult)
+async def bulk_delete_contacts(body: schemas.ContactBulkDelete, db: AsyncSession = Depends(get_db),
+                               current_user: CurrentUser = Depends(get_current_user)):
+    """
+        Delete many contacts at once.
+
+        :param body: The selection, by ``ids`` or by ``filter``.
+        :param db: Database session.
+        :param current_user: The authenticated user, owner of the contacts.
+        :return: The number and IDs of the deleted contacts.
+        """
+    ids = await crud.bulk_delete_contacts(db, current_user.id, ids=body.ids, contact_filter=body.filter)
+    await contact_cache.invalidate(current_user.id)
+    return schemas.BulkResult(count=len(ids), ids=ids)
 
 @router.get("/contacts/{contact_id}", response_model=schemas.Contact)
-def read_contact(contact_id: int, db: Session = Depends(get_db)):
+async def read_contact(contact_id: int, if_none_match: Optional[str] = Header(None),
+                       db: AsyncSession = Depends(get_db),
+                       current_user: CurrentUser = Depends(get_current_user)):
     """
-        Get details of a specific contact.
+        Get details of a specific contact, served from the contact cache.
+
+        The ``ETag`` is the contact's ID and row version; a matching ``If-None-Match`` gets
+        304 Not Modified, without a database query while the contact is cached.
 
         :param contact_id: ID of the contact.
+        :param if_none_match: ETags of the client's cached copy.
         :param db: Database session.
+        :param current_user: The authenticated user, owner of the contacts.
         :return: Contact details.
         """
-    contact = crud.get_contact(db, contact_id)
-    if contact is None:
+    async def load():
+        contact = await crud.get_contact(db, current_user.id, contact_id)
+        return None if contact is None else pack_page(dump_contact(contact).decode(), etag=contact_etag(contact))
+
+    value = await contact_cache.get_contact(current_user.id, contact_id, load)
+    if value is None:
         raise HTTPException(status_code=404, detail="Contact not found")
-    return contact
+    payload, _, etag = unpack_page(value)
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    return json_response(payload, headers={"ETag": etag})
 
 @router.put("/contacts/{contact_id}", response_model=schemas.Contact)
-def update_contact(contact_id: int, contact: schemas.ContactUpdate, db: Session = Depends(get_db)):
+async def update_contact(contact_id: int, contact: schemas.ContactUpdate, if_match: Optional[str] = Header(None),
+                         db: AsyncSession = Depends(get_db),
+                         current_user: CurrentUser = Depends(get_current_user)):
     """
         Update details of a specific contact.
 
         :param contact_id: ID of the contact.
         :param contact: Updated contact details.
+        :param if_match: If given, only update when the contact still has one of these ETags.
         :param db: Database session.
+        :param current_user: The authenticated user, owner of the contacts.
         :return: Updated contact details.
         """
-    updated_contact = crud.update_contact(db, contact_id, contact)
+    try:
+        updated_contact = await crud.update_contact(db, current_user.id, contact_id, contact,
+                                                     versions=_versions(if_match, contact_id))
+    except crud.VersionMismatch as err:
+        raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail=str(err))
     if updated_contact is None:
         raise HTTPException(status_code=404, detail="Contact not found")
-    return updated_contact
+    await contact_cache.invalidate(current_user.id)
+    return json_response(dump_contact(updated_contact), headers={"ETag": contact_etag(updated_contact)})
+
+@router.patch("/contacts/{contact_id}", response_model=schemas.Contact)
+async def patch_contact(contact_id: int, contact: schemas.ContactPatch, if_match: Optional[str] = Header(None),
+                        db: AsyncSession = Depends(get_db),
+                        current_user: CurrentUser = Depends(get_current_user)):
+    """
+        Change some details of a specific contact.
+
+        Only the fields present in the body are written, in one statement that also
+        returns the updated contact.
+
+        :param contact_id: ID of the contact.
+        :param contact: The fields to change.
+        :param if_match: If given, only update when the contact still has one of these ETags.
+        :param db: Database session.
+        :param current_user: The authenticated user, owner of the contacts.
+        :return: Updated contact details.
+        """
+    try:
+        patched_contact = await crud.patch_contact(db, current_user.id, contact_id, contact.model_dump(exclude_unset=True),
+                                                   versions=_versions(if_match, contact_id))
+    except crud.VersionMismatch as err:
+        raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail=str(err))
+    if patched_contact is None:
+        raise HTTPException(status_code=404, detail="Contact not found")
+    await contact_cache.invalidate(current_user.id)
+    return json_response(dump_contact(patched_contact), headers={"ETag": contact_etag(patched_contact)})
 
 @router.delete("/contacts/{contact_id}", response_model=schemas.Contact)
-def delete_contact(contact_id: int, db: Session = Depends(get_db)):
+async def delete_contact(contact_id: int, if_match: Optional[str] = Header(None), db: AsyncSession = Depends(get_db),
+                         current_user: CurrentUser = Depends(get_current_user)):
     """
         Delete a specific contact.
 
         :param contact_id: ID of the contact to delete.
+        :param if_match: If given, only delete when the contact still has one of these ETags.
         :param db: Database session.
+        :param current_user: The authenticated user, owner of the contacts.
         :return: Deleted contact details.
         """
-    deleted_contact = crud.delete_contact(db, contact_id)
+    try:
+        deleted_contact = await crud.delete_contact(db, current_user.id, contact_id, versions=_versions(if_match, contact_id))
+    except crud.VersionMismatch as err:
+        raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail=str(err))
     if deleted_contact is None:
         raise HTTPException(status_code=404, detail="Contact not found")
-    return deleted_contact
+    await contact_cache.invalidate(current_user.id)
+    return json_response(dump_contact(deleted_contact))
 
 @router.get("/contacts/search/", response_model=List[schemas.Contact])
-def search_contacts(query: str, db: Session = Depends(get_db)):
+async def search_contacts(query: str = Query(..., min_length=1), skip: int = Query(0, ge=0),
+                          limit: int = Query(20, ge=1, le=100), db: AsyncSession = Depends(get_db),
+                          current_user: CurrentUser = Depends(get_current_user)):
     """
         Search for contacts based on a query.
 
-        :param query: Search query.
+        :param query: Search query; every word must occur in the contact's name or email.
+        :param skip: Number of results to skip.
+        :param limit: Maximum number of results to return (at most 100).
         :param db: Database session.
-        :return: List of matching contacts.
+        :param current_user: The authenticated user, owner of the contacts.
+        :return: List of matching contacts, best matches first.
         """
-    contacts = crud.search_contacts(db, query)
-    return contacts
+    contacts = await crud.search_contacts(db, current_user.id, query, skip=skip, limit=limit)
+    return json_response(dump_contacts(contacts))
 
 
 @router.get("/contacts/birthdays/", response_model=List[schemas.Contact])
-def upcoming_birthdays(db: Session = Depends(get_db)):
+async def upcoming_birthdays(days: Optional[int] = Query(None, ge=0, le=366), db: AsyncSession = Depends(get_db),
+                             current_user: CurrentUser = Depends(get_current_user)):
     """
         Get upcoming birthdays.
 
+        Results are kept in the contact cache with the owner's list pages, so any write to
+        the owner's contacts invalidates them in every worker.
+
+        :param days: Number of days ahead to look, defaults to the configured window.
         :param db: Database session.
-        :return: List of contacts with upcoming birthdays.
+        :param current_user: The authenticated user, owner of the contacts.
+        :return: List of contacts with upcoming birthdays, soonest first.
         """
-    contacts = crud.get_upcoming_birthdays(db)
-    return contacts
+    days = settings.birthday_window_days if days is None else days
+    today = datetime.now().date()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+    async def load():
+        return dump_contacts(await crud.get_upcoming_birthdays(db, current_user.id, days=days, today=today)).decode()
 
+    body = await contact_cache.get_contacts(current_user.id, f"birthdays:{today.isoformat()}:{days}", load,
+                                            ttl=settings.birthday_cache_ttl)
+    return json_response(body)
 
 
 # Додайте інші маршрути для CRUD операцій та додаткових функціональних вимог.
@@ -1,5 +1,8 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, TypeAdapter, model_validator
 from datetime import date
+from typing import List, Literal, Optional
+
+ContactSortKey = Literal["id", "first_name", "last_name", "email", "birth_date"]
 
 class ContactBase(BaseModel):
     first_name: str
@@ -7,7 +10,7 @@ class ContactBase(BaseModel):
     email: str
     phone_number: str
     birth_date: date
-    extra_data: str = None
+    extra_data: Optional[str] = None
 
 class ContactCreate(ContactBase):
     pass
@@ -19,4 +22,75 @@ class Contact(ContactBase):
     id: int
 
     class Config:
-        orm_mode = True
+        from_attributes = True
+
+
+ContactList = TypeAdapter(List[Contact])
+
+
+class ContactPatch(BaseModel):
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    email: Optional[str] = None
+    phone_number: Optional[str] = None
+    birth_date: Optional[date] = None
+    extra_data: Optional[str] = None
+
+    @model_validator(mode="after")
+    def check_required_not_null(self):
+        for name in self.model_fields_set - {"extra_data"}:
+            if getattr(self, name) is None:
+                raise ValueError(f"{name} cannot be null")
+        return self
+
+class ContactFilter(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    email: Optional[str] = None
+    birth_date_from: Optional[date] = None
+    birth_date_to: Optional[date] = None
+
+    @model_validator(mode="after")
+    def check_not_empty(self):
+        if all(getattr(self, name) is None for name in self.model_fields):
+            raise ValueError("filter needs at least one criterion")
+        return self
+
+class ContactBulkDelete(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    ids: Optional[List[int]] = None
+    filter: Optional[ContactFilter] = None
+
+    @model_validator(mode="after")
+    def check_selection(self):
+        if (self.ids is None) == (self.filter is None):
+            raise ValueError("exactly one of ids or filter is required")
+        return self
+
+class ContactBulkUpdate(ContactBulkDelete):
+    values: ContactPatch
+
+    @model_validator(mode="after")
+    def check_values(self):
+        if not self.values.model_fields_set:
+            raise ValueError("values needs at least one field")
+        return self
+
+class BulkResult(BaseModel):
+    count: int
+    ids: List[int]
+
+
+class ImportRowError(BaseModel):
+    row: int
+    error: str
+
+class ImportReport(BaseModel):
+    inserted: int = 0
+    skipped: int = 0
+    failed: int = 0
+    errors: List[ImportRowError] = []
+    errors_truncated: bool = False
@@ -0,0 +1,67 @@
+from sqlalchemy import and_, case, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Contact
+
+
+MAX_SEARCH_TERMS = 8
+
+
+def _like_pattern(term: str, prefix: str = "%") -> str:
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"{prefix}{escaped}%"
+
+
+def search_terms(query: str):
+    """
+        Split a search query into lowercase terms.
+
+        :param query: The raw search query.
+        :return: A list of at most ``MAX_SEARCH_TERMS`` terms.
+        """
+    return query.lower().split()[:MAX_SEARCH_TERMS]
+
+
+def _rank(query: str, dialect: str):
+    document = Contact.search_document
+    if dialect == "postgresql":
+        return func.similarity(document, query.lower()).desc()
+    first_term = search_terms(query)[0]
+    return case(
+        (document.like(_like_pattern(first_term, prefix=""), escape="\\"), 0),
+        (document.like(_like_pattern(first_term, prefix="% "), escape="\\"), 1),
+        else_=2,
+    )
+
+
+async def search_contacts(db: AsyncSession, user_id: int, query: str, skip: int = 0, limit: int = 20):
+    """
+        Search the owner's contacts by first name, last name and email.
+
+        A contact matches when every term of the query occurs in its ``search_document``
+        (the lowercased name and email). On PostgreSQL each term is a ``LIKE`` answered
+        by the ``(user_id, search_document)`` trigram GIN index and results are ranked by
+        trigram similarity; other databases run the same predicate and rank prefix matches
+        first, so the matching set is identical on both.
+
+        :param db: The database session.
+        :param user_id: The ID of the owner.
+        :param query: The search query.
+        :param skip: The number of results to skip.
+        :param limit: The maximum number of results to return.
+        :return: A list of matching contacts, best matches first.
+        """
+    terms = search_terms(query)
+    if not terms:
+        return []
+    dialect = db.get_bind().dialect.name
+    stmt = (
+        select(Contact)
+        .where(Contact.user_id == user_id,
+               and_(*(Contact.search_document.like(_like_pattern(term), escape="\\") for term in terms)))
+        .order_by(_rank(query, dialect), Contact.id)
+        .offset(skip)
+        .limit(limit)
+    )
+    result = await db.execute(stmt)
+    return result.scalars().all()
@@ -0,0 +1,53 @@
+import orjson
+from fastapi import Response
+
+import schemas
+
+
+CONTACT_FIELDS = tuple(schemas.Contact.model_fields)
+
+
+def contact_dict(contact) -> dict:
+    """
+        Read the :class:`schemas.Contact` fields of a contact without validating them.
+
+        :param contact: A ``models.Contact`` row or a ``schemas.Contact`` model.
+        :return: A dictionary in the field order of :class:`schemas.Contact`.
+        """
+    return {name: getattr(contact, name) for name in CONTACT_FIELDS}
+
+
+def dump_contact(contact) -> bytes:
+    """
+        Serialize one contact to JSON.
+
+        Rows loaded from the database already have the column types of :class:`schemas.Contact`,
+        so they are encoded directly with orjson instead of being validated into models
+        first. The output matches ``schemas.Contact.model_dump_json()``.
+
+        :param contact: A ``models.Contact`` row or a ``schemas.Contact`` model.
+        :return: The JSON document.
+        """
+    return orjson.dumps(contact_dict(contact))
+
+
+def dump_contacts(contacts) -> bytes:
+    """
+        Serialize a list of contacts to a JSON array.
+
+        :param contacts: ``models.Contact`` rows or ``schemas.Contact`` models.
+        :return: The JSON document.
+        """
+    return orjson.dumps([contact_dict(contact) for contact in contacts])
+
+
+def json_response(content: bytes, status_code: int = 200, headers: dict = None) -> Response:
+    """
+        Wrap serialized JSON in a response, bypassing ``response_model`` processing.
+
+        :param content: The JSON document.
+        :param status_code: The HTTP status code.
+        :param headers: Extra response headers.
+        :return: The response.
+        """
+    return Response(content=content, status_code=status_code, headers=headers, media_type="application/json")
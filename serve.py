@@ -0,0 +1,149 @@
+"""
+Run the application in production: several uvicorn worker processes under gunicorn.
+
+    python serve.py [--workers N] [--bind HOST:PORT]
+
+The app is built once in the master process and the workers are forked from it, so each
+worker starts without importing or configuring anything. ``create_app`` opens no
+connections, so nothing is shared across the fork: each worker creates its own database
+engine on first use and connects to Redis in its lifespan startup.
+
+Resources configured per process are divided between the workers:
+
+- each worker gets an equal share of ``DB_MAX_CONNECTIONS`` (by default
+  ``DB_POOL_SIZE + DB_MAX_OVERFLOW``, what a single process would use), keeping up to
+  ``DB_POOL_SIZE`` connections open and using the rest as overflow;
+- ``HASHING_WORKERS`` (or one per core) bcrypt processes are split between the workers.
+
+On SIGTERM each worker stops accepting connections and finishes its requests for up to
+``SERVER_GRACEFUL_TIMEOUT`` seconds less :data:`SHUTDOWN_SECONDS`, then runs the lifespan
+shutdown: the last rate limit counts are pushed to Redis and the Redis connection, the
+database pool and the hashing processes are closed. Emails are not sent by the web
+workers: they are stored in the outbox with the request's transaction, and the mail
+worker (``python mailer.py``) finishes its current batch on SIGTERM.
+
+Workers are replaced after ``SERVER_MAX_REQUESTS`` requests (plus up to
+``SERVER_MAX_REQUESTS_JITTER``, so they do not all restart together) to bound memory
+growth. Prometheus metrics are kept per worker, so ``/metrics`` (served when
+``STATS_ENDPOINTS`` is set) reports the worker that answered the scrape.
+"""
+import argparse
+import logging
+import os
+
+from gunicorn.app.base import BaseApplication
+from uvicorn.workers import UvicornWorker
+
+from config import Settings, get_settings
+from main import create_app
+
+
+logger = logging.getLogger(__name__)
+
+SHUTDOWN_SECONDS = 5.0
+
+
+def worker_settings(config: Settings, workers: int) -> Settings:
+    """
+        Divide the resource budgets of the settings between worker processes.
+
+        Without ``db_max_connections`` the budget is ``db_pool_size + db_max_overflow``, so
+        the server as a whole opens about as many connections as one process would; every
+        worker gets at least one.
+
+        :param config: The settings for the whole server.
+        :param workers: The number of worker processes.
+        :return: The settings for one worker.
+        :raises ValueError: If ``db_max_connections`` is less than one connection per worker.
+        """
+    if config.db_max_connections:
+        connections = config.db_max_connections // workers
+        if connections < 1:
+            raise ValueError(f"db_max_connections={config.db_max_connections} is less than one connection "
+                             f"for each of {workers} workers")
+    else:
+        connections = max(1, (config.db_pool_size + config.db_max_overflow) // workers)
+    pool_size = min(config.db_pool_size, connections)
+    return config.model_copy(update={
+        "db_pool_size": pool_size,
+        "db_max_overflow": connections - pool_size,
+        "hashing_workers": max(1, (config.hashing_workers or os.cpu_count() or 1) // workers),
+    })
+
+
+class AppWorker(UvicornWorker):
+    """
+        Uvicorn worker that caps concurrent connections and bounds its graceful shutdown.
+
+        Above ``worker_connections`` open connections, new requests get 503 instead of
+        queueing for the database pool. In-flight requests get the graceful timeout less
+        :data:`SHUTDOWN_SECONDS`, which is left for the lifespan shutdown to close the pools
+        before gunicorn kills the worker.
+        """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.config.limit_concurrency = self.cfg.worker_connections
+        self.config.timeout_graceful_shutdown = max(1.0, self.cfg.graceful_timeout - SHUTDOWN_SECONDS)
+
+
+class Server(BaseApplication):
+    def __init__(self, app, options: dict):
+        """
+                Gunicorn application serving an already built ASGI app.
+
+                :param app: The ASGI application, built before the workers are forked.
+                :param options: Gunicorn settings.
+                """
+        self.application = app
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+
+def gunicorn_options(config: Settings, workers: int) -> dict:
+    """
+        Get the gunicorn settings for the server.
+
+        :param config: The settings for the whole server.
+        :param workers: The number of worker processes.
+        :return: Gunicorn settings.
+        """
+    return {
+        "bind": config.server_bind,
+        "workers": workers,
+        "worker_class": AppWorker,
+        "worker_connections": config.server_max_concurrency,
+        "max_requests": config.server_max_requests,
+        "max_requests_jitter": config.server_max_requests_jitter,
+        "graceful_timeout": config.server_graceful_timeout,
+        "preload_app": True,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, help="worker processes (default: SERVER_WORKERS or one per core)")
+    parser.add_argument("--bind", help="address to listen on (default: SERVER_BIND)")
+    args = parser.parse_args()
+
+    config = get_settings()
+    if args.bind:
+        config = config.model_copy(update={"server_bind": args.bind})
+    workers = args.workers or config.server_workers or os.cpu_count() or 1
+    per_worker = worker_settings(config, workers)
+    logger.info("Starting %d workers on %s, each with %d+%d database connections and %d hashing processes",
+                workers, config.server_bind, per_worker.db_pool_size, per_worker.db_max_overflow,
+                per_worker.hashing_workers)
+    Server(create_app(per_worker), gunicorn_options(config, workers)).run()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,60 @@
+import os
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+from cache import contact_cache
+from config import get_settings
+from jwt_keys import key_ring
+from main import configure, create_app
+from rate_limit import rate_limits
+from refresh_tokens import refresh_tokens
+
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+class TestCreateApp(unittest.TestCase):
+    def test_import_needs_no_settings(self):
+        env = {"PATH": os.environ.get("PATH", "")}
+        code = "import config, database, main; assert config._settings is None and database._engine is None"
+        result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+    def test_settings_are_applied(self):
+        original = get_settings()
+        config = original.model_copy(update={"refresh_token_expire_minutes": 5})
+        try:
+            configure(config)
+            self.assertEqual(refresh_tokens.ttl, 300)
+            self.assertIsNone(key_ring._ring)
+            self.assertTrue(key_ring.jwks())
+            self.assertIsNotNone(key_ring._ring)
+            self.assertIs(get_settings(), config)
+        finally:
+            configure(original)
+
+    def test_one_configuration_per_process(self):
+        create_app(get_settings())
+        self.assertIsNotNone(create_app(get_settings().model_copy()))
+        other = get_settings().model_copy(update={"refresh_token_expire_minutes": 5})
+        with self.assertRaises(RuntimeError):
+            create_app(other)
+        self.assertEqual(refresh_tokens.ttl, get_settings().refresh_token_expire_minutes * 60)
+
+    def test_lifespan_closes_redis(self):
+        backends = refresh_tokens.backend, contact_cache.backend
+        try:
+            with TestClient(create_app()) as client:
+                self.assertIsNotNone(rate_limits.client)
+                self.assertEqual(client.get("/.well-known/jwks.json").status_code, 200)
+            self.assertIsNone(rate_limits.client)
+        finally:
+            refresh_tokens.backend, contact_cache.backend = backends
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,16 +1,31 @@
+import tempfile
 import unittest
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import jwt
 from datetime import datetime, timedelta
 from fastapi import HTTPException
 
-from auth import HashPassword, create_user, authenticate_user, get_user_by_email, create_access_token, confirmed_email, create_email_token
+from auth import HashPassword, create_user, authenticate_user, get_user_by_email, create_access_token, confirmed_email, create_email_token, \
+    get_current_user, user_cache
+from hashing import HashingBusyError, HashingService
+from jwt_keys import KeyRing, generate_key, key_ring
 from models import User
 from database import SessionLocal
 
-class TestAuth(unittest.TestCase):
+def mock_async_session(user=None):
+    session = AsyncMock()
+    session.add = MagicMock()
+    session.execute.return_value = MagicMock()
+    session.execute.return_value.scalars.return_value.first.return_value = user
+    return session
+
+
+class TestAuth(unittest.IsolatedAsyncioTestCase):
     def setUp(self):
-        self.mock_session = MagicMock()
-        self.mock_user = User(id=1, username="testuser", email="test@example.com", hashed_password="hashedpassword")
+        self.mock_session = mock_async_session()
+        self.mock_user = User(id=1, username="testuser", email="test@example.com",
+                              hashed_password=HashPassword().hash_password("testpassword"))
 
     def test_hash_password(self):
         hasher = HashPassword()
@@ -24,42 +39,57 @@ class TestAuth(unittest.TestCase):
         result = hasher.verify_password(plain_password, hashed_password)
         self.assertTrue(result)
 
-    @patch("auth.SessionLocal", autospec=True)
-    def test_create_user(self, mock_session_local):
-        mock_session_instance = MagicMock()
-        mock_session_local.return_value = mock_session_instance
-
-        user = create_user("testuser", "test@example.com", "testpassword")
+    async def test_hashing_service_round_trip(self):
+        service = HashingService(workers=1)
+        try:
+            hashed_password = await service.hash_password("test123")
+            self.assertTrue(await service.verify_password("test123", hashed_password))
+            self.assertFalse(await service.verify_password("wrong", hashed_password))
+            stats = service.stats()
+            self.assertEqual(stats["completed"], 3)
+            self.assertEqual(stats["queue_depth"], 0)
+        finally:
+            service.shutdown()
+
+    async def test_hashing_service_rejects_when_queue_is_full(self):
+        service = HashingService(workers=1, max_queue=1, queue_timeout=0.01)
+        await service._slots.acquire()
+        with self.assertRaises(HashingBusyError):
+            await service.hash_password("test123")
+        self.assertEqual(service.stats()["rejected"], 1)
+
+    @patch("auth.SessionLocal")
+    async def test_create_user(self, mock_session_local):
+        mock_session_instance = mock_async_session()
+        mock_session_local.return_value.__aenter__.return_value = mock_session_instance
+
+        user = await create_user("testuser", "test@example.com", "testpassword")
 
         self.assertEqual(user.username, "testuser")
         self.assertEqual(user.email, "test@example.com")
         self.assertTrue(user.hashed_password)
         mock_session_instance.add.assert_called_once()
-        mock_session_instance.commit.assert_called_once()
-        mock_session_instance.refresh.assert_called_once()
+        mock_session_instance.commit.assert_awaited_once()
+        mock_session_instance.refresh.assert_awaited_once()
 
-    @patch("auth.SessionLocal", autospec=True)
-    def test_authenticate_user(self, mock_session_local):
-        mock_session_instance = MagicMock()
-        mock_session_local.return_value = mock_session_instance
-        mock_session_instance.query.return_value.filter_by.return_value.first.return_value = self.mock_user
+    @patch("auth.SessionLocal")
+    async def test_authenticate_user(self, mock_session_local):
+        mock_session_instance = mock_async_session(self.mock_user)
+        mock_session_local.return_value.__aenter__.return_value = mock_session_instance
 
-        user = authenticate_user("test@example.com", "testpassword")
+        user = await authenticate_user("test@example.com", "testpassword")
 
         self.assertEqual(user, self.mock_user)
-        mock_session_instance.query.return_value.filter_by.assert_called_once_with(email="test@example.com")
-        mock_session_instance.close.assert_called_once()
+        mock_session_instance.execute.assert_awaited_once()
+        mock_session_local.return_value.__aexit__.assert_awaited_once()
 
-    @patch("auth.SessionLocal", autospec=True)
-    def test_get_user_by_email(self, mock_session_local):
-        mock_session_instance = MagicMock()
-        mock_session_local.return_value = mock_session_instance
-        mock_session_instance.query.return_value.filter_by.return_value.first.return_value = self.mock_user
+    async def test_get_user_by_email(self):
+        mock_session_instance = mock_async_session(self.mock_user)
 
-        user = get_user_by_email("test@example.com", mock_session_instance)
+        user = await get_user_by_email("test@example.com", mock_session_instance)
 
         self.assertEqual(user, self.mock_user)
-        mock_session_instance.query.return_value.filter_by.assert_called_once_with(email="test@example.com")
+        mock_session_instance.execute.assert_awaited_once()
 
     def test_create_access_token(self):
         data = {"sub": "test@example.com"}
@@ -68,20 +98,93 @@ class TestAuth(unittest.TestCase):
         self.assertTrue(token)
 
     @patch("auth.get_user_by_email", autospec=True)
-    def test_confirmed_email(self, mock_get_user_by_email):
-        mock_session_instance = MagicMock()
+    async def test_confirmed_email(self, mock_get_user_by_email):
+        mock_session_instance = mock_async_session()
         user = User(id=1, username="testuser", email="test@example.com", hashed_password="hashedpassword", confirmed=False)
         mock_get_user_by_email.return_value = user
 
-        confirmed_email("test@example.com", mock_session_instance)
+        await confirmed_email("test@example.com", mock_session_instance)
 
         self.assertTrue(user.confirmed)
-        mock_session_instance.commit.assert_called_once()
+        mock_session_instance.commit.assert_awaited_once()
+
+    async def test_get_current_user_is_cached(self):
+        await user_cache.delete("test@example.com")
+        token = create_access_token({"sub": "test@example.com"}, timedelta(minutes=5))
+        mock_session_instance = mock_async_session(self.mock_user)
+
+        first = await get_current_user(token, mock_session_instance)
+        second = await get_current_user(token, mock_session_instance)
+
+        self.assertEqual(first.email, "test@example.com")
+        self.assertEqual(second, first)
+        mock_session_instance.execute.assert_awaited_once()
+
+    async def test_get_current_user_rejects_invalid_token(self):
+        with self.assertRaises(HTTPException) as ctx:
+            await get_current_user("not-a-token", mock_async_session())
+        self.assertEqual(ctx.exception.status_code, 401)
+
+    async def test_get_current_user_rejects_other_token_types(self):
+        for token in (create_email_token({"sub": "test@example.com"}),
+                      key_ring.encode({"sub": "test@example.com", "type": "refresh", "jti": "x"})):
+            with self.assertRaises(HTTPException) as ctx:
+                await get_current_user(token, mock_async_session(self.mock_user))
+            self.assertEqual(ctx.exception.status_code, 401)
+
+    @patch("auth.get_user_by_email", autospec=True)
+    async def test_confirmed_email_invalidates_cached_user(self, mock_get_user_by_email):
+        mock_get_user_by_email.return_value = self.mock_user
+        await user_cache.set("test@example.com", "cached")
+
+        await confirmed_email("test@example.com", mock_async_session())
+
+        self.assertIsNone(await user_cache.get("test@example.com"))
 
     def test_create_email_token(self):
         data = {"sub": "test@example.com"}
         token = create_email_token(data)
         self.assertTrue(token)
 
+class TestKeyRing(unittest.TestCase):
+    def setUp(self):
+        self.key_dir = tempfile.TemporaryDirectory()
+        generate_key(self.key_dir.name, "2026-01")
+        generate_key(self.key_dir.name, "2026-02", algorithm="ES256")
+
+    def tearDown(self):
+        self.key_dir.cleanup()
+
+    def test_signs_with_newest_key_and_verifies_older_keys(self):
+        old_ring = KeyRing.from_directory(self.key_dir.name, active_kid="2026-01")
+        ring = KeyRing.from_directory(self.key_dir.name)
+
+        token = ring.encode({"sub": "test@example.com"})
+        self.assertEqual(jwt.get_unverified_header(token), {"alg": "ES256", "kid": "2026-02", "typ": "JWT"})
+        self.assertEqual(ring.decode(token)["sub"], "test@example.com")
+        self.assertEqual(ring.decode(old_ring.encode({"sub": "old@example.com"}))["sub"], "old@example.com")
+
+    def test_legacy_tokens(self):
+        legacy_token = KeyRing(legacy_secret="secret", legacy_algorithm="HS256").encode({"sub": "a"})
+        ring = KeyRing.from_directory(self.key_dir.name, legacy_secret="secret", legacy_algorithm="HS256")
+        self.assertEqual(ring.decode(legacy_token)["sub"], "a")
+        with self.assertRaises(jwt.InvalidTokenError):
+            KeyRing.from_directory(self.key_dir.name).decode(legacy_token)
+
+    def test_rejects_unknown_key_id(self):
+        other_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(other_dir.cleanup)
+        generate_key(other_dir.name, "2026-01")
+        token = KeyRing.from_directory(other_dir.name).encode({"sub": "a"})
+        with self.assertRaises(jwt.InvalidTokenError):
+            KeyRing.from_directory(self.key_dir.name).decode(token)
+
+    def test_jwks(self):
+        keys = KeyRing.from_directory(self.key_dir.name).jwks()["keys"]
+        self.assertEqual([(key["kid"], key["alg"], key["kty"]) for key in keys],
+                         [("2026-01", "RS256", "RSA"), ("2026-02", "ES256", "EC")])
+        self.assertNotIn("d", keys[0])
+
+
 if __name__ == '__main__':
     unittest.main()
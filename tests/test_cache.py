@@ -0,0 +1,65 @@
+import asyncio
+import unittest
+
+from cache import ContactCache, LocalCacheBackend, pack_page, unpack_page
+
+
+class TestContactCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.cache = ContactCache(LocalCacheBackend(), ttl=60)
+        self.loads = 0
+
+    async def load(self):
+        self.loads += 1
+        await asyncio.sleep(0.01)
+        return '{"id": 1}'
+
+    async def test_read_through(self):
+        self.assertEqual(await self.cache.get_contact(7, 1, self.load), '{"id": 1}')
+        self.assertEqual(await self.cache.get_contact(7, 1, self.load), '{"id": 1}')
+        self.assertEqual(self.loads, 1)
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    async def test_concurrent_misses_load_once(self):
+        results = await asyncio.gather(*(self.cache.get_contact(7, 1, self.load) for _ in range(10)))
+        self.assertEqual(set(results), {'{"id": 1}'})
+        self.assertEqual(self.loads, 1)
+        self.assertEqual(self.cache.stats()["coalesced"], 9)
+
+    async def test_missing_contact_is_not_cached(self):
+        async def missing():
+            self.loads += 1
+            return None
+
+        self.assertIsNone(await self.cache.get_contact(7, 2, missing))
+        self.assertIsNone(await self.cache.get_contact(7, 2, missing))
+        self.assertEqual(self.loads, 2)
+
+    async def test_invalidate(self):
+        await self.cache.get_contact(7, 1, self.load)
+        await self.cache.get_contacts(7, "id:0:10", self.load)
+        await self.cache.get_contacts(8, "id:0:10", self.load)
+        await self.cache.invalidate(7)
+        await self.cache.get_contact(7, 1, self.load)
+        await self.cache.get_contacts(7, "id:0:10", self.load)
+        await self.cache.get_contacts(8, "id:0:10", self.load)
+        self.assertEqual(self.loads, 5)
+
+    async def test_load_overtaken_by_a_write_is_not_served(self):
+        async def stale_load():
+            await self.cache.invalidate(7)
+            return '{"id": 1, "version": 1}'
+
+        self.assertEqual(await self.cache.get_contact(7, 1, stale_load), '{"id": 1, "version": 1}')
+        self.assertEqual(await self.cache.get_contact(7, 1, self.load), '{"id": 1}')
+        self.assertEqual(self.loads, 1)
+
+    def test_pack_page(self):
+        self.assertEqual(unpack_page(pack_page("[]", "abc")), ("[]", "abc", None))
+        self.assertEqual(unpack_page(pack_page("[]")), ("[]", None, None))
+        self.assertEqual(unpack_page(pack_page('{"a":\n1}', etag='"1-2"')), ('{"a":\n1}', None, '"1-2"'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import base64
+import json
+import unittest
+from datetime import date
+
+from crud import birthday_ranges, decode_cursor, encode_cursor
+from models import Contact
+
+
+class TestCrudHelpers(unittest.TestCase):
+    def test_cursor_round_trip(self):
+        contact = Contact(id=7, last_name="Smith", birth_date=date(1990, 2, 3))
+        self.assertEqual(decode_cursor(encode_cursor("last_name", contact)), ("last_name", "Smith", 7))
+        self.assertEqual(decode_cursor(encode_cursor("birth_date", contact)), ("birth_date", date(1990, 2, 3), 7))
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            decode_cursor("garbage")
+
+    def test_cursor_value_must_fit_the_sort_column(self):
+        for raw in (["last_name", ["x"], 1], ["email", {"a": 1}, 1], ["first_name", 5, 1], ["id", "7", 1],
+                    ["birth_date", 19900101, 1], ["last_name", "x", True]):
+            cursor = base64.urlsafe_b64encode(json.dumps(raw).encode()).decode()
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
+        cursor = base64.urlsafe_b64encode(json.dumps(["last_name", None, 3]).encode()).decode()
+        self.assertEqual(decode_cursor(cursor), ("last_name", None, 3))
+
+    def test_birthday_ranges_within_year(self):
+        self.assertEqual(birthday_ranges(date(2023, 6, 10), 7), [(610, 617)])
+
+    def test_birthday_ranges_wrap_around_new_year(self):
+        self.assertEqual(birthday_ranges(date(2023, 12, 28), 7), [(1228, 1231), (101, 104)])
+
+    def test_birthday_ranges_leap_day_in_common_year(self):
+        self.assertEqual(birthday_ranges(date(2023, 2, 21), 7), [(221, 229)])
+        self.assertEqual(birthday_ranges(date(2024, 2, 21), 7), [(221, 228)])
+        self.assertEqual(birthday_ranges(date(2023, 3, 1), 7), [(301, 308)])
+
+    def test_birthday_ranges_whole_year(self):
+        self.assertEqual(birthday_ranges(date(2023, 6, 10), 366), [(101, 1231)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+
+from jinja2 import DictLoader, TemplateNotFound
+
+from mail_templates import TemplateRenderer
+
+
+class CountingLoader(DictLoader):
+    def __init__(self, mapping):
+        super().__init__(mapping)
+        self.loads = 0
+
+    def get_source(self, environment, template):
+        self.loads += 1
+        return super().get_source(environment, template)
+
+
+class TestTemplateRenderer(unittest.TestCase):
+    def setUp(self):
+        self.loader = CountingLoader({
+            "welcome.html": "<p>[[ team ]]: hi {{ username }}</p>",
+            "uk/welcome.html": "<p>[[ team ]]: привіт {{ username }}</p>",
+            "plain.txt": "hi {{ username }}",
+        })
+        self.renderer = TemplateRenderer(self.loader, static={None: {"team": "Team & Co"}, "uk": {"team": "Команда"}})
+
+    def test_static_part_and_locale_fallback(self):
+        self.assertEqual(self.renderer.render("welcome.html", {"username": "<b>"}),
+                         "<p>Team &amp; Co: hi &lt;b&gt;</p>")
+        self.assertEqual(self.renderer.render("welcome.html", {"username": "Ann"}, locale="uk"),
+                         "<p>Команда: привіт Ann</p>")
+        self.assertEqual(self.renderer.render("plain.txt", {"username": "<b>"}, locale="uk"), "hi <b>")
+
+    def test_compiles_once(self):
+        self.renderer.precompile(locales=["uk"])
+        loads = self.loader.loads
+        for i in range(10):
+            self.renderer.render("welcome.html", {"username": i}, locale="uk")
+            self.renderer.render("plain.txt", {"username": i})
+        self.assertEqual(self.loader.loads, loads)
+
+    def test_missing_template(self):
+        with self.assertRaises(TemplateNotFound):
+            self.renderer.render("missing.html", {})
+
+
+if __name__ == '__main__':
+    unittest.main()
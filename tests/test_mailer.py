@@ -0,0 +1,152 @@
+import asyncio
+import os
+import socket
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from aiosmtpd.controller import Controller
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from database import Base
+from mailer import MailWorker, SMTPPool, enqueue_email
+from models import OutgoingEmail
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class RecordingHandler:
+    def __init__(self, reject=None):
+        self.messages = []
+        self.reject = reject
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.reject:
+            return self.reject
+        self.messages.append(envelope)
+        return "250 OK"
+
+
+class TestMailWorker(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.db_dir = tempfile.TemporaryDirectory()
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(self.db_dir.name, 'outbox.db')}")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.sessions = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+
+        self.handler = RecordingHandler()
+        self.smtp = Controller(self.handler, hostname="127.0.0.1", port=free_port())
+        self.smtp.start()
+        self.pool = SMTPPool("127.0.0.1", self.smtp.port, size=2)
+
+    async def asyncTearDown(self):
+        await self.pool.close()
+        self.smtp.stop()
+        await self.engine.dispose()
+        self.db_dir.cleanup()
+
+    def worker(self, pool=None, **kwargs):
+        return MailWorker(pool or self.pool, session_factory=self.sessions, sender="noreply@example.com",
+                          sender_name="Contacts", **kwargs)
+
+    async def enqueue(self, count):
+        async with self.sessions() as db:
+            for i in range(count):
+                enqueue_email(db, f"user{i}@example.com", "Confirm your email ", "email_template.html",
+                              {"host": "http://testserver/", "username": f"user{i}", "token": "abc"})
+            await db.commit()
+
+    async def outbox(self):
+        async with self.sessions() as db:
+            return (await db.scalars(select(OutgoingEmail).order_by(OutgoingEmail.id))).all()
+
+    async def test_sends_batches_over_pooled_connections(self):
+        await self.enqueue(5)
+        worker = self.worker(batch_size=3)
+
+        self.assertEqual(await worker.run_once(), 3)
+        self.assertEqual(await worker.run_once(), 2)
+        self.assertEqual(await worker.run_once(), 0)
+
+        self.assertEqual(sorted(envelope.rcpt_tos[0] for envelope in self.handler.messages),
+                         [f"user{i}@example.com" for i in range(5)])
+        self.assertIn(b"Hi user0,", self.handler.messages[0].content)
+        self.assertLessEqual(self.pool.connects, 2)
+        self.assertEqual({email.status for email in await self.outbox()}, {"sent"})
+
+    async def test_retries_with_backoff_then_fails(self):
+        await self.enqueue(1)
+        worker = self.worker(pool=SMTPPool("127.0.0.1", free_port()), max_attempts=2, retry_base=60)
+
+        self.assertEqual(await worker.run_once(), 1)
+        [email] = await self.outbox()
+        self.assertEqual((email.status, email.attempts), ("pending", 1))
+        self.assertGreater(email.next_attempt_at, datetime.utcnow() + timedelta(seconds=25))
+        self.assertIsNotNone(email.last_error)
+        self.assertEqual(await worker.run_once(), 0)
+
+        async with self.sessions() as db:
+            email.next_attempt_at = datetime.utcnow()
+            await db.merge(email)
+            await db.commit()
+        self.assertEqual(await worker.run_once(), 1)
+        [email] = await self.outbox()
+        self.assertEqual((email.status, email.attempts), ("failed", 2))
+
+    async def test_permanent_rejection_is_not_retried(self):
+        self.handler.reject = "550 Mailbox unavailable"
+        await self.enqueue(1)
+
+        self.assertEqual(await self.worker().run_once(), 1)
+        [email] = await self.outbox()
+        self.assertEqual(email.status, "failed")
+        self.assertTrue(email.last_error.startswith("550"))
+
+    async def test_unrenderable_email_fails_alone(self):
+        await self.enqueue(2)
+        async with self.sessions() as db:
+            await db.execute(update(OutgoingEmail).where(OutgoingEmail.id == 1)
+                             .values(template_name="missing.html"))
+            await db.commit()
+
+        self.assertEqual(await self.worker().run_once(), 2)
+        self.assertEqual([email.status for email in await self.outbox()], ["failed", "sent"])
+        self.assertEqual(len(self.handler.messages), 1)
+
+    async def test_abandoned_email_fails_after_max_attempts(self):
+        await self.enqueue(1)
+        async with self.sessions() as db:
+            await db.execute(update(OutgoingEmail).values(attempts=3))
+            await db.commit()
+
+        self.assertEqual(await self.worker(max_attempts=3).run_once(), 0)
+        [email] = await self.outbox()
+        self.assertEqual((email.status, email.attempts), ("failed", 3))
+
+    async def test_run_survives_a_failed_batch(self):
+        worker = self.worker(poll_interval=0.01)
+        stop = asyncio.Event()
+        calls = 0
+
+        async def run_once():
+            nonlocal calls
+            calls += 1
+            if calls == 1:
+                raise OSError("database is unreachable")
+            stop.set()
+            return 0
+
+        worker.run_once = run_once
+        with self.assertLogs("mailer", "ERROR"):
+            await worker.run(stop)
+        self.assertEqual(calls, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from profiling import QueryProfiler, statement_shape
+
+
+class TestStatementShape(unittest.TestCase):
+    def test_in_lists_of_any_length_have_one_shape(self):
+        self.assertEqual(statement_shape("SELECT * FROM contacts WHERE id IN (?, ?, ?)"),
+                         statement_shape("SELECT *\n  FROM contacts WHERE id IN (?)"))
+        self.assertEqual(statement_shape("SELECT * FROM contacts WHERE id IN ($1, $2) AND user_id = $3"),
+                         "SELECT * FROM contacts WHERE id IN (?) AND user_id = ?")
+
+
+class TestQueryProfiler(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite://")
+        async with self.engine.begin() as conn:
+            await conn.execute(text("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)"))
+            await conn.execute(text("INSERT INTO items (name) VALUES ('a'), ('b')"))
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+
+    async def test_slow_query_logged_with_plan(self):
+        QueryProfiler(slow_query_ms=0.000001, explain_rate=1.0, repeat_threshold=0).attach(self.engine)
+        with self.assertLogs("profiling", "WARNING") as logs:
+            async with self.engine.connect() as conn:
+                rows = (await conn.execute(text("SELECT name FROM items WHERE id = :id"), {"id": 1})).all()
+        self.assertEqual(rows, [("a",)])
+        self.assertIn("Slow query took", logs.output[0])
+        self.assertIn("SEARCH items USING INTEGER PRIMARY KEY", logs.output[0])
+
+    async def test_repeated_statement_flagged(self):
+        profiler = QueryProfiler(slow_query_ms=0, repeat_threshold=2)
+        profiler.attach(self.engine)
+        profile, token = profiler.begin()
+        with self.assertLogs("profiling", "WARNING") as logs:
+            async with self.engine.connect() as conn:
+                for item_id in (1, 2, 1):
+                    await conn.execute(text("SELECT name FROM items WHERE id = :id"), {"id": item_id})
+                await conn.execute(text("SELECT count(*) FROM items"))
+            profiler.end(token, "GET", "/items/")
+        self.assertEqual(profile.queries, 4)
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn("GET /items/ ran the same statement 3 times", logs.output[0])
+
+    async def test_within_threshold_not_flagged(self):
+        profiler = QueryProfiler(slow_query_ms=0, repeat_threshold=2)
+        profiler.attach(self.engine)
+        _, token = profiler.begin()
+        with self.assertNoLogs("profiling"):
+            async with self.engine.connect() as conn:
+                for item_id in (1, 2):
+                    await conn.execute(text("SELECT name FROM items WHERE id = :id"), {"id": item_id})
+            profiler.end(token, "GET", "/items/")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+
+import fakeredis.aioredis
+from redis.exceptions import ConnectionError
+
+from starlette.requests import Request
+
+from rate_limit import RateLimitRegistry, client_ip, trusted_networks
+
+
+class FailingRedis:
+    def pipeline(self, transaction=True):
+        raise ConnectionError("Redis is down")
+
+
+class TestRateLimiter(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.registry = RateLimitRegistry(sync_interval=0)
+        self.limiter = self.registry.limiter(times=3, seconds=60, name="test")
+
+    def test_local_token_bucket(self):
+        self.assertEqual([self.limiter.hit("a", now=0) for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(self.limiter.hit("a", now=0), 20.0)
+        self.assertEqual(self.limiter.hit("b", now=0), 0)
+        self.assertEqual(self.limiter.hit("a", now=20), 0)
+        self.assertEqual(self.limiter.stats(), {"allowed": 5, "rejected": 1, "keys": 2})
+
+    async def test_workers_share_the_limit_through_redis(self):
+        client = fakeredis.aioredis.FakeRedis()
+        other_registry = RateLimitRegistry(sync_interval=0)
+        other_limiter = other_registry.limiter(times=3, seconds=60, name="test")
+        self.registry.client = other_registry.client = client
+
+        self.assertEqual(self.limiter.hit("a", now=0), 0)
+        self.assertEqual(self.limiter.hit("a", now=0), 0)
+        await self.registry.sync()
+        self.assertEqual(other_limiter.hit("a", now=0), 0)
+        await other_registry.sync()
+        self.assertGreater(other_limiter.hit("a", now=0), 0)
+
+        self.assertEqual(self.limiter.hit("a", now=0), 0)
+        await self.registry.sync()
+        self.assertGreater(self.limiter.hit("a", now=0), 0)
+        self.assertTrue(self.registry.redis_available)
+
+    async def test_falls_back_to_local_limits(self):
+        self.registry.client = FailingRedis()
+        self.assertEqual(self.limiter.hit("a", now=0), 0)
+        await self.registry.sync()
+        stats = self.registry.stats()
+        self.assertEqual((stats["redis_available"], stats["sync_errors"]), (False, 1))
+        self.assertEqual(self.limiter.hit("a", now=0), 0)
+        self.assertEqual(self.limiter.hit("a", now=0), 0)
+        self.assertGreater(self.limiter.hit("a", now=0), 0)
+
+    async def test_flush_pushes_pending_counts(self):
+        client = fakeredis.aioredis.FakeRedis()
+        self.registry.sync_interval = 60
+        self.registry.client = client
+        for _ in range(3):
+            self.assertEqual(self.limiter.hit("a", now=0), 0)
+        await self.registry.flush()
+
+        other_registry = RateLimitRegistry(sync_interval=0)
+        other_limiter = other_registry.limiter(times=3, seconds=60, name="test")
+        other_registry.client = client
+        self.assertEqual(other_limiter.hit("a", now=0), 0)
+        await other_registry.sync()
+        self.assertGreater(other_limiter.hit("a", now=0), 0)
+
+
+def request_from(peer, forwarded=None):
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return Request({"type": "http", "headers": headers, "client": (peer, 50000)})
+
+
+class TestClientIp(unittest.TestCase):
+    def test_forwarded_for_ignored_from_untrusted_peer(self):
+        self.assertEqual(client_ip(request_from("198.51.100.9", "203.0.113.7")), "198.51.100.9")
+        proxies = trusted_networks("10.0.0.0/8")
+        self.assertEqual(client_ip(request_from("198.51.100.9", "203.0.113.7"), proxies), "198.51.100.9")
+
+    def test_right_most_untrusted_hop(self):
+        proxies = trusted_networks("10.0.0.0/8, 127.0.0.1")
+        request = request_from("127.0.0.1", "1.2.3.4, 203.0.113.7, 10.0.0.2")
+        self.assertEqual(client_ip(request, proxies), "203.0.113.7")
+        self.assertEqual(client_ip(request_from("10.0.0.1"), proxies), "10.0.0.1")
+
+
+if __name__ == '__main__':
+    unittest.main()
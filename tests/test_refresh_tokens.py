@@ -0,0 +1,58 @@
+import unittest
+
+from cache import LocalCacheBackend
+from jwt_keys import key_ring
+from refresh_tokens import RefreshTokenError, RefreshTokenReused, RefreshTokenStore
+
+
+class TestRefreshTokenStore(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.store = RefreshTokenStore(LocalCacheBackend(), ttl_minutes=60)
+
+    async def test_rotation(self):
+        token = await self.store.issue("test@example.com")
+        claims = key_ring.decode(token)
+        self.assertEqual((claims["sub"], claims["type"], claims["gen"]), ("test@example.com", "refresh", 0))
+
+        subject, new_token = await self.store.rotate(token)
+        self.assertEqual(subject, "test@example.com")
+        self.assertNotEqual(key_ring.decode(new_token)["jti"], claims["jti"])
+        self.assertEqual((await self.store.rotate(new_token))[0], "test@example.com")
+
+    async def test_reuse_revokes_every_token_of_the_user(self):
+        token = await self.store.issue("test@example.com")
+        other_device = await self.store.issue("test@example.com")
+        other_user = await self.store.issue("other@example.com")
+        _, rotated = await self.store.rotate(token)
+
+        with self.assertRaises(RefreshTokenReused):
+            await self.store.rotate(token)
+        for revoked in (rotated, other_device):
+            with self.assertRaises(RefreshTokenError):
+                await self.store.rotate(revoked)
+        await self.store.rotate(other_user)
+
+    async def test_revoke(self):
+        token = await self.store.issue("test@example.com")
+        other = await self.store.issue("test@example.com")
+        await self.store.revoke(token)
+        with self.assertRaises(RefreshTokenError):
+            await self.store.rotate(token)
+        await self.store.rotate(other)
+
+    async def test_revoke_all(self):
+        token = await self.store.issue("test@example.com")
+        await self.store.revoke_all("test@example.com")
+        with self.assertRaises(RefreshTokenError):
+            await self.store.rotate(token)
+        await self.store.rotate(await self.store.issue("test@example.com"))
+
+    async def test_rejects_access_tokens(self):
+        with self.assertRaises(RefreshTokenError):
+            await self.store.rotate(key_ring.encode({"sub": "test@example.com", "jti": "x"}))
+        with self.assertRaises(RefreshTokenError):
+            await self.store.rotate("not-a-token")
+
+
+if __name__ == '__main__':
+    unittest.main()
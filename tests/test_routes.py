@@ -1,8 +1,45 @@
+import asyncio
+import csv
+import io
 import json
+from datetime import date, timedelta
 from fastapi.testclient import TestClient
-from main import app
+from auth import create_access_token, create_email_token
+from cache import RedisStoreBackend
+from config import get_settings
+from database import Base, SessionLocal, engine
+from main import create_app
+from models import Contact, OutgoingEmail, User
+from profiling import query_profiler
+from refresh_tokens import refresh_tokens
+from redis.exceptions import ConnectionError as RedisConnectionError
+from sqlalchemy import event, select
 
-client = TestClient(app)
+
+async def create_schema():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    await engine.dispose()
+
+
+async def create_user(username, email):
+    async with SessionLocal() as db:
+        user = User(username=username, email=email, hashed_password="-", confirmed=True)
+        db.add(user)
+        await db.commit()
+        user_id = user.id
+    await engine.dispose()
+    return user_id
+
+
+def auth_headers(email):
+    return {"Authorization": f"Bearer {create_access_token({'sub': email})}"}
+
+
+asyncio.run(create_schema())
+owner_id = asyncio.run(create_user("owner", "owner@example.com"))
+client = TestClient(create_app())
+client.headers.update(auth_headers("owner@example.com"))
 
 def test_register_user():
     # Тест на успішну реєстрацію користувача
@@ -15,8 +52,407 @@ def test_register_user():
     assert response.status_code == 201
     assert response.json()["username"] == user_data["username"]
     assert response.json()["email"] == user_data["email"]
+    assert asyncio.run(queued_recipients()).count(user_data["email"]) == 1
 
     # Тест на спробу реєстрації користувача з вже існуючим email
     response = client.post("/register/", json=user_data)
     assert response.status_code == 409
     assert "User already registered" in response.text
+
+
+def test_refresh_token_rotation():
+    refresh_token = asyncio.run(refresh_tokens.issue("refresh@example.com"))
+
+    response = client.post("/refresh-token/", params={"refresh_token": refresh_token})
+    assert response.status_code == 200
+    rotated = response.json()["refresh_token"]
+    assert rotated and rotated != refresh_token
+
+    response = client.post("/refresh-token/", params={"refresh_token": refresh_token})
+    assert response.status_code == 401
+    response = client.post("/refresh-token/", params={"refresh_token": rotated})
+    assert response.status_code == 401
+
+
+def test_tokens_are_not_interchangeable():
+    email_token = create_email_token({"sub": "owner@example.com"})
+    assert client.get("/protected/", headers={"Authorization": f"Bearer {email_token}"}).status_code == 401
+    access_token = create_access_token({"sub": "owner@example.com"})
+    assert client.get(f"/confirmed_email/{access_token}").status_code == 422
+    assert client.get(f"/confirmed_email/{email_token}").status_code == 200
+
+
+class UnreachableRedis:
+    def __getattr__(self, name):
+        async def fail(*args, **kwargs):
+            raise RedisConnectionError("Redis is down")
+        return fail
+
+
+def test_token_store_outage_fails_closed():
+    refresh_token = asyncio.run(refresh_tokens.issue("outage@example.com"))
+    backend = refresh_tokens.backend
+    refresh_tokens.backend = RedisStoreBackend(UnreachableRedis())
+    try:
+        assert client.post("/logout/", params={"refresh_token": refresh_token}).status_code == 503
+        assert client.post("/logout-all/").status_code == 503
+        assert client.post("/refresh-token/", params={"refresh_token": refresh_token}).status_code == 503
+    finally:
+        refresh_tokens.backend = backend
+
+
+async def queued_recipients():
+    async with SessionLocal() as db:
+        recipients = (await db.scalars(select(OutgoingEmail.recipient))).all()
+    await engine.dispose()
+    return recipients
+
+
+async def seed_contacts(contacts, user_id=None):
+    async with SessionLocal() as db:
+        db.add_all([Contact(user_id=user_id or owner_id, **contact) for contact in contacts])
+        await db.commit()
+    await engine.dispose()
+
+
+def test_read_contacts_keyset_pagination():
+    asyncio.run(seed_contacts([
+        {"first_name": "Keyset", "last_name": last_name, "email": f"keyset{i}@example.com",
+         "phone_number": "123", "birth_date": date(1990, 1, i + 1)}
+        for i, last_name in enumerate(["Cole", "Drake", "Adams", "Cole", "Brown"])
+    ]))
+    expected = [contact["id"] for contact in client.get("/contacts/", params={"sort": "last_name", "limit": 1000}).json()]
+
+    seen = []
+    response = client.get("/contacts/", params={"sort": "last_name", "limit": 2})
+    while True:
+        assert response.status_code == 200
+        seen.extend(contact["id"] for contact in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        response = client.get("/contacts/", params={"cursor": cursor, "limit": 2})
+
+    assert seen == expected
+
+    response = client.get("/contacts/", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+
+def test_search_contacts_matches_every_term():
+    asyncio.run(seed_contacts([
+        {"first_name": "Searchable", "last_name": "Okafor", "email": "s.okafor@example.com",
+         "phone_number": "123", "birth_date": date(1985, 5, 5)},
+        {"first_name": "Okaforina", "last_name": "Searchable", "email": "okaforina@example.com",
+         "phone_number": "123", "birth_date": date(1985, 5, 6)},
+        {"first_name": "Searchable", "last_name": "Other_100%", "email": "other@example.com",
+         "phone_number": "123", "birth_date": date(1985, 5, 7)},
+    ]))
+
+    response = client.get("/contacts/search/", params={"query": "SEARCHABLE okafor"})
+    assert response.status_code == 200
+    assert [contact["last_name"] for contact in response.json()] == ["Okafor", "Searchable"]
+
+    response = client.get("/contacts/search/", params={"query": "searchable", "limit": 1, "skip": 2})
+    assert len(response.json()) == 1
+
+    response = client.get("/contacts/search/", params={"query": "_100%"})
+    assert [contact["last_name"] for contact in response.json()] == ["Other_100%"]
+
+
+def test_upcoming_birthdays_soonest_first():
+    today = date.today()
+    asyncio.run(seed_contacts([
+        {"first_name": "Birthday", "last_name": "Soon", "email": "birthday.soon@example.com",
+         "phone_number": "123", "birth_date": birth_date_in(today, 1)},
+        {"first_name": "Birthday", "last_name": "Later", "email": "birthday.later@example.com",
+         "phone_number": "123", "birth_date": birth_date_in(today, 3)},
+    ]))
+
+    response = client.get("/contacts/birthdays/", params={"days": 3})
+    assert response.status_code == 200
+    names = [contact["last_name"] for contact in response.json() if contact["first_name"] == "Birthday"]
+    assert names == ["Soon", "Later"]
+
+    response = client.post("/contacts/", json={
+        "first_name": "Birthday", "last_name": "Today", "email": "birthday.today@example.com",
+        "phone_number": "123", "birth_date": birth_date_in(today, 0).isoformat()})
+    assert response.status_code == 200
+    response = client.get("/contacts/birthdays/", params={"days": 3})
+    names = [contact["last_name"] for contact in response.json() if contact["first_name"] == "Birthday"]
+    assert names == ["Today", "Soon", "Later"]
+
+
+def birth_date_in(today, days):
+    day = today + timedelta(days=days)
+    return date(2000, day.month, day.day)
+
+
+def test_import_contacts_csv_reports_row_errors():
+    body = (
+        "first_name,last_name,email,phone_number,birth_date,extra_data\n"
+        "Import,One,import.one@example.com,111,1990-01-01,\n"
+        "Import,Bad,import.bad@example.com,111,not-a-date,\n"
+        "Import,\"Two, Jr.\",import.two@example.com,222,1991-02-02,\"multi\nline\"\n"
+        "Import,Again,import.one@example.com,333,1992-03-03,\n"
+    )
+    response = client.post("/contacts/import", content=body.encode(), headers={"Content-Type": "text/csv"})
+    assert response.status_code == 200
+    report = response.json()
+    assert (report["inserted"], report["skipped"], report["failed"]) == (2, 1, 1)
+    assert [error["row"] for error in report["errors"]] == [2, 4]
+
+    response = client.get("/contacts/search/", params={"query": "import.two"})
+    assert response.json()[0]["last_name"] == "Two, Jr."
+    assert response.json()[0]["extra_data"] == "multi\nline"
+
+
+def test_import_contacts_ndjson():
+    body = "\n".join(json.dumps(row) for row in [
+        {"first_name": "Nd", "last_name": "Json", "email": "nd.json@example.com",
+         "phone_number": "1", "birth_date": "1990-01-01"},
+        {"first_name": "Nd"},
+    ]) + "\n[1, 2]\n"
+    response = client.post("/contacts/import", params={"format": "ndjson"}, content=body.encode())
+    report = response.json()
+    assert (report["inserted"], report["skipped"], report["failed"]) == (1, 0, 2)
+
+
+def test_import_rejects_overlong_line(monkeypatch):
+    def listed_emails():
+        return {contact["email"] for contact in client.get("/contacts/", params={"limit": 1000}).json()}
+
+    assert "partial.import@example.com" not in listed_emails()
+    monkeypatch.setattr(get_settings(), "import_max_line_length", 100)
+    monkeypatch.setattr(get_settings(), "import_batch_size", 1)
+    body = (b"first_name,last_name,email,phone_number,birth_date\n"
+            b"Partial,Import,partial.import@example.com,1,1990-01-01\n" + b"x" * 1000)
+    response = client.post("/contacts/import", content=body, headers={"Content-Type": "text/csv"})
+    assert response.status_code == 413
+    assert "partial.import@example.com" in listed_emails()
+    monkeypatch.undo()
+
+    body = ("\n".join(json.dumps({"first_name": "Chunk", "last_name": str(i), "email": f"chunk{i}@example.com",
+                                  "phone_number": "1", "birth_date": "1990-01-01"}) for i in range(50))).encode()
+    response = client.post("/contacts/import", params={"format": "ndjson"},
+                           content=(body[i:i + 7] for i in range(0, len(body), 7)))
+    assert response.json()["inserted"] == 50
+
+
+def test_import_rejects_non_utf8_upload():
+    body = "first_name,last_name,email,phone_number,birth_date\nJos\u00e9,Latin,jose@example.com,1,1990-01-01\n"
+    response = client.post("/contacts/import", content=body.encode("latin-1"), headers={"Content-Type": "text/csv"})
+    assert response.status_code == 400
+    assert "UTF-8" in response.json()["detail"]
+
+
+def test_export_contacts_streams_every_contact():
+    asyncio.run(seed_contacts([
+        {"first_name": "Export", "last_name": "Me", "email": "export.me@example.com",
+         "phone_number": "1", "birth_date": date(1970, 7, 7), "extra_data": "a,b"},
+    ]))
+
+    response = client.get("/contacts/export", params={"format": "csv"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    records = list(csv.reader(io.StringIO(response.text)))
+    assert records[0] == ["id", "first_name", "last_name", "email", "phone_number", "birth_date", "extra_data"]
+    assert any(record[1:] == ["Export", "Me", "export.me@example.com", "1", "1970-07-07", "a,b"]
+               for record in records)
+
+    response = client.get("/contacts/export", params={"format": "ndjson"})
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert len(rows) == len(records) - 1
+    assert {"first_name": "Export", "birth_date": "1970-07-07"}.items() <= next(
+        row for row in rows if row["email"] == "export.me@example.com").items()
+
+
+def test_bulk_update_and_delete_contacts():
+    asyncio.run(seed_contacts([
+        {"first_name": "Bulk", "last_name": f"Row{i}", "email": f"bulk{i}@example.com",
+         "phone_number": "1", "birth_date": date(1960, 1, 1)}
+        for i in range(3)
+    ]))
+    ids = [contact["id"] for contact in client.get("/contacts/search/", params={"query": "bulk"}).json()]
+    assert len(ids) == 3
+
+    response = client.request("PATCH", "/contacts/bulk",
+                              json={"filter": {"first_name": "Bulk"}, "values": {"phone_number": "999"}})
+    assert response.json() == {"count": 3, "ids": sorted(ids)}
+    assert client.get(f"/contacts/{ids[0]}").json()["phone_number"] == "999"
+
+    response = client.request("PATCH", "/contacts/bulk", json={"filter": {"first_name": None}, "values": {}})
+    assert response.status_code == 422
+
+    response = client.request("PATCH", "/contacts/bulk",
+                              json={"ids": ids, "values": {"email": "bulk.same@example.com"}})
+    assert response.status_code == 409
+    assert {client.get(f"/contacts/{i}").json()["email"] for i in ids} == {f"bulk{i}@example.com" for i in range(3)}
+
+    response = client.request("DELETE", "/contacts/bulk", json={"filter": {"first_name": "Bulk", "phone": "1"}})
+    assert response.status_code == 422
+    response = client.request("DELETE", "/contacts/bulk", json={"ids": ids, "dry_run": True})
+    assert response.status_code == 422
+
+    response = client.request("DELETE", "/contacts/bulk", json={"ids": ids[:2] + [10 ** 9]})
+    assert response.json() == {"count": 2, "ids": sorted(ids[:2])}
+    assert client.get(f"/contacts/{ids[0]}").status_code == 404
+
+
+def test_update_and_delete_contact():
+    asyncio.run(seed_contacts([
+        {"first_name": "Single", "last_name": "Update", "email": "single.update@example.com",
+         "phone_number": "1", "birth_date": date(1960, 1, 1)},
+    ]))
+    contact = client.get("/contacts/search/", params={"query": "single.update"}).json()[0]
+
+    response = client.put(f"/contacts/{contact['id']}", json={**contact, "last_name": "Updated"})
+    assert response.status_code == 200
+    assert response.json()["last_name"] == "Updated"
+
+    assert client.delete(f"/contacts/{contact['id']}").json()["last_name"] == "Updated"
+    assert client.put(f"/contacts/{contact['id']}", json=contact).status_code == 404
+    assert client.delete(f"/contacts/{contact['id']}").status_code == 404
+
+
+def test_conditional_requests():
+    asyncio.run(seed_contacts([
+        {"first_name": "Etag", "last_name": "Original", "email": "etag@example.com",
+         "phone_number": "1", "birth_date": date(1970, 1, 1)},
+    ]))
+    contact = client.get("/contacts/search/", params={"query": "etag@example.com"}).json()[0]
+    url = f"/contacts/{contact['id']}"
+
+    response = client.get(url)
+    etag = response.headers["ETag"]
+    assert etag == f'"{contact["id"]}-1"'
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    list_etag = client.get("/contacts/", params={"limit": 1000}).headers["ETag"]
+    assert client.get("/contacts/", params={"limit": 1000}, headers={"If-None-Match": list_etag}).status_code == 304
+
+    response = client.put(url, json={**contact, "last_name": "Changed"}, headers={"If-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] == f'"{contact["id"]}-2"'
+    response = client.put(url, json={**contact, "last_name": "Lost update"}, headers={"If-Match": etag})
+    assert response.status_code == 412
+
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 200
+    assert client.get("/contacts/", params={"limit": 1000}, headers={"If-None-Match": list_etag}).status_code == 200
+    assert client.delete(url, headers={"If-Match": etag}).status_code == 412
+    assert client.delete(url, headers={"If-Match": f'"{contact["id"]}-2"'}).status_code == 200
+
+
+def test_patch_contact_writes_only_given_columns():
+    asyncio.run(seed_contacts([
+        {"first_name": "Patch", "last_name": "Before", "email": "patch@example.com",
+         "phone_number": "1", "birth_date": date(1970, 1, 1), "extra_data": "keep"},
+    ]))
+    contact = client.get("/contacts/search/", params={"query": "patch@example.com"}).json()[0]
+
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(engine.sync_engine, "before_cursor_execute", record)
+    try:
+        response = client.patch(f"/contacts/{contact['id']}", json={"last_name": "After", "extra_data": None})
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", record)
+
+    assert response.status_code == 200
+    assert response.json() == {**contact, "last_name": "After", "extra_data": None}
+    assert response.headers["ETag"] == f'"{contact["id"]}-2"'
+    [update] = [statement for statement in statements if statement.startswith("UPDATE")]
+    assert "last_name" in update and "extra_data" in update
+    assert "first_name" not in update.split("RETURNING")[0]
+    assert len(statements) == 1
+
+    assert client.patch(f"/contacts/{contact['id']}", json={"first_name": None}).status_code == 422
+    assert client.patch("/contacts/1000000000", json={"last_name": "Missing"}).status_code == 404
+
+
+def test_contacts_are_scoped_to_their_owner():
+    other_id = asyncio.run(create_user("other", "other.owner@example.com"))
+    other = auth_headers("other.owner@example.com")
+    asyncio.run(seed_contacts([
+        {"first_name": "Private", "last_name": "Mine", "email": "shared@example.com",
+         "phone_number": "123", "birth_date": date(1990, 3, 3)},
+    ]))
+    asyncio.run(seed_contacts([
+        {"first_name": "Private", "last_name": "Theirs", "email": "shared@example.com",
+         "phone_number": "123", "birth_date": date(1990, 3, 3)},
+    ], user_id=other_id))
+    mine = client.get("/contacts/search/", params={"query": "private"}).json()
+    theirs = client.get("/contacts/search/", params={"query": "private"}, headers=other).json()
+    assert [contact["last_name"] for contact in mine] == ["Mine"]
+    assert [contact["last_name"] for contact in theirs] == ["Theirs"]
+
+    contact_id = mine[0]["id"]
+    assert client.get(f"/contacts/{contact_id}", headers=other).status_code == 404
+    assert client.patch(f"/contacts/{contact_id}", headers=other, json={"phone_number": "999"}).status_code == 404
+    assert client.delete(f"/contacts/{contact_id}", headers=other).status_code == 404
+    assert contact_id not in [contact["id"] for contact in
+                              client.get("/contacts/", params={"limit": 1000}, headers=other).json()]
+    assert client.get(f"/contacts/{contact_id}").json()["phone_number"] == "123"
+
+    assert client.get("/contacts/", headers={"Authorization": ""}).status_code == 401
+
+
+def test_create_contact_rate_limit():
+    asyncio.run(create_user("limited", "limited@example.com"))
+    headers = auth_headers("limited@example.com")
+    for i in range(10):
+        response = client.post("/contacts/", headers=headers, json={
+            "first_name": "Limited", "last_name": str(i), "email": f"limited{i}@example.com",
+            "phone_number": "123", "birth_date": "1990-01-01"})
+        assert response.status_code == 200
+
+    response = client.post("/contacts/", headers=headers, json={
+        "first_name": "Limited", "last_name": "X", "email": "limited.x@example.com",
+        "phone_number": "123", "birth_date": "1990-01-01"})
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
+
+
+def test_stats_endpoints_are_disabled_by_default():
+    for path in ("/metrics", "/pool-stats/", "/cache-stats/", "/rate-limit-stats/"):
+        assert client.get(path).status_code == 404
+
+
+def test_metrics_report_route_latency_and_queries(monkeypatch):
+    monkeypatch.setattr(get_settings(), "stats_endpoints", True)
+    asyncio.run(seed_contacts([
+        {"first_name": "Metric", "last_name": "Sample", "email": "metric.sample@example.com",
+         "phone_number": "123", "birth_date": date(1990, 4, 4)},
+    ]))
+    contact_id = client.get("/contacts/search/", params={"query": "metric sample"}).json()[0]["id"]
+    client.get(f"/contacts/{contact_id}")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'http_request_duration_seconds_count{method="GET",route="/contacts/search/",status="200"}' in body
+    assert 'http_request_db_queries_count{route="/contacts/{contact_id}"}' in body
+    queries = next(line for line in body.splitlines()
+                   if line.startswith('http_request_db_queries_sum{route="/contacts/search/"}'))
+    assert float(queries.split()[-1]) >= 1
+    assert 'email_outbox_emails{status="pending"}' in body
+    assert 'rate_limit_requests_total{limit="create_contact",result="allowed"}' in body
+
+
+def test_profile_queries_header():
+    response = client.get("/contacts/search/", params={"query": "anything"}, headers={"X-Profile-Queries": "1"})
+    assert "X-DB-Queries" not in response.headers
+
+    query_profiler.header_enabled = True
+    try:
+        response = client.get("/contacts/search/", params={"query": "anything"},
+                              headers={"X-Profile-Queries": "1"})
+    finally:
+        query_profiler.header_enabled = False
+    assert response.status_code == 200
+    assert int(response.headers["X-DB-Queries"]) >= 1
+    assert float(response.headers["X-DB-Time-Ms"]) > 0
@@ -0,0 +1,31 @@
+import unittest
+from datetime import date
+
+import schemas
+from models import Contact
+from serializers import dump_contact, dump_contacts
+
+
+class TestSerializers(unittest.TestCase):
+    def setUp(self):
+        self.contacts = [
+            Contact(id=1, first_name="Ann", last_name="Lee", email="ann@example.com", phone_number="123",
+                    birth_date=date(1990, 2, 3), extra_data=None),
+            Contact(id=2, first_name="Bo \"B\"", last_name="Ørsted", email="bo@example.com", phone_number="456",
+                    birth_date=date(1985, 12, 31), extra_data="line\nbreak"),
+        ]
+
+    def test_matches_pydantic_output(self):
+        for contact in self.contacts:
+            self.assertEqual(dump_contact(contact).decode(),
+                             schemas.Contact.model_validate(contact).model_dump_json())
+        self.assertEqual(dump_contacts(self.contacts),
+                         schemas.ContactList.dump_json(schemas.ContactList.validate_python(self.contacts)))
+
+    def test_accepts_models(self):
+        model = schemas.Contact.model_validate(self.contacts[0])
+        self.assertEqual(dump_contact(model), dump_contact(self.contacts[0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
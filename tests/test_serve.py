@@ -0,0 +1,41 @@
+import unittest
+
+from config import get_settings
+from serve import AppWorker, gunicorn_options, worker_settings
+
+
+class TestWorkerSettings(unittest.TestCase):
+    def setUp(self):
+        self.config = get_settings().model_copy(update={"db_pool_size": 5, "db_max_overflow": 10,
+                                                        "hashing_workers": 8})
+
+    def test_connection_budget_is_divided(self):
+        config = worker_settings(self.config.model_copy(update={"db_max_connections": 40}), 4)
+        self.assertEqual((config.db_pool_size, config.db_max_overflow), (5, 5))
+        config = worker_settings(self.config.model_copy(update={"db_max_connections": 12}), 4)
+        self.assertEqual((config.db_pool_size, config.db_max_overflow), (3, 0))
+        self.assertEqual(config.hashing_workers, 2)
+
+    def test_single_process_pool_divided_by_default(self):
+        config = worker_settings(self.config, 1)
+        self.assertEqual((config.db_pool_size, config.db_max_overflow), (5, 10))
+        config = worker_settings(self.config, 4)
+        self.assertEqual((config.db_pool_size, config.db_max_overflow), (3, 0))
+        config = worker_settings(self.config, 16)
+        self.assertEqual((config.db_pool_size, config.db_max_overflow), (1, 0))
+        self.assertEqual(config.hashing_workers, 1)
+
+    def test_budget_below_one_connection_per_worker(self):
+        with self.assertRaises(ValueError):
+            worker_settings(self.config.model_copy(update={"db_max_connections": 3}), 4)
+
+    def test_gunicorn_options(self):
+        options = gunicorn_options(self.config, 4)
+        self.assertEqual(options["workers"], 4)
+        self.assertIs(options["worker_class"], AppWorker)
+        self.assertTrue(options["preload_app"])
+        self.assertEqual(options["worker_connections"], self.config.server_max_concurrency)
+
+
+if __name__ == '__main__':
+    unittest.main()